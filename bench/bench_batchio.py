@@ -0,0 +1,110 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Benchmark: OPTIONS datagrams answered per second by the UDP Sip connection
+# when draining one datagram per read event versus a batch of datagrams
+#
+################################################################################
+
+import os
+import sys
+import time
+import socket
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	".."))
+
+import connection
+import sip
+from config import g_config
+
+g_sipconfig = g_config['modules']['python']['sip']
+
+ROUNDS = 50
+BURST = 256
+
+def request(i):
+	return ("OPTIONS sip:100@localhost SIP/2.0\r\n"
+		"Via: SIP/2.0/UDP 127.0.0.1:5061\r\n"
+		"From: <sip:bench@127.0.0.1>;tag=1\r\n"
+		"To: <sip:100@localhost>\r\n"
+		"Call-ID: bench{}\r\n"
+		"CSeq: 1 OPTIONS\r\n\r\n".format(i)).encode('utf-8')
+
+def run(batchSize):
+	"""Sends ROUNDS bursts of BURST unique requests and runs the event loop
+	until all of them are answered. Returns requests per second."""
+	g_sipconfig['recv_batch_size'] = batchSize
+
+	# All requests come from one source
+	g_sipconfig['ratelimit_rate'] = 0
+	loop = connection.getLoop()
+
+	s = sip.Sip()
+	s.bind(('127.0.0.1', 0))
+	address = s.socket.getsockname()
+
+	c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	c.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+	c.setblocking(False)
+	s.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+
+	state = {'answered': 0, 'expected': 0}
+
+	def drain():
+		while True:
+			try:
+				c.recv(4096)
+			except BlockingIOError:
+				break
+			state['answered'] += 1
+		if state['answered'] >= state['expected']:
+			loop.stop()
+
+	loop.add_reader(c.fileno(), drain)
+
+	requests = [request(i) for i in range(ROUNDS * BURST)]
+	start = time.perf_counter()
+	for r in range(ROUNDS):
+		for msg in requests[r * BURST:(r + 1) * BURST]:
+			c.sendto(msg, address)
+		state['expected'] += BURST
+		loop.run_forever()
+	elapsed = time.perf_counter() - start
+
+	loop.remove_reader(c.fileno())
+	c.close()
+	s.close()
+	return ROUNDS * BURST / elapsed
+
+if __name__ == '__main__':
+	logging.getLogger("sip").setLevel(logging.WARNING)
+	logging.getLogger("connection").setLevel(logging.WARNING)
+
+	baseline = run(1)
+	print("{:<12} {:>12}".format("batch size", "requests/s"))
+	print("{:<12} {:>12.0f}".format(1, baseline))
+	for batchSize in (16, 64):
+		rate = run(batchSize)
+		print("{:<12} {:>12.0f} {:>7.2f}x".format(batchSize, rate,
+			rate / baseline))
@@ -0,0 +1,70 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Benchmark: loading credentials files of 1k to 1M accounts (HA1 computed on
+# load), and the time of a digest check with a wrong password, which must not
+# depend on the number of accounts.
+#
+################################################################################
+
+import os
+import sys
+import time
+import timeit
+import shutil
+import hashlib
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	".."))
+
+import digest
+import credentials
+
+if __name__ == '__main__':
+	counts = [int(c) for c in sys.argv[1:]] or [1000, 100000, 1000000]
+	directory = tempfile.mkdtemp()
+	try:
+		print("{:>10} {:>10} {:>14}".format("accounts", "load s",
+			"us/check"))
+		for count in counts:
+			path = os.path.join(directory, "accounts")
+			with open(path, "w") as f:
+				for i in range(count):
+					f.write("{}::pw{}\n".format(1000 + i, i))
+
+			start = time.perf_counter()
+			store = credentials.CredentialStore("pbx", path)
+			load = time.perf_counter() - start
+			store.close()
+
+			auth = digest.DigestAuth(digest.NonceFactory(b"key"), store)
+			params = {'username': str(1000 + count // 2), 'realm': 'pbx',
+				'nonce': auth.nonces.issue('10.0.0.1'), 'uri': 'sip:pbx',
+				'response': hashlib.md5(b"guess").hexdigest()}
+			n = 100000
+			seconds = min(timeit.repeat(lambda: auth.verify("INVITE", params,
+				'10.0.0.1'), number=n, repeat=3))
+			print("{:>10} {:>10.2f} {:>14.2f}".format(count, load,
+				seconds / n * 1e6))
+	finally:
+		shutil.rmtree(directory)
@@ -0,0 +1,81 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Benchmark: cost of checking a digest response with the cached HA1/HA2
+# values, compared to computing HA1, HA2 and the response for every request.
+# Both sides validate the nonce of a correct response, so the rows differ only
+# in the hashing.
+#
+################################################################################
+
+import os
+import sys
+import hmac
+import timeit
+import hashlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	".."))
+
+import credentials
+import digest
+
+def md5(s):
+	return hashlib.md5(s.encode('utf-8')).hexdigest()
+
+def uncached(nonces, params, address):
+	"""The same check as DigestAuth.verify computing HA1 and HA2 for every
+	request"""
+	ha1 = md5("{}:{}:{}".format(params['username'], params['realm'],
+		"F2DS13G5"))
+	ha2 = md5("INVITE:{}".format(params['uri']))
+	expected = md5("{}:{}:{}".format(ha1, params['nonce'], ha2))
+	if not hmac.compare_digest(expected.encode(),
+			params['response'].encode('utf-8')):
+		return digest.UNAUTHORIZED
+	return nonces.check(params['nonce'], address)
+
+if __name__ == '__main__':
+	accounts = credentials.CredentialStore("100@localhost")
+	accounts.add("100", "100@localhost", "F2DS13G5")
+	auth = digest.DigestAuth(digest.NonceFactory(os.urandom(32)), accounts)
+	params = {'username': '100', 'realm': '100@localhost',
+		'nonce': auth.nonces.issue('10.0.0.1'), 'uri': 'sip:100@localhost',
+		'response': md5("guess")}
+	ha1 = md5("100:100@localhost:F2DS13G5")
+	ha2 = md5("INVITE:sip:100@localhost")
+	correct = dict(params, response=md5("{}:{}:{}".format(ha1,
+		params['nonce'], ha2)))
+
+	assert uncached(auth.nonces, correct, '10.0.0.1') == digest.AUTHORIZED
+
+	n = 200000
+	print("{:<16} {:>14} {:>14}".format("", "uncached us", "cached us"))
+	for name, p in (("wrong password", params), ("right password", correct)):
+		times = [min(timeit.repeat(f, number=n, repeat=3)) / n * 1e6
+			for f in (lambda: uncached(auth.nonces, p, '10.0.0.1'),
+				lambda: auth.verify("INVITE", p, '10.0.0.1',
+					'sip:100@localhost'))]
+		print("{:<16} {:14.2f} {:14.2f}".format(name, *times))
+	seconds = min(timeit.repeat(lambda: auth.nonces.check(params['nonce'],
+		'10.0.0.1'), number=n, repeat=3))
+	print("{:<16} {:14.2f}".format("nonce check", seconds / n * 1e6))
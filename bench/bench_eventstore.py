@@ -0,0 +1,88 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Benchmark: ingest rate of the event store (INVITE events with the raw
+# message, as stored by sip.py) and the cost of EventStore.add on the event
+# loop thread, then the time of typical queries on the resulting database.
+#
+################################################################################
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	".."))
+
+from eventstore import EventStore, openDatabase, query
+
+MESSAGE = b"INVITE sip:100@honeypot SIP/2.0\r\n" \
+	b"Via: SIP/2.0/UDP 10.0.0.1:5060;branch=z9hG4bK1\r\n" \
+	b"From: <sip:100@10.0.0.1>;tag=abc\r\nTo: <sip:100@honeypot>\r\n" \
+	b"Call-ID: abc@1\r\nCSeq: 1 INVITE\r\nContact: <sip:100@10.0.0.1>\r\n" \
+	b"User-Agent: friendly-scanner\r\nMax-Forwards: 70\r\n" \
+	b"Content-Type: application/sdp\r\nAccept: application/sdp\r\n\r\n" \
+	b"v=0\r\no=- 1 1 IN IP4 10.0.0.1\r\ns=-\r\nc=IN IP4 10.0.0.1\r\n" \
+	b"t=0 0\r\nm=audio 5000 RTP/AVP 0\r\n"
+
+def timed(f, repeat=20):
+	best = None
+	for i in range(repeat):
+		start = time.perf_counter()
+		rows = f()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best, len(rows)
+
+if __name__ == '__main__':
+	directory = tempfile.mkdtemp()
+	path = os.path.join(directory, "events.db")
+	n = 500000
+	events = [("10.{}.{}.{}".format(i >> 16 & 255, i >> 8 & 255, i & 255),
+		"{}@scanner".format(i * 7919), "ua {}".format(i % 50))
+		for i in range(n)]
+
+	store = EventStore(path, maxPending=n)
+	start = time.perf_counter()
+	for source, callId, userAgent in events:
+		store.add("INVITE", source, 5060, callId, userAgent, MESSAGE)
+	added = time.perf_counter()
+	store.close()
+	end = time.perf_counter()
+	print("add        {:8.2f} us/event".format((added - start) / n * 1e6))
+	print("ingest     {:8.0f} events/s ({} dropped)".format(n / (end - start),
+		store.dropped))
+	print("database   {:8.1f} MB".format(os.path.getsize(path) / 1e6))
+
+	db = openDatabase(path)
+	since = time.time() - 3600
+	for name, f in (("source", lambda: query(db, source="10.3.2.1")),
+			("call id", lambda: query(db, callId="7919@scanner")),
+			("user agent", lambda: query(db, userAgent="ua 7", since=since,
+				limit=100)),
+			("last hour", lambda: query(db, since=since, limit=100))):
+		seconds, rows = timed(f)
+		print("{:<10} {:8.3f} ms ({} rows)".format(name, seconds * 1e3, rows))
+	db.close()
+	shutil.rmtree(directory)
@@ -0,0 +1,90 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Benchmark: G.711 decoding and encoding throughput (table lookups with NumPy
+# against a loop over the samples), and the batch export of a directory of
+# stream dumps to WAV with one process and with one process per core.
+#
+################################################################################
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	".."))
+
+import g711
+import wavexport
+from bench_rtpanalysis import writeDump
+
+def throughput(function, data, repeat=3):
+	"""Best of repeat runs in bytes of data per second"""
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		function(data)
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return len(data) / best
+
+def decodeLoop(data):
+	table = g711.ULAW_DECODE.tolist()
+	return [table[c] for c in data]
+
+if __name__ == '__main__':
+	dumps = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+	packets = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+
+	codes = np.random.default_rng(1).integers(0, 256, 8000 * 600,
+		dtype=np.uint8).tobytes()
+	samples = g711.decode(codes)
+	print("decode, table lookup:   {:8.1f} MB/s".format(
+		throughput(g711.decode, codes) / 1e6))
+	print("decode, loop:           {:8.1f} MB/s".format(
+		throughput(decodeLoop, codes[:800000], 1) / 1e6))
+	print("encode, table lookup:   {:8.1f} MB/s (of codes)".format(
+		throughput(g711.encode, samples) / 1e6))
+
+	directory = tempfile.mkdtemp()
+	try:
+		size = 0
+		for i in range(dumps):
+			size += writeDump(os.path.join(directory,
+				"stream_{}.pcap".format(i)), packets)
+		output = os.path.join(directory, "wav")
+		os.mkdir(output)
+
+		for processes in sorted({1, multiprocessing.cpu_count()}):
+			start = time.perf_counter()
+			paths = wavexport.exportDirectory(directory, output, processes)
+			elapsed = time.perf_counter() - start
+			print("export {} dumps ({:.0f} MB) to {} WAV files, {} "
+				"processes: {:.2f}s ({:.0f} MB/s)".format(dumps, size / 1e6,
+				len(paths), processes, elapsed, size / 1e6 / elapsed))
+	finally:
+		shutil.rmtree(directory)
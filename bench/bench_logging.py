@@ -0,0 +1,104 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Benchmark: logging cost per INVITE (the request line and twelve headers
+# logged at INFO) on the event loop thread. Before: the message is formatted
+# eagerly and written by a StreamHandler in the loop thread. After: the
+# record is queued with its arguments and a writer thread formats and
+# writes it, or the level excludes it. The last case floods a single call
+# site that is rate limited. Output goes to /dev/null.
+#
+################################################################################
+
+import os
+import sys
+import timeit
+import logging
+import logging.handlers
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	".."))
+
+from logqueue import LazyQueueHandler, SuppressedFormatter, \
+	RateLimitFilter, LOG_FORMAT
+
+HEADERS = dict(("header-{}".format(i), "value {} of the header".format(i))
+	for i in range(12))
+
+def devnull():
+	console = logging.StreamHandler(open(os.devnull, "w"))
+	console.setFormatter(SuppressedFormatter(LOG_FORMAT))
+	return console
+
+def makeLogger(name, handler, level=logging.DEBUG):
+	logger = logging.getLogger(name)
+	logger.setLevel(level)
+	logger.propagate = False
+	logger.addHandler(handler)
+	return logger
+
+def eager(logger):
+	logger.info("Received INVITE")
+	for k, v in HEADERS.items():
+		logger.info("SIP header {}: {}".format(k, v))
+
+def lazy(logger):
+	logger.info("Received INVITE")
+	if logger.isEnabledFor(logging.INFO):
+		for k, v in HEADERS.items():
+			logger.info("SIP header %s: %s", k, v)
+
+def flood(logger):
+	logger.error("Given Call-ID does not belong to a session: exit")
+
+if __name__ == '__main__':
+	before = makeLogger("before", devnull())
+
+	handler = LazyQueueHandler(100000)
+	listener = logging.handlers.QueueListener(handler.queue, devnull())
+	listener.start()
+	after = makeLogger("after", handler)
+	quiet = makeLogger("quiet", handler, logging.WARNING)
+
+	limited = LazyQueueHandler(100000)
+	limited.addFilter(RateLimitFilter(10, 100))
+	limitedListener = logging.handlers.QueueListener(limited.queue,
+		devnull())
+	limitedListener.start()
+	rateLimited = makeLogger("limited", limited)
+
+	n = 2000
+	for name, f in (("sync (before)", lambda: eager(before)),
+			("queued", lambda: lazy(after)),
+			("level WARNING", lambda: lazy(quiet)),
+			("flood, sync", lambda: flood(before)),
+			("flood, limited", lambda: flood(rateLimited))):
+		seconds = min(timeit.repeat(f, number=n, repeat=5))
+		# Let the writer thread catch up between the runs
+		listener.stop()
+		listener.start()
+		print("{:<16} {:8.2f} us/packet".format(name, seconds / n * 1e6))
+
+	listener.stop()
+	limitedListener.stop()
+	print("dropped {}, suppressed {}".format(handler.dropped + limited.dropped,
+		limited.filters[0].suppressed))
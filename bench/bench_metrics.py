@@ -0,0 +1,60 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Benchmark: cost of the metric updates done for every SIP message (counter
+# with a label, histogram observation, the perf_counter calls around parse
+# and handle) and of rendering the registry for a scrape.
+#
+################################################################################
+
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	".."))
+
+from metrics import Registry
+
+if __name__ == '__main__':
+	r = Registry()
+	requests = r.counter("sip_requests_total", "SIP requests", ("method",))
+	histogram = r.histogram("sip_parse_seconds", "Parse time")
+	r.collect("stats", lambda: dict(("counter_{}".format(i), i)
+		for i in range(60)))
+	labels = {'INVITE': "INVITE"}
+
+	n = 1000000
+	for name, f in (
+			("counter", lambda: requests.inc(("INVITE",))),
+			("counter + label", lambda: requests.inc((labels.get("INVITE",
+				"other"),))),
+			("histogram", lambda: histogram.observe(0.00003)),
+			("perf_counter", time.perf_counter),
+			("empty call", lambda: None)):
+		seconds = min(timeit.repeat(f, number=n, repeat=5))
+		print("{:<16} {:8.3f} us".format(name, seconds / n * 1e6))
+
+	seconds = min(timeit.repeat(r.render, number=100, repeat=5))
+	print("{:<16} {:8.3f} ms ({} bytes)".format("render", seconds / 100 * 1e3,
+		len(r.render())))
@@ -0,0 +1,100 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Benchmark: pacing of the playback scheduler with 100 to 5000 concurrent
+# streams. Every stream sends its packets with a UDP sendto to a local sink
+# socket (which is not read, packets beyond its buffer are dropped by the
+# kernel), the intervals between the packets of the first and the last stream
+# give the pacing jitter.
+#
+################################################################################
+
+import os
+import sys
+import time
+import socket
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	".."))
+
+import connection
+import playback
+
+class StreamStub(object):
+	"""Stands in for RtpUdpStream, sends from one shared socket"""
+	def __init__(self, sock, address, record):
+		self.sock = sock
+		self.address = address
+		self.times = [] if record else None
+
+	def send(self, msg, dump=True):
+		try:
+			self.sock.sendto(msg, self.address)
+		except BlockingIOError:
+			pass
+		if self.times is not None:
+			self.times.append(time.monotonic())
+
+def percentile(values, p):
+	values = sorted(values)
+	return values[min(int(len(values) * p), len(values) - 1)]
+
+def measure(count, seconds):
+	sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sink.bind(('127.0.0.1', 0))
+	sink.setblocking(False)
+	sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sender.setblocking(False)
+
+	loop = connection.getLoop()
+
+	scheduler = playback.PlaybackScheduler(playback.Announcement(
+		b"\xff" * 8000))
+	streams = [StreamStub(sender, sink.getsockname(), i in (0, count - 1))
+		for i in range(count)]
+	for stream in streams:
+		scheduler.add(stream)
+
+	start = time.process_time()
+	loop.call_later(seconds, loop.stop)
+	loop.run_forever()
+	cpu = time.process_time() - start
+	scheduler.close()
+	sink.close()
+	sender.close()
+
+	jitter = []
+	for stream in (streams[0], streams[-1]):
+		jitter += [abs(b - a - playback.PACKET_TIME) for a, b in
+			zip(stream.times, stream.times[1:])]
+	return scheduler, cpu / scheduler.ticks, jitter
+
+if __name__ == '__main__':
+	counts = [int(c) for c in sys.argv[1:]] or [100, 1000, 2000, 5000]
+	print("{:>8} {:>12} {:>12} {:>12} {:>12} {:>10}".format("streams",
+		"cpu/tick ms", "jitter p50", "jitter p99", "jitter max", "skipped"))
+	for count in counts:
+		scheduler, cpu, jitter = measure(count, 3)
+		print("{:>8} {:>12.2f} {:>10.2f}ms {:>10.2f}ms {:>10.2f}ms {:>10}".format(
+			count, cpu * 1000, percentile(jitter, 0.5) * 1000,
+			percentile(jitter, 0.99) * 1000, max(jitter) * 1000,
+			scheduler.skipped))
@@ -0,0 +1,111 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Benchmark: time to build a SIP response, string concatenation (as the
+# handlers did before the response templates) versus ResponseTemplate.render
+#
+################################################################################
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	".."))
+
+import sip
+from config import g_config
+
+g_sipconfig = g_config['modules']['python']['sip']
+
+def joinOptionsResponse(headers):
+	"""OPTIONS response built the way sip_OPTIONS used to build it"""
+	msgLines = []
+	msgLines.append("SIP/2.0 " + sip.RESPONSE[sip.OK])
+	msgLines.append("Via: SIP/2.0/UDP {}:{}".format(g_sipconfig['ip'],
+		g_sipconfig['port']))
+	msgLines.append("To: " + headers['from'])
+	msgLines.append("From: {0} <sip:{0}@{1}>".format(g_sipconfig['user'],
+		g_sipconfig['ip']))
+	msgLines.append("Call-ID: " + headers['call-id'])
+	msgLines.append("CSeq: " + headers['cseq'])
+	msgLines.append("Contact: {0} <sip:{0}@{1}>".format(g_sipconfig['user'],
+		g_sipconfig['ip']))
+	msgLines.append("Allow: INVITE, ACK, CANCEL, OPTIONS, BYE")
+	msgLines.append("Accept: application/sdp")
+	msgLines.append("Accept-Language: en")
+	return '\n'.join(msgLines).encode('utf-8')
+
+def joinInviteResponse(headers, rtpPort):
+	"""200 OK with SDP built the way SipSession.__init__ used to build it"""
+	sipFrom = "{0} <sip:{0}@{1}>".format(g_sipconfig['user'],
+		g_sipconfig['ip'])
+	sipVia = "SIP/2.0/UDP {}:{}".format(g_sipconfig['ip'],
+		g_sipconfig['port'])
+	msgLines = []
+	msgLines.append("SIP/2.0 " + sip.RESPONSE[sip.OK])
+	msgLines.append("Via: " + sipVia)
+	msgLines.append("Max-Forwards: 70")
+	msgLines.append("To: " + headers['from'])
+	msgLines.append("From: " + sipFrom)
+	msgLines.append("Call-ID: {}".format(headers['call-id']))
+	msgLines.append("CSeq: 1 INVITE")
+	msgLines.append("Contact: " + sipFrom)
+	msgLines.append("User-Agent: " + g_sipconfig['useragent'])
+	msgLines.append("Content-Type: application/sdp")
+	msgLines.append("\nv=0")
+	msgLines.append("o=... 0 0 IN IP4 localhost")
+	msgLines.append("t=0 0")
+	msgLines.append("m=audio {} RTP/AVP 0".format(rtpPort))
+	return '\n'.join(msgLines).encode('utf-8')
+
+def measure(f, number=100000, repeat=5):
+	"""Best time per call in microseconds"""
+	return min(timeit.repeat(f, number=number, repeat=repeat)) / number * 1e6
+
+if __name__ == '__main__':
+	headers = {
+		'from': '"sipvicious"<sip:100@1.1.1.1>;tag=6434396633623535313363',
+		'call-id': '1082937476',
+		'cseq': '1 OPTIONS'
+	}
+	options = sip.responseTemplates['options_ok']
+	invite = sip.responseTemplates['invite_ok']
+
+	cases = [
+		("OPTIONS 200 OK",
+			lambda: joinOptionsResponse(headers),
+			lambda: options.render(to=headers['from'],
+				callId=headers['call-id'], cseq=headers['cseq'])),
+		("INVITE 200 OK (SDP)",
+			lambda: joinInviteResponse(headers, 30000),
+			lambda: invite.render(to=headers['from'],
+				callId=headers['call-id'], cseq="1 INVITE", rtpPort=30000)),
+	]
+
+	print("{:<22} {:>10} {:>10} {:>8}".format("response", "join [us]",
+		"template", "speedup"))
+	for name, join, render in cases:
+		tJoin = measure(join)
+		tTemplate = measure(render)
+		print("{:<22} {:>10.2f} {:>10.2f} {:>7.1f}x".format(name, tJoin,
+			tTemplate, tJoin / tTemplate))
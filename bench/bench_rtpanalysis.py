@@ -0,0 +1,130 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Benchmark: RTP statistics of a synthetic stream dump (PCMU, 20ms packets
+# from 8 SSRCs with jitter, loss and reordering, optionally with a bogus
+# sequence number per SSRC or with random sequence numbers) computed by
+# rtpanalysis (vectorized over the memory mapped dump) and by feeding the
+# packets one by one to rtpstats.RtpStreamStats.
+#
+################################################################################
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	".."))
+
+import pcapdump
+import rtpanalysis
+import rtpstats
+
+PAYLOAD_SIZE = 160
+
+def writeDump(path, count, sources=8, pattern="noisy"):
+	"""Writes a dump of count packets with numpy, returns its size. The
+	sequence numbers of the "jump" pattern have a bogus jump in the middle of
+	each SSRC, the ones of the "random" pattern are random."""
+	r = np.random.default_rng(1)
+	n = np.arange(count)
+	ssrc = (n % sources).astype(np.uint32) + 0x10000
+	i = n // sources
+	seq = i.copy()
+	seq[r.random(count) < 0.01] += 1
+	keep = r.random(count) > 0.01
+	if pattern == "jump":
+		seq[i == i[-1] // 2] += 30000
+	elif pattern == "random":
+		seq = r.integers(0, 65536, count)
+
+	length = rtpstats.RTP_HEADER.size + PAYLOAD_SIZE
+	recordSize = rtpanalysis.RTP_OFFSET + length
+	records = np.zeros(count, dtype=[("header", "<u4", 4),
+		("ipudp", "u1", rtpanalysis.RTP_OFFSET - pcapdump.RECORD_HEADER.size),
+		("rtp", rtpanalysis.RTP_DTYPE), ("payload", "u1", PAYLOAD_SIZE)])
+	assert records.dtype.itemsize == recordSize
+	t = 1000 + i * 0.02 + r.uniform(0, 0.004, count)
+	records["header"][:, 0] = t.astype(np.uint32)
+	records["header"][:, 2] = records["header"][:, 3] = recordSize - \
+		pcapdump.RECORD_HEADER.size
+	records["rtp"]["vpxcc"] = 0x80
+	records["rtp"]["seq"] = seq & 0xffff
+	records["rtp"]["timestamp"] = (i * 160) & 0xffffffff
+	records["rtp"]["ssrc"] = ssrc
+	records["payload"] = 0xff
+	records = records[keep]
+
+	index = np.zeros(len(records), dtype=rtpanalysis.INDEX_DTYPE)
+	index["time"] = t[keep]
+	index["offset"] = pcapdump.PCAP_HEADER.size + \
+		np.arange(len(records)) * recordSize
+	index["length"] = length
+	index["direction"] = pcapdump.INBOUND
+
+	with open(path, "wb") as f:
+		f.write(pcapdump.PCAP_HEADER.pack(pcapdump.PCAP_MAGIC, 2, 4, 0, 0,
+			pcapdump.SNAPLEN, pcapdump.LINKTYPE_RAW))
+		records.tofile(f)
+	index.tofile(path + ".idx")
+	return os.path.getsize(path)
+
+def live(path):
+	"""Statistics computed packet by packet"""
+	stats = rtpstats.RtpStreamStats()
+	with pcapdump.PcapDumpReader(path) as reader:
+		for packet in reader.packets():
+			stats.update(packet.payload, packet.time)
+	return stats.summary()
+
+if __name__ == '__main__':
+	counts = [int(c) for c in sys.argv[1:]] or [100000, 1000000]
+	directory = tempfile.mkdtemp()
+	try:
+		print("{:>10} {:>8} {:>8} {:>14} {:>14} {:>10}".format("packets",
+			"pattern", "MB", "vectorized s", "per packet s", "MB/s"))
+		for count, pattern in [(c, p) for c in counts
+				for p in ("noisy", "jump", "random")]:
+			path = os.path.join(directory, "stream_{}.pcap".format(count))
+			size = writeDump(path, count, pattern=pattern)
+
+			start = time.perf_counter()
+			result = rtpanalysis.analyze(path)
+			vectorized = time.perf_counter() - start
+
+			start = time.perf_counter()
+			sources = live(path)
+			perPacket = time.perf_counter() - start
+
+			assert [s[:7] for s in result.sources] == \
+				[s[:7] for s in sources]
+			print("{:>10} {:>8} {:>8.0f} {:>14.3f} {:>14.3f} {:>10.0f}".format(
+				count, pattern, size / 1e6, vectorized, perPacket,
+				size / 1e6 / vectorized))
+			os.remove(path)
+			os.remove(path + ".idx")
+	finally:
+		shutil.rmtree(directory)
@@ -0,0 +1,100 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Benchmark: memory used per SipSession (Python heap, measured with
+# tracemalloc) for 10k, 100k and 1M sessions in the session table. The RTP
+# stream is replaced by a stub, 1M sockets would exceed the file descriptor
+# limit.
+#
+################################################################################
+
+import os
+import sys
+import time
+import logging
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	".."))
+
+import sip
+
+class RtpStreamStub(object):
+	"""Stand-in for RtpUdpStream without a socket and dump file"""
+	__slots__ = ("lastActivity",)
+
+	def __init__(self, address, port):
+		self.lastActivity = 0
+
+	def getsockname(self):
+		return ('0.0.0.0', 30000)
+
+	def close(self):
+		pass
+
+class SipConnectionStub(object):
+	def send(self, data):
+		pass
+
+def invite(i):
+	return sip.SipMessage(("INVITE sip:100@10.0.0.1 SIP/2.0\r\n"
+		"Via: SIP/2.0/UDP 192.168.1.{0}:5060;branch=z9hG4bK{1}\r\n"
+		"From: \"sipvicious\"<sip:100@192.168.1.{0}>;tag={1}\r\n"
+		"To: <sip:100@10.0.0.1>\r\n"
+		"Call-ID: {1}@192.168.1.{0}\r\n"
+		"CSeq: 1 INVITE\r\n"
+		"Contact: <sip:100@192.168.1.{0}:5060>\r\n"
+		"Content-Type: application/sdp\r\n\r\n"
+		"v=0\r\no=- 0 0 IN IP4 192.168.1.{0}\r\nm=audio 8000 RTP/AVP 0\r\n"
+		).format(i % 200, 1000000 + i))
+
+def measure(count):
+	"""Returns bytes per session and seconds per session for a table of count
+	sessions"""
+	sessions = {}
+	sipConnection = SipConnectionStub()
+
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	start = time.perf_counter()
+	for i in range(count):
+		msg = invite(i)
+		sessions[msg['call-id']] = sip.SipSession(
+			("192.168.1.{}".format(i % 200), 5060), "8000", msg, sipConnection,
+			None)
+	elapsed = time.perf_counter() - start
+	after = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+
+	return (after - before) / count, elapsed / count
+
+if __name__ == '__main__':
+	sip.logger.setLevel(logging.WARNING)
+	sip.RtpUdpStream = RtpStreamStub
+
+	counts = [int(c) for c in sys.argv[1:]] or [10000, 100000, 1000000]
+	print("{:>10} {:>16} {:>12}".format("sessions", "bytes/session",
+		"us/session"))
+	for count in counts:
+		perSession, seconds = measure(count)
+		print("{:>10} {:>16.0f} {:>12.1f}".format(count, perSession,
+			seconds * 1e6))
@@ -0,0 +1,292 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Detection of password guessing: failed digest checks are counted per source
+# address, per account (username, realm) and per realm in sliding windows. An
+# event is raised when a count crosses its threshold, and a source that
+# crossed it can be answered with a 403 for a while without handling or
+# parsing its requests (see Sip.handle_read and sip.rejectHeaders).
+#
+################################################################################
+
+import time
+import logqueue
+from collections import OrderedDict, deque, namedtuple
+
+from config import g_config
+
+# Logging
+logger = logqueue.getLogger("bruteforce")
+
+g_sipconfig = g_config['modules']['python']['sip']
+
+# Kinds of counted keys
+SOURCE, ACCOUNT, REALM = "source", "account", "realm"
+
+# Number of recent events kept for inspection
+MAX_EVENTS = 1000
+
+# A threshold was crossed: failures of key in the last window seconds
+BruteForceEvent = namedtuple("BruteForceEvent", "time kind key count window")
+
+class WindowSketch(object):
+	"""Approximate sliding window counts for any number of keys: a count-min
+	sketch (depth rows of width counters, the estimate is the smallest of
+	the key's counters and never too low) per slot of the window"""
+	def __init__(self, slots, width=4096, depth=4):
+		self.width = width
+		self.depth = depth
+		self.__tables = [[0] * (width * depth) for i in range(slots)]
+		self.__epoch = None
+		self.__zeros = [0] * (width * depth)
+
+	def __indexes(self, key):
+		# Double hashing, the row offsets come from one hash of the key
+		h = hash(key)
+		h1, h2 = h & 0xffffffff, (h >> 32) | 1
+		width = self.width
+		return [row * width + (h1 + row * h2) % width
+			for row in range(self.depth)]
+
+	def __advance(self, epoch):
+		"""Clears the slots that have left the window"""
+		tables = self.__tables
+		if self.__epoch is None or epoch - self.__epoch >= len(tables):
+			for table in tables:
+				table[:] = self.__zeros
+		else:
+			for e in range(self.__epoch + 1, epoch + 1):
+				tables[e % len(tables)][:] = self.__zeros
+		self.__epoch = epoch
+
+	def add(self, key, epoch):
+		"""Counts an event of key, returns the estimated count"""
+		if epoch != self.__epoch:
+			self.__advance(epoch)
+
+		indexes = self.__indexes(key)
+		table = self.__tables[epoch % len(self.__tables)]
+		for i in indexes:
+			table[i] += 1
+		return min(sum(t[i] for t in self.__tables) for i in indexes)
+
+class SlidingWindowCounter(object):
+	"""Events per key in the last window seconds, kept in a ring buffer of
+	slots counters per key (the window moves in steps of window/slots).
+	At most maxKeys keys are counted exactly, keys without events for a
+	whole window are dropped, and keys beyond the limit are counted
+	approximately by a WindowSketch."""
+	def __init__(self, window=60, slots=6, maxKeys=65536):
+		self.window = window
+		self.slots = slots
+		self.slotTime = window / slots
+		self.maxKeys = maxKeys
+
+		# key -> [epoch of the last event, count in window, slot counters],
+		# least recently counted first
+		self.__keys = OrderedDict()
+		self.__sketch = None
+
+		self.approximated = 0
+
+	def __len__(self):
+		return len(self.__keys)
+
+	def add(self, key, now):
+		"""Counts an event of key at now (seconds), returns the number of
+		events of key in the window"""
+		epoch = int(now // self.slotTime)
+		keys = self.__keys
+		entry = keys.get(key)
+		if entry is None:
+			# Drop keys that have been idle for a whole window
+			while keys:
+				oldest = next(iter(keys.values()))
+				if epoch - oldest[0] < self.slots:
+					break
+				keys.popitem(last=False)
+
+			if len(keys) >= self.maxKeys:
+				if self.__sketch is None:
+					self.__sketch = WindowSketch(self.slots)
+				self.approximated += 1
+				return self.__sketch.add(key, epoch)
+
+			entry = keys[key] = [epoch, 0, [0] * self.slots]
+		else:
+			keys.move_to_end(key)
+
+		last, count, ring = entry
+		if epoch != last:
+			# Clear the slots between the last event and now
+			if epoch - last >= self.slots:
+				ring[:] = [0] * self.slots
+				count = 0
+			else:
+				for e in range(last + 1, epoch + 1):
+					count -= ring[e % self.slots]
+					ring[e % self.slots] = 0
+			entry[0] = epoch
+
+		ring[epoch % self.slots] += 1
+		entry[1] = count + 1
+		return count + 1
+
+	def count(self, key, now):
+		"""Number of events of key in the window (0 for keys not counted
+		exactly)"""
+		entry = self.__keys.get(key)
+		if entry is None:
+			return 0
+		epoch = int(now // self.slotTime)
+		last, count, ring = entry
+		if epoch - last >= self.slots:
+			return 0
+		for e in range(last + 1, epoch + 1):
+			count -= ring[e % self.slots]
+		return count
+
+class BruteForceDetector(object):
+	"""Counts failed authentications by source, account and realm. When a
+	count reaches its threshold within the window, an event is logged, kept
+	in events and passed to the listeners. With a blockTime, a source that
+	reached its threshold is blocked for blockTime seconds (see blocked).
+	A key that raised an event raises the next one when it is still at or
+	above its threshold after a window (or after its block for sources)."""
+	def __init__(self, window=60, sourceThreshold=20, accountThreshold=50,
+			realmThreshold=500, blockTime=0, maxKeys=65536,
+			clock=time.monotonic):
+		self.window = window
+		self.blockTime = blockTime
+		self.maxKeys = maxKeys
+		self.clock = clock
+		self.__counters = dict((kind, SlidingWindowCounter(window,
+			maxKeys=maxKeys)) for kind in (SOURCE, ACCOUNT, REALM))
+		self.__thresholds = {SOURCE: sourceThreshold,
+			ACCOUNT: accountThreshold, REALM: realmThreshold}
+
+		# Functions called with each BruteForceEvent, and the recent events
+		self.listeners = []
+		self.events = deque(maxlen=MAX_EVENTS)
+
+		# Blocked sources -> end of the block (in order of blocking)
+		self.__blocked = OrderedDict()
+
+		# Keys that raised an event -> time until which they raise no other
+		self.__quiet = dict((kind, OrderedDict())
+			for kind in (SOURCE, ACCOUNT, REALM))
+
+		self.failures = 0
+		self.raised = 0
+		self.blockedRequests = 0
+
+	def failure(self, source, username, realm, now=None):
+		"""Counts a failed authentication of username in realm from the
+		source address. The account and realm are not counted when they are
+		None (e.g. the request had no Digest credentials)."""
+		if now is None:
+			now = self.clock()
+		self.failures += 1
+
+		keys = [(SOURCE, source)]
+		if username is not None:
+			keys.append((ACCOUNT, (username, realm)))
+		if realm is not None:
+			keys.append((REALM, realm))
+
+		for kind, key in keys:
+			count = self.__counters[kind].add(key, now)
+			# Approximated counts can step over the threshold, so compare
+			# with >= and silence the key instead of testing for equality
+			if count < self.__thresholds[kind]:
+				continue
+			quiet = self.__quiet[kind]
+			until = quiet.get(key)
+			if until is not None and now < until:
+				continue
+
+			quiet.pop(key, None)
+			if kind == SOURCE and self.blockTime > 0:
+				quiet[key] = now + self.blockTime
+			else:
+				quiet[key] = now + self.window
+			if len(quiet) > self.maxKeys:
+				quiet.popitem(last=False)
+			self.__raise(BruteForceEvent(now, kind, key, count, self.window))
+
+	def __raise(self, event):
+		self.raised += 1
+		self.events.append(event)
+		logger.warning("Brute force: %s failed authentications of %s %s in "
+			"%ss", event.count, event.kind, event.key, event.window)
+
+		if event.kind == SOURCE and self.blockTime > 0:
+			blocked = self.__blocked
+			blocked.pop(event.key, None)
+			blocked[event.key] = event.time + self.blockTime
+			if len(blocked) > self.maxKeys:
+				blocked.popitem(last=False)
+
+		for listener in self.listeners:
+			listener(event)
+
+	def blocked(self, source, now):
+		"""Whether requests of source are answered by the fast path"""
+		until = self.__blocked.get(source)
+		if until is None:
+			return False
+		if now < until:
+			self.blockedRequests += 1
+			return True
+		del self.__blocked[source]
+		return False
+
+	def count(self, kind, key, now=None):
+		"""Failures of key (SOURCE address, ACCOUNT (username, realm) or
+		REALM) in the window"""
+		return self.__counters[kind].count(key,
+			self.clock() if now is None else now)
+
+	def stats(self):
+		return {
+			'bruteforce_failures': self.failures,
+			'bruteforce_events': self.raised,
+			'bruteforce_blocked_sources': len(self.__blocked),
+			'bruteforce_blocked_requests': self.blockedRequests,
+			'bruteforce_approximated': sum(c.approximated
+				for c in self.__counters.values())
+		}
+
+# Detector shared by all connections of this process (see getDetector)
+g_detector = None
+
+def getDetector():
+	"""Returns the brute force detector configured in g_sipconfig"""
+	global g_detector
+	if g_detector is None:
+		g_detector = BruteForceDetector(g_sipconfig['bruteforce_window'],
+			g_sipconfig['bruteforce_source_threshold'],
+			g_sipconfig['bruteforce_account_threshold'],
+			g_sipconfig['bruteforce_realm_threshold'],
+			g_sipconfig['bruteforce_block_time'],
+			g_sipconfig['bruteforce_keys'])
+	return g_detector
@@ -28,6 +28,127 @@ g_config = { 'modules': { 'python': { 'sip': {
 	'user': '100',
 	'useragent': 'softphone',
 	'secret': 'F2DS13G5',
-	'use_authentication': True
+	'use_authentication': True,
+
+	# Realm of the digest challenges ('' for <user>@<ip>), and a file of
+	# accounts (username:realm:password lines, see credentials.py) used
+	# instead of user and secret, checked for changes every
+	# credentials_reload_interval seconds
+	'realm': '',
+	'credentials_file': '',
+	'credentials_reload_interval': 5,
+
+	# Brute force detection: failed authentications per source, per account
+	# and per realm within the window (seconds) that raise an event, number of
+	# keys counted exactly (more are estimated), and seconds a source that
+	# reached its threshold is answered with a 403 without handling or
+	# parsing its requests (0 disables blocking)
+	'bruteforce_window': 60,
+	'bruteforce_source_threshold': 20,
+	'bruteforce_account_threshold': 50,
+	'bruteforce_realm_threshold': 500,
+	'bruteforce_keys': 65536,
+	'bruteforce_block_time': 0,
+
+	# Digest authentication: key of the nonce HMAC ('' for a random key per
+	# start, shared by the worker processes), seconds until a nonce expires,
+	# and number of cached HA2 values (per method and uri)
+	'nonce_key': '',
+	'nonce_expiry': 300,
+	'digest_cache_size': 1024,
+
+	# Responses replayed for exact retransmissions of a request (number of
+	# cached requests, seconds until an entry expires: 64*T1 = timer B/F)
+	'retransmission_cache_size': 4096,
+	'retransmission_cache_ttl': 32,
+
+	# Datagrams received per readiness event of the SIP socket
+	'recv_batch_size': 64,
+
+	# Largest SIP message (bytes) that is handled, larger requests are
+	# answered with 513 Message Too Large
+	'max_message_size': 16384,
+
+	# Seconds until a session expires: INVITE not followed by an ACK, active
+	# session without RTP traffic, and after a BYE (retransmitted BYEs are
+	# still answered)
+	'session_setup_timeout': 32,
+	'session_rtp_timeout': 60,
+	'session_teardown_timeout': 32,
+
+	# Size of the session table, sessions per source address (more INVITEs
+	# are answered with 486), and the idle time (seconds) after which a
+	# session may be evicted to make room in a full table (otherwise new
+	# INVITEs are answered with 503)
+	'max_sessions': 10000,
+	'max_sessions_per_source': 100,
+	'session_evict_idle': 5,
+
+	# SIP over TCP: seconds without data after which a connection is closed
+	# (0 disables the timeout), and the number of open connections (more are
+	# closed right after being accepted)
+	'tcp_idle_timeout': 60,
+	'tcp_max_connections': 1000,
+
+	# Admission control per source address (or /24 network): datagrams per
+	# second, burst size, number of sources tracked, and whether shed requests
+	# are answered with 503 (otherwise they are dropped silently). A rate of 0
+	# disables the rate limiter.
+	'ratelimit_rate': 50,
+	'ratelimit_burst': 100,
+	'ratelimit_prefix24': False,
+	'ratelimit_sources': 65536,
+	'ratelimit_reply': False,
+
+	# RTP ports are bound at startup: address, first port and number of ports
+	# (one port per session, worker processes split the range)
+	'rtp_ip': '',
+	'rtp_port_start': 30000,
+	'rtp_port_count': 1000,
+
+	# Stream dumps are written by a background thread: directory, bytes per
+	# stream and in total, bytes waiting to be written (more is dropped), and
+	# seconds between writes
+	'dump_directory': '.',
+	'dump_stream_quota': 16 * 1024 * 1024,
+	'dump_global_quota': 1024 * 1024 * 1024,
+	'dump_max_pending': 32 * 1024 * 1024,
+	'dump_flush_interval': 0.5,
+
+	# Announcement played to every active session in 20ms PCMU packets: a WAV
+	# file (16 bit mono at 8000 Hz, needs NumPy) or raw μ-law, and whether it
+	# is repeated until the session ends ('' disables playback)
+	'playback_file': '',
+	'playback_repeat': True,
+
+	# Number of worker processes sharing the SIP port with SO_REUSEPORT (0 runs
+	# everything in a single process), and seconds between the stats reports
+	# of the workers to the supervisor
+	'workers': 0,
+	'worker_stats_interval': 5,
+
+	# SQLite database receiving an event for every SIP request,
+	# authentication attempt and session state change ('' disables it), the
+	# number of events written in one transaction, the seconds between the
+	# writes, and the number of events that may wait for the database
+	# before new ones are dropped
+	'event_database': '',
+	'event_batch_size': 5000,
+	'event_flush_interval': 0.5,
+	'event_max_pending': 100000,
+
+	# Local scrape endpoint of the metrics in the Prometheus text format:
+	# "host:port" or the path of a Unix socket ('' disables it). In worker
+	# mode, worker i listens on port + i (or the path with ".i" appended).
+	'metrics_address': '',
+
+	# Logging: level of all loggers, size of the queue between the event loop
+	# and the writer thread (records are dropped when it is full), and the
+	# records per second and burst each call site may log (0 disables the
+	# rate limit)
+	'log_level': 'DEBUG',
+	'log_queue_size': 10000,
+	'log_rate': 10,
+	'log_burst': 100
 }}}}
 
@@ -21,26 +21,106 @@
 ################################################################################
 
 import socket
-import asyncore
+import asyncio
+import errno
 import time
-import logging
+import logqueue
+
+from timerwheel import TimerWheel
 
 # Setup logging mechanism
-logger = logging.getLogger('connection')
-logger.setLevel(logging.DEBUG)
-logConsole = logging.StreamHandler()
-logConsole.setLevel(logging.DEBUG)
-logConsole.setFormatter(logging.Formatter(
-	"%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
-logger.addHandler(logConsole)
+logger = logqueue.getLogger('connection')
+
+# Errors on non-blocking sockets that just mean "try again later" or that the
+# remote host has gone away
+WOULDBLOCK = frozenset((errno.EAGAIN, errno.EWOULDBLOCK, errno.EINPROGRESS))
+DISCONNECTED = frozenset((errno.ECONNRESET, errno.ENOTCONN, errno.ESHUTDOWN,
+	errno.ECONNABORTED, errno.EPIPE, errno.EBADF))
+
+# Event loop shared by all connections (see getLoop)
+g_loop = None
+
+# Timer wheel for connection and session timeouts, advanced by the event loop
+# every TIMER_INTERVAL seconds (see getTimerWheel)
+TIMER_INTERVAL = 1.0
+g_timerWheel = None
+g_timerWheelLoop = None
+
+def getLoop():
+	"""Returns the asyncio event loop all connections are registered with. On
+	Linux this is a selector loop using epoll."""
+	global g_loop
+	if g_loop is None or g_loop.is_closed():
+		g_loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(g_loop)
+	return g_loop
+
+def getTimerWheel():
+	"""Returns the timer wheel shared by all connections. Scheduling a timer
+	is O(1), so per-session timeouts don't need a call_later handle each."""
+	global g_timerWheel, g_timerWheelLoop
+	if g_timerWheel is None:
+		g_timerWheel = TimerWheel(TIMER_INTERVAL)
+
+	# (Re)start ticking on the current event loop
+	eventLoop = getLoop()
+	if g_timerWheelLoop is not eventLoop:
+		g_timerWheelLoop = eventLoop
+
+		def tick():
+			if g_timerWheelLoop is eventLoop:
+				g_timerWheel.advance()
+				eventLoop.call_later(TIMER_INTERVAL, tick)
+
+		eventLoop.call_later(TIMER_INTERVAL, tick)
+
+	return g_timerWheel
+
+def loop():
+	"""Runs the event loop until stop() is called (replaces asyncore.loop)"""
+	getLoop().run_forever()
+
+def stop():
+	"""Stops the event loop after the current iteration"""
+	getLoop().stop()
+
+class BufferPool(object):
+	"""Pool of preallocated receive buffers (bytearray) of a fixed size, so
+	that receiving a datagram with recvfrom_into does not allocate"""
+	def __init__(self, bufferSize, count=1):
+		self.bufferSize = bufferSize
+		self.__free = [bytearray(bufferSize) for i in range(count)]
 
-class connection(asyncore.dispatcher):
-	"""Connection class mockup (from connection.pyx in dionaea src)"""
+	def get(self):
+		"""Takes a buffer from the pool, a new one is allocated if the pool is
+		empty"""
+		if self.__free:
+			return self.__free.pop()
+		return bytearray(self.bufferSize)
+
+	def put(self, buffer):
+		"""Returns a buffer to the pool"""
+		self.__free.append(buffer)
+
+	def __len__(self):
+		return len(self.__free)
+
+class connection(object):
+	"""Connection class mockup (from connection.pyx in dionaea src)
+
+	The socket is registered with the asyncio event loop, which calls
+	handle_read when data can be read and handle_write when data can be
+	written and writable() returns True."""
 
 	def __init__(self, proto=None, sock=None):
 		"""Creates a new connection with TCP as its default transport
 		protocol"""
-		asyncore.dispatcher.__init__(self, sock)
+		self.__loop = getLoop()
+		self.__reading = False
+		self.__writing = False
+		self.connected = False
+		self.accepting = False
+		self.connecting = False
 
 		if sock == None:
 			# Use TCP by default, and UDP if stated
@@ -48,14 +128,191 @@ class connection(asyncore.dispatcher):
 			if proto and proto.lower() == 'udp':
 				type = socket.SOCK_DGRAM
 
-			# Create non-blocking socket
-			self.create_socket(socket.AF_INET, type)
+			sock = socket.socket(socket.AF_INET, type)
+		else:
+			# An existing stream socket (e.g. from accept) is connected
+			self.connected = True
+
+		# Create non-blocking socket
+		sock.setblocking(False)
+		self.socket = sock
+		self.__fileno = sock.fileno()
+
+		# Datagram sockets and existing sockets can be read right away, stream
+		# sockets only after listen or connect (subclasses are not initialized
+		# yet, so writable() cannot be asked here)
+		if sock.type == socket.SOCK_DGRAM or self.connected:
+			self.__loop.add_reader(self.__fileno, self.__readReady)
+			self.__reading = True
+
+	def fileno(self):
+		return self.__fileno
+
+	def readable(self):
+		"""Whether handle_read should be called for incoming data"""
+		return True
+
+	def writable(self):
+		"""Whether handle_write should be called when the socket can be
+		written, override for connections with a send buffer"""
+		return False
+
+	def updateEvents(self):
+		"""(Un)registers the socket for read and write events with the event
+		loop, has to be called when the result of readable() or writable()
+		changes outside of a callback (e.g. when data is added to a send
+		buffer)"""
+		if self.socket is None:
+			return
+
+		reading = self.readable()
+		if reading != self.__reading:
+			if reading:
+				self.__loop.add_reader(self.__fileno, self.__readReady)
+			else:
+				self.__loop.remove_reader(self.__fileno)
+			self.__reading = reading
+
+		writing = self.connecting or self.writable()
+		if writing != self.__writing:
+			if writing:
+				self.__loop.add_writer(self.__fileno, self.__writeReady)
+			else:
+				self.__loop.remove_writer(self.__fileno)
+			self.__writing = writing
 
+	def __readReady(self):
+		try:
+			if self.accepting:
+				self.handle_accept()
+			else:
+				self.handle_read()
+		except Exception:
+			self.handle_error()
+
+		self.updateEvents()
+
+	def __writeReady(self):
+		try:
+			if self.connecting:
+				self.__finishConnect()
+			else:
+				self.handle_write()
+		except Exception:
+			self.handle_error()
+
+		self.updateEvents()
+
+	def __finishConnect(self):
+		self.connecting = False
+		err = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+		if err != 0:
+			raise OSError(err, "Connect failed")
+
+		self.connected = True
+		self.handle_connect()
+
+	# Socket operations
+	def bind(self, address):
+		self.socket.bind(address)
+
+	def listen(self, backlog):
+		self.accepting = True
+		self.socket.listen(backlog)
+		self.updateEvents()
+
+	def accept(self):
+		"""Returns a tupel (socket, address) or None if there is no pending
+		connection"""
+		try:
+			return self.socket.accept()
+		except OSError as e:
+			if e.errno in WOULDBLOCK or e.errno == errno.ECONNABORTED:
+				return None
+			raise
+
+	def connect(self, address):
+		err = self.socket.connect_ex(address)
+		if err in WOULDBLOCK:
+			self.connecting = True
+			self.updateEvents()
+		elif err == 0:
+			self.connected = True
+			self.updateEvents()
+			self.handle_connect()
+		else:
+			raise OSError(err, "Connect failed")
+
+	def send(self, data):
+		"""Sends data on a stream socket, returns the number of bytes sent (0
+		if the socket is not ready or the connection has been closed)"""
+		try:
+			return self.socket.send(data)
+		except OSError as e:
+			if e.errno in WOULDBLOCK:
+				return 0
+			if e.errno in DISCONNECTED:
+				self.handle_close()
+				return 0
+			raise
+
+	def recv(self, bufferSize):
+		"""Receives data from a stream socket, returns b'' and closes the
+		connection if the remote host has closed it"""
+		try:
+			data = self.socket.recv(bufferSize)
+		except OSError as e:
+			if e.errno in WOULDBLOCK:
+				return b''
+			if e.errno in DISCONNECTED:
+				self.handle_close()
+				return b''
+			raise
+
+		if not data:
+			self.handle_close()
+		return data
+
+	def sendto(self, data, address):
+		return self.socket.sendto(data, address)
+
+	def recvfrom(self, bufferSize):
+		return self.socket.recvfrom(bufferSize)
+
+	def recvfrom_into(self, buffer, nbytes=0):
+		return self.socket.recvfrom_into(buffer, nbytes)
+
+	def getsockname(self):
+		return self.socket.getsockname()
+
+	def set_reuse_addr(self):
+		self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+	def set_reuse_port(self):
+		"""Allows several processes to bind the same address, the kernel
+		distributes incoming datagrams and connections between them"""
+		self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+	def close(self):
+		if self.socket is None:
+			return
+
+		if self.__reading:
+			self.__loop.remove_reader(self.__fileno)
+		if self.__writing:
+			self.__loop.remove_writer(self.__fileno)
+		self.__reading = self.__writing = False
+
+		self.connected = self.accepting = self.connecting = False
+		self.socket.close()
+		self.socket = None
+
+	# Callbacks
 	def handle_established(self):
 		"""Callback for a newly established connection (client or server)"""
 		logger.info('Session established')
-		logger.debug('Session socket: {}'.format(
-			self.getsockname()))
+		logger.debug('Session socket: %s',
+			self.getsockname())
 
 	def handle_read(self):
 		"""Callback for incoming data (dionaea: handle_io_in)"""
@@ -76,5 +333,14 @@ class connection(asyncore.dispatcher):
 
 	def handle_accept(self):
 		"""Callback for successful accept (server)"""
-		self.__conn, self.__address = self.accept()
+		pair = self.accept()
+		if pair is None:
+			return
+
+		self.__conn, self.__address = pair
 		self.handle_established()
+
+	def handle_error(self):
+		"""Callback for an unhandled exception in one of the other callbacks,
+		the connection stays open"""
+		logger.exception("Unhandled exception in connection callback")
@@ -0,0 +1,190 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Accounts for digest authentication, loaded from a file with one account per
+# line:
+#
+#   username:realm:password
+#   username:realm:{HA1}<md5 of username:realm:password>
+#   username:realm:
+#
+# An empty realm is the default realm, an empty password is an account that
+# is let in without authentication. Lines starting with # are comments. The
+# HA1 values are computed when the file is loaded, lookups are a dictionary
+# access by (username, realm). The file is reloaded in a thread of the event
+# loop's executor when it changes, the new table replaces the old one at
+# once.
+#
+################################################################################
+
+import os
+import hashlib
+import logqueue
+
+import connection
+
+# Logging
+logger = logqueue.getLogger("credentials")
+
+# Prefix of a precomputed HA1 in the password field
+HA1_PREFIX = "{HA1}"
+
+class CredentialError(Exception):
+	"""Raised for a malformed credentials file"""
+
+def ha1(username, realm, password):
+	return hashlib.md5("{}:{}:{}".format(username, realm,
+		password).encode('utf-8')).hexdigest()
+
+def parseCredentials(lines, defaultRealm):
+	"""Returns the accounts of a credentials file as ({(username, realm): HA1},
+	set of (username, realm) without password)"""
+	accounts = {}
+	passwordless = set()
+	for number, line in enumerate(lines, 1):
+		line = line.strip()
+		if not line or line.startswith("#"):
+			continue
+
+		parts = line.split(":", 2)
+		if len(parts) != 3 or not parts[0]:
+			raise CredentialError("Line {}: expected username:realm:password"
+				.format(number))
+		username, realm, password = parts
+		key = (username, realm or defaultRealm)
+
+		if not password:
+			passwordless.add(key)
+		elif password.startswith(HA1_PREFIX):
+			value = password[len(HA1_PREFIX):].lower()
+			if len(value) != 32:
+				raise CredentialError("Line {}: HA1 is not an MD5 hex digest"
+					.format(number))
+			accounts[key] = value
+		else:
+			accounts[key] = ha1(key[0], key[1], password)
+	return accounts, passwordless
+
+def loadCredentials(path, defaultRealm):
+	with open(path, encoding='utf-8') as f:
+		return parseCredentials(f, defaultRealm)
+
+class CredentialStore(object):
+	"""Accounts by (username, realm), used as DigestAuth.accounts. With a
+	path, the file is loaded and watched for changes every reloadInterval
+	seconds (a stat on the timer wheel, the file is parsed in a thread)."""
+	def __init__(self, defaultRealm, path=None, reloadInterval=5):
+		self.defaultRealm = defaultRealm
+		self.path = path
+		self.reloadInterval = reloadInterval
+
+		# {(username, realm): HA1} and the accounts without password, both
+		# replaced as a whole on reload
+		self.__accounts = {}
+		self.__open = frozenset()
+
+		# (mtime, size) of the loaded file and whether a reload is running
+		self.__version = None
+		self.__loading = False
+		self.__timer = None
+
+		self.reloads = 0
+		self.reloadErrors = 0
+
+		if path is not None:
+			self.__version = self.__stat()
+			self.__replace(*loadCredentials(path, defaultRealm))
+			self.__schedule()
+
+	def __len__(self):
+		return len(self.__accounts) + len(self.__open)
+
+	def get(self, key, default=None):
+		"""HA1 of the account (username, realm)"""
+		return self.__accounts.get(key, default)
+
+	def isOpen(self, key):
+		"""Whether the account (username, realm) has no password"""
+		return key in self.__open
+
+	def add(self, username, realm, password):
+		"""Adds an account (not written to the file, lost on reload)"""
+		key = (username, realm or self.defaultRealm)
+		if password:
+			self.__accounts[key] = ha1(key[0], key[1], password)
+		else:
+			self.__open = self.__open | {key}
+
+	def __replace(self, accounts, passwordless):
+		self.__accounts = accounts
+		self.__open = frozenset(passwordless)
+		logger.info("Loaded %s accounts (%s without password) from %s",
+			len(self), len(passwordless), self.path)
+
+	def __stat(self):
+		try:
+			st = os.stat(self.path)
+		except OSError:
+			return None
+		return (st.st_mtime_ns, st.st_size)
+
+	def __schedule(self):
+		self.__timer = connection.getTimerWheel().schedule(
+			self.reloadInterval, self.__check)
+
+	def __check(self):
+		"""Starts a reload in the executor if the file has changed"""
+		self.__schedule()
+		version = self.__stat()
+		if self.__loading or version is None or version == self.__version:
+			return
+
+		self.__loading = True
+		self.__version = version
+		future = connection.getLoop().run_in_executor(None, loadCredentials,
+			self.path, self.defaultRealm)
+		future.add_done_callback(self.__loaded)
+
+	def __loaded(self, future):
+		self.__loading = False
+		try:
+			result = future.result()
+		except (OSError, UnicodeDecodeError, CredentialError) as e:
+			self.reloadErrors += 1
+			logger.error("Keeping the old accounts, cannot load %s: %s",
+				self.path, e)
+			return
+
+		self.reloads += 1
+		self.__replace(*result)
+
+	def reload(self):
+		"""Checks the file for changes now (the reload finishes later on the
+		event loop)"""
+		if self.__timer is not None:
+			connection.getTimerWheel().cancel(self.__timer)
+			self.__check()
+
+	def close(self):
+		if self.__timer is not None:
+			connection.getTimerWheel().cancel(self.__timer)
+			self.__timer = None
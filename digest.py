@@ -0,0 +1,161 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# HTTP digest authentication (RFC 2617) for SIP requests with stateless
+# nonces: a nonce is its issue time and an HMAC of the time and the client
+# address, so it can be validated by any process with the same key without a
+# table of issued nonces. HA1 is computed once per account and HA2 is cached
+# per (method, uri), so checking a wrong response costs a single MD5. The uri
+# of the response has to be the Request-URI, a response captured for another
+# request is not accepted.
+#
+################################################################################
+
+import time
+import hmac
+import hashlib
+from collections import OrderedDict
+
+# Results of DigestAuth.verify
+AUTHORIZED, STALE, UNAUTHORIZED = range(3)
+
+# Nonce: issue time (8 hex digits) followed by the truncated HMAC (hex)
+NONCE_TIME_SIZE = 8
+NONCE_MAC_SIZE = 32
+
+# Seconds a nonce may be from the future (clocks of cooperating hosts)
+NONCE_CLOCK_SKEW = 5
+
+def md5(s):
+	return hashlib.md5(s.encode('utf-8')).hexdigest()
+
+class NonceFactory(object):
+	"""Issues and validates nonces bound to a client address that expire
+	after expiry seconds"""
+	def __init__(self, key, expiry=300):
+		self.key = key
+		self.expiry = expiry
+
+		# HMAC-SHA256 keyed once, a nonce costs a copy of it and an update
+		self.__hmac = hmac.new(key, digestmod=hashlib.sha256)
+
+	def __mac(self, issued, address):
+		mac = self.__hmac.copy()
+		mac.update("{}:{}".format(issued, address).encode('utf-8'))
+		return mac.hexdigest()[:NONCE_MAC_SIZE]
+
+	def issue(self, address, now=None):
+		"""New nonce for a challenge sent to address"""
+		if now is None:
+			now = time.time()
+		issued = "{:08x}".format(int(now) & 0xffffffff)
+		return issued + self.__mac(issued, address)
+
+	def check(self, nonce, address, now=None):
+		"""AUTHORIZED if nonce has been issued to address and is still valid,
+		STALE if it has been issued but has expired, UNAUTHORIZED otherwise"""
+		if len(nonce) != NONCE_TIME_SIZE + NONCE_MAC_SIZE:
+			return UNAUTHORIZED
+		issued = nonce[:NONCE_TIME_SIZE]
+		try:
+			t = int(issued, 16)
+		except ValueError:
+			return UNAUTHORIZED
+
+		if not hmac.compare_digest(self.__mac(issued, address).encode(),
+				nonce[NONCE_TIME_SIZE:].encode('utf-8')):
+			return UNAUTHORIZED
+
+		if now is None:
+			now = time.time()
+		age = int(now) - t
+		if age > self.expiry or age < -NONCE_CLOCK_SKEW:
+			return STALE
+		return AUTHORIZED
+
+class DigestAuth(object):
+	"""Verifies digest responses against the HA1 values of the accounts
+	{(username, realm): HA1}, HA2 values are kept in a LRU cache of cacheSize
+	entries (the uri is chosen by the client)"""
+	def __init__(self, nonces, accounts=None, cacheSize=1024):
+		self.nonces = nonces
+		self.accounts = accounts if accounts is not None else {}
+		self.__cacheSize = cacheSize
+		self.__ha2 = OrderedDict()
+
+		# Statistics
+		self.authorized = 0
+		self.stale = 0
+		self.failed = 0
+
+	def ha2(self, method, uri):
+		key = (method, uri)
+		cache = self.__ha2
+		value = cache.get(key)
+		if value is not None:
+			cache.move_to_end(key)
+			return value
+
+		value = cache[key] = md5("{}:{}".format(method, uri))
+		if len(cache) > self.__cacheSize:
+			cache.popitem(last=False)
+		return value
+
+	def verify(self, method, params, address, requestUri=None):
+		"""Checks the parameters of a Digest Authorization header of a request
+		from address, returns (result, expected response). Unless requestUri
+		is None, the uri parameter has to be the Request-URI. A wrong response
+		(a brute force attempt) costs one MD5 and a constant-time compare, the
+		nonce is only validated for correct responses (the response covers
+		the nonce)."""
+		ha1 = self.accounts.get((params.get('username'), params.get('realm')))
+		if ha1 is None or (requestUri is not None and
+				params.get('uri') != requestUri):
+			self.failed += 1
+			return UNAUTHORIZED, None
+
+		nonce = params.get('nonce', '')
+		ha2 = self.ha2(method, params.get('uri', ''))
+		if params.get('qop') == 'auth':
+			expected = md5("{}:{}:{}:{}:auth:{}".format(ha1, nonce,
+				params.get('nc', ''), params.get('cnonce', ''), ha2))
+		else:
+			expected = md5("{}:{}:{}".format(ha1, nonce, ha2))
+
+		if not hmac.compare_digest(expected.encode(),
+				params.get('response', '').encode('utf-8')):
+			self.failed += 1
+			return UNAUTHORIZED, expected
+
+		result = self.nonces.check(nonce, address)
+		if result == UNAUTHORIZED:
+			self.failed += 1
+			return UNAUTHORIZED, expected
+
+		# A correct response with an expired nonce is answered with a new
+		# challenge (stale=TRUE), the client doesn't have to ask the user
+		if result == STALE:
+			self.stale += 1
+			return STALE, expected
+
+		self.authorized += 1
+		return AUTHORIZED, expected
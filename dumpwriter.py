@@ -0,0 +1,237 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import os
+import logqueue
+import threading
+
+from config import g_config
+
+# Logging
+logger = logqueue.getLogger("dumpwriter")
+
+g_sipconfig = g_config['modules']['python']['sip']
+
+# Pending bytes that wake up the writer thread before the flush interval
+FLUSH_THRESHOLD = 1024 * 1024
+
+class StreamDump(object):
+	"""Dump file of one stream, data written to it is buffered by the
+	DumpWriter and written to disk by its thread"""
+	def __init__(self, writer, path, quota):
+		self.path = path
+		self.quota = quota
+		self.__writer = writer
+
+		# Bytes accepted so far, whether data has been dropped because of the
+		# quota, and whether the dump is closed or writing it has failed
+		self.accepted = 0
+		self.truncated = False
+		self.closed = False
+		self.failed = False
+
+		# Data not yet handed to the writer thread, and whether the file has
+		# been created (only used by the writer thread)
+		self.buffer = bytearray()
+		self.created = False
+
+	def write(self, data):
+		"""Appends data to the dump, returns False if it has been dropped"""
+		return self.__writer.append(self, data)
+
+	def close(self):
+		self.__writer.closeDump(self)
+
+class DumpWriter(object):
+	"""Writes stream dumps from a background thread, so that the event loop
+	never waits for the disk. Data is appended to per-dump buffers in memory
+	and written in large batches every flushInterval seconds (or earlier if a
+	lot is pending). Files are only opened while they are written to.
+
+	Data is dropped (and counted) when a dump exceeds its quota, when all
+	dumps together exceed the global quota, when more than maxPending bytes
+	wait for the disk, and when writing fails (e.g. disk full)."""
+	def __init__(self, directory='.', streamQuota=16*1024*1024,
+			globalQuota=1024*1024*1024, maxPending=32*1024*1024,
+			flushInterval=0.5):
+		self.directory = directory
+		self.streamQuota = streamQuota
+		self.globalQuota = globalQuota
+		self.maxPending = maxPending
+		self.flushInterval = flushInterval
+
+		# Dumps with buffered data or a pending close, protected by the
+		# condition's lock
+		self.__cond = threading.Condition()
+		self.__dirty = set()
+		self.__pending = 0
+		self.__passes = 0
+		self.__stopping = False
+
+		# Statistics (each counter is only changed by one thread). Bytes
+		# dropped because of errors are counted separately by the event loop
+		# (data for a closed or failed dump) and by the writer thread (data
+		# that could not be written), see droppedErrors.
+		self.accepted = 0
+		self.written = 0
+		self.droppedQuota = 0
+		self.droppedBacklog = 0
+		self.droppedClosed = 0
+		self.droppedUnwritten = 0
+		self.truncatedStreams = 0
+		self.writeErrors = 0
+
+		self.__thread = threading.Thread(target=self.__run,
+			name="DumpWriter", daemon=True)
+		self.__thread.start()
+
+	def open(self, name):
+		"""Returns a new StreamDump writing to name in the dump directory (the
+		file is created by the writer thread)"""
+		return StreamDump(self, os.path.join(self.directory, name),
+			self.streamQuota)
+
+	def append(self, dump, data):
+		"""Buffers data for a dump, called by StreamDump.write"""
+		n = len(data)
+		if dump.closed or dump.failed:
+			self.droppedClosed += n
+			return False
+
+		# A truncated dump stays truncated, so it ends with complete data
+		if dump.truncated or dump.accepted + n > dump.quota or \
+				self.accepted + n > self.globalQuota:
+			if not dump.truncated:
+				dump.truncated = True
+				self.truncatedStreams += 1
+				logger.warning("Dump %s truncated at %s bytes",
+					dump.path, dump.accepted)
+			self.droppedQuota += n
+			return False
+
+		with self.__cond:
+			if self.__pending + n > self.maxPending:
+				self.droppedBacklog += n
+				return False
+
+			dump.buffer += data
+			self.__pending += n
+			self.__dirty.add(dump)
+			if self.__pending >= FLUSH_THRESHOLD:
+				self.__cond.notify_all()
+
+		dump.accepted += n
+		self.accepted += n
+		return True
+
+	def closeDump(self, dump):
+		"""Closes a dump after its buffered data has been written"""
+		with self.__cond:
+			if dump.closed:
+				return
+			dump.closed = True
+			self.__dirty.add(dump)
+
+	def flush(self):
+		"""Waits until everything written so far is on disk"""
+		with self.__cond:
+			target = self.__passes + 2
+			self.__cond.notify_all()
+			while self.__passes < target and self.__thread.is_alive():
+				self.__cond.wait(self.flushInterval)
+
+	def close(self):
+		"""Writes all buffered data and stops the writer thread"""
+		with self.__cond:
+			self.__stopping = True
+			self.__cond.notify_all()
+		self.__thread.join()
+
+	@property
+	def droppedErrors(self):
+		"""Bytes dropped because of errors"""
+		return self.droppedClosed + self.droppedUnwritten
+
+	def stats(self):
+		return {'dump_bytes_accepted': self.accepted,
+			'dump_bytes_written': self.written,
+			'dump_bytes_dropped_quota': self.droppedQuota,
+			'dump_bytes_dropped_backlog': self.droppedBacklog,
+			'dump_bytes_dropped_errors': self.droppedErrors,
+			'dump_streams_truncated': self.truncatedStreams,
+			'dump_write_errors': self.writeErrors}
+
+	def __run(self):
+		while True:
+			with self.__cond:
+				if not self.__stopping and self.__pending < FLUSH_THRESHOLD:
+					self.__cond.wait(self.flushInterval)
+
+				# Take the buffers, the event loop continues with empty ones
+				work = []
+				for dump in self.__dirty:
+					work.append((dump, dump.buffer))
+					self.__pending -= len(dump.buffer)
+					dump.buffer = bytearray()
+				self.__dirty.clear()
+				stopping = self.__stopping
+
+			for dump, data in work:
+				if data:
+					self.__write(dump, data)
+
+			with self.__cond:
+				self.__passes += 1
+				self.__cond.notify_all()
+
+			if stopping and not work:
+				break
+
+	def __write(self, dump, data):
+		if dump.failed:
+			self.droppedUnwritten += len(data)
+			return
+
+		try:
+			with open(dump.path, "ab" if dump.created else "wb") as f:
+				dump.created = True
+				f.write(data)
+		except OSError as e:
+			logger.error("Could not write dump %s: %s", dump.path, e)
+			dump.failed = True
+			self.writeErrors += 1
+			self.droppedUnwritten += len(data)
+			return
+
+		self.written += len(data)
+
+# Dump writer used by all streams (see getDumpWriter)
+g_dumpWriter = None
+
+def getDumpWriter():
+	"""Returns the dump writer, its thread is started on the first call"""
+	global g_dumpWriter
+	if g_dumpWriter is None:
+		g_dumpWriter = DumpWriter(g_sipconfig['dump_directory'],
+			g_sipconfig['dump_stream_quota'], g_sipconfig['dump_global_quota'],
+			g_sipconfig['dump_max_pending'], g_sipconfig['dump_flush_interval'])
+	return g_dumpWriter
@@ -0,0 +1,251 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Structured events of every handled SIP request, authentication attempt and
+# session state change, stored in a SQLite database for later analysis. The
+# event loop only appends a tuple to a list, a writer thread inserts the
+# events in batches (one transaction each) into a database in WAL mode, so
+# that analysts can query it while the honeypot is running. The columns
+# needed to find events (time, source address, Call-ID, user agent) are
+# indexed. Requests are stored as received (message column), the details of
+# other events as JSON (data column).
+#
+################################################################################
+
+import sys
+import time
+import json
+import sqlite3
+import threading
+
+import logqueue
+from config import g_config
+
+# Logging
+logger = logqueue.getLogger("eventstore")
+
+g_sipconfig = g_config['modules']['python']['sip']
+
+# Event types besides the SIP methods (INVITE, OPTIONS, ...): results of
+# authentication and session state changes
+AUTH = "auth"
+SESSION_SETUP = "session_setup"
+SESSION_ACTIVE = "session_active"
+SESSION_TEARDOWN = "session_teardown"
+SESSION_CLOSED = "session_closed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+	id INTEGER PRIMARY KEY,
+	time REAL NOT NULL,
+	type TEXT NOT NULL,
+	source TEXT,
+	port INTEGER,
+	call_id TEXT,
+	user_agent TEXT,
+	message BLOB,
+	data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_source ON events (source, time);
+CREATE INDEX IF NOT EXISTS events_call_id ON events (call_id);
+CREATE INDEX IF NOT EXISTS events_user_agent ON events (user_agent, time);
+"""
+
+INSERT = "INSERT INTO events (time, type, source, port, call_id, user_agent, " \
+	"message, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+# Compact JSON for the data column
+encodeData = json.JSONEncoder(separators=(',', ':')).encode
+
+# Columns that can be used to filter events in query()
+FILTERS = {'type': 'type', 'source': 'source', 'callId': 'call_id',
+	'userAgent': 'user_agent'}
+
+def openDatabase(path, timeout=10):
+	"""Opens (and creates) an event database in WAL mode: readers do not
+	block the writer, and a commit does not wait for the disk"""
+	db = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+	db.execute("PRAGMA journal_mode=WAL")
+	db.execute("PRAGMA synchronous=NORMAL")
+	db.executescript(SCHEMA)
+	return db
+
+def query(db, since=None, until=None, limit=1000, **filters):
+	"""Returns the events (rows of the events table, oldest first) matching
+	all given filters (see FILTERS) in the time range [since, until)"""
+	clauses = []
+	params = []
+	for name, value in filters.items():
+		if value is not None:
+			clauses.append("{} = ?".format(FILTERS[name]))
+			params.append(value)
+	if since is not None:
+		clauses.append("time >= ?")
+		params.append(since)
+	if until is not None:
+		clauses.append("time < ?")
+		params.append(until)
+
+	sql = "SELECT * FROM events"
+	if clauses:
+		sql += " WHERE " + " AND ".join(clauses)
+	sql += " ORDER BY time LIMIT ?"
+	params.append(limit)
+	return db.execute(sql, params).fetchall()
+
+class EventStore(object):
+	"""Collects events in memory and writes them to the database from a
+	background thread, every flushInterval seconds or as soon as batchSize
+	events are pending. Events are dropped (and counted) when maxPending
+	events wait for the database or when writing fails."""
+	def __init__(self, path, batchSize=5000, flushInterval=0.5,
+			maxPending=100000):
+		self.path = path
+		self.batchSize = batchSize
+		self.flushInterval = flushInterval
+		self.maxPending = maxPending
+		self.__db = openDatabase(path)
+
+		# Events not yet taken by the writer thread, protected by the
+		# condition's lock
+		self.__cond = threading.Condition()
+		self.__pending = []
+		self.__passes = 0
+		self.__stopping = False
+
+		# Statistics (each counter is only changed by one thread)
+		self.added = 0
+		self.written = 0
+		self.dropped = 0
+		self.droppedErrors = 0
+		self.batches = 0
+		self.writeErrors = 0
+
+		self.__thread = threading.Thread(target=self.__run,
+			name="EventStore", daemon=True)
+		self.__thread.start()
+
+	def add(self, kind, source, port, callId=None, userAgent=None,
+			message=None, data=None):
+		"""Queues an event, message is the raw SIP message (bytes) and data a
+		dictionary (encoded as JSON by the writer thread, so it must not be
+		changed afterwards). Returns False if the event has been dropped."""
+		event = (time.time(), kind, source, port, callId, userAgent, message,
+			data)
+		with self.__cond:
+			pending = self.__pending
+			if len(pending) >= self.maxPending:
+				self.dropped += 1
+				return False
+
+			pending.append(event)
+			if len(pending) == self.batchSize:
+				self.__cond.notify_all()
+
+		self.added += 1
+		return True
+
+	def flush(self):
+		"""Waits until all events added so far are in the database"""
+		with self.__cond:
+			target = self.__passes + 2
+			self.__cond.notify_all()
+			while self.__passes < target and self.__thread.is_alive():
+				self.__cond.wait(self.flushInterval)
+
+	def close(self):
+		"""Writes all pending events and stops the writer thread"""
+		with self.__cond:
+			self.__stopping = True
+			self.__cond.notify_all()
+		self.__thread.join()
+		self.__db.close()
+
+	def stats(self):
+		return {'events_added': self.added,
+			'events_written': self.written,
+			'events_dropped_backlog': self.dropped,
+			'events_dropped_errors': self.droppedErrors,
+			'event_batches': self.batches,
+			'event_write_errors': self.writeErrors}
+
+	def __run(self):
+		while True:
+			with self.__cond:
+				if not self.__stopping and \
+						len(self.__pending) < self.batchSize:
+					self.__cond.wait(self.flushInterval)
+
+				# Take the pending events, the event loop continues with an
+				# empty list
+				work = self.__pending
+				self.__pending = []
+				stopping = self.__stopping
+
+			if work:
+				self.__write(work)
+
+			with self.__cond:
+				self.__passes += 1
+				self.__cond.notify_all()
+
+			if stopping and not work:
+				break
+
+	def __write(self, events):
+		rows = [event[:7] + (encodeData(event[7]) if event[7] else None,)
+			for event in events]
+
+		try:
+			with self.__db:
+				self.__db.executemany(INSERT, rows)
+		except sqlite3.Error as e:
+			logger.error("Could not write %s events to %s: %s", len(rows),
+				self.path, e)
+			self.writeErrors += 1
+			self.droppedErrors += len(rows)
+			return
+
+		self.batches += 1
+		self.written += len(rows)
+
+# Event store used by all SIP connections (see getEventStore)
+g_eventStore = None
+
+def getEventStore():
+	"""Returns the event store, opening the database on the first call, or
+	None if events are not stored (no event_database)"""
+	global g_eventStore
+	if g_eventStore is None and g_sipconfig['event_database']:
+		g_eventStore = EventStore(g_sipconfig['event_database'],
+			g_sipconfig['event_batch_size'],
+			g_sipconfig['event_flush_interval'],
+			g_sipconfig['event_max_pending'])
+	return g_eventStore
+
+if __name__ == '__main__':
+	# eventstore.py DATABASE [source=... callId=... userAgent=... type=...]
+	filters = dict(arg.split("=", 1) for arg in sys.argv[2:])
+	for row in query(openDatabase(sys.argv[1]), **filters):
+		print("{} {} {}:{} {} {} {}".format(time.strftime("%Y-%m-%d %H:%M:%S",
+			time.localtime(row[1])), *row[2:7], row[8]))
@@ -0,0 +1,114 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# G.711 μ-law (PCMU) and A-law (PCMA) codec with NumPy. Decoding uses the
+# 256-entry tables of the 16 bit linear value of every code, encoding uses
+# tables of the code of every 16 bit linear value (65536 entries), so both
+# directions are a single table lookup per sample. The tables are computed
+# once with the segment arithmetic of the ITU-T G.711 reference
+# implementation.
+#
+################################################################################
+
+import numpy as np
+
+# RTP payload types (RFC 3551)
+PCMU, PCMA = 0, 8
+SAMPLE_RATE = 8000
+
+# μ-law bias and the clip level of the 14 bit magnitude, and the segment end
+# points of both laws
+ULAW_BIAS = 0x84
+ULAW_CLIP = 8159
+ULAW_SEGMENTS = np.array([0x3f, 0x7f, 0xff, 0x1ff, 0x3ff, 0x7ff, 0xfff,
+	0x1fff])
+ALAW_SEGMENTS = np.array([0x1f, 0x3f, 0x7f, 0xff, 0x1ff, 0x3ff, 0x7ff,
+	0xfff])
+
+def _ulawToLinear(codes):
+	u = ~codes & 0xff
+	t = (((u & 0x0f) << 3) + ULAW_BIAS) << ((u & 0x70) >> 4)
+	return np.where(u & 0x80, ULAW_BIAS - t, t - ULAW_BIAS)
+
+def _alawToLinear(codes):
+	a = codes ^ 0x55
+	segment = (a & 0x70) >> 4
+	t = (a & 0x0f) << 4
+	t = np.where(segment == 0, t + 8,
+		(t + 0x108) << np.maximum(segment - 1, 0))
+	return np.where(a & 0x80, t, -t)
+
+def _linearToUlaw(samples):
+	pcm = samples >> 2
+	mask = np.where(pcm < 0, 0x7f, 0xff)
+	pcm = np.minimum(np.abs(pcm), ULAW_CLIP) + (ULAW_BIAS >> 2)
+	segment = np.searchsorted(ULAW_SEGMENTS, pcm)
+	code = (segment << 4) | ((pcm >> (segment + 1)) & 0x0f)
+	return np.where(segment >= 8, 0x7f, code) ^ mask
+
+def _linearToAlaw(samples):
+	pcm = samples >> 3
+	mask = np.where(pcm >= 0, 0xd5, 0x55)
+	pcm = np.where(pcm >= 0, pcm, -pcm - 1)
+	segment = np.searchsorted(ALAW_SEGMENTS, pcm)
+	code = (segment << 4) | ((pcm >> np.maximum(segment, 1)) & 0x0f)
+	return np.where(segment >= 8, 0x7f, code) ^ mask
+
+# Decoding tables indexed by code, encoding tables indexed by the linear
+# value as unsigned 16 bit number
+_codes = np.arange(256, dtype=np.int64)
+_linear = np.arange(65536, dtype=np.uint16).view(np.int16).astype(
+	np.int64)
+ULAW_DECODE = _ulawToLinear(_codes).astype(np.int16)
+ALAW_DECODE = _alawToLinear(_codes).astype(np.int16)
+ULAW_ENCODE = _linearToUlaw(_linear).astype(np.uint8)
+ALAW_ENCODE = _linearToAlaw(_linear).astype(np.uint8)
+del _codes, _linear
+
+DECODE_TABLES = {PCMU: ULAW_DECODE, PCMA: ALAW_DECODE}
+ENCODE_TABLES = {PCMU: ULAW_ENCODE, PCMA: ALAW_ENCODE}
+
+class CodecError(Exception):
+	"""Raised for payload types that are not G.711"""
+
+def codes(data):
+	"""Codes of data (bytes-like object or uint8 array) as uint8 array"""
+	if isinstance(data, np.ndarray):
+		return data
+	return np.frombuffer(data, dtype=np.uint8)
+
+def decode(data, payloadType=PCMU):
+	"""16 bit linear samples (int16 array) of PCMU or PCMA data"""
+	try:
+		table = DECODE_TABLES[payloadType]
+	except KeyError:
+		raise CodecError("Payload type {} is not G.711".format(payloadType))
+	return table[codes(data)]
+
+def encode(samples, payloadType=PCMU):
+	"""PCMU or PCMA codes (uint8 array) of 16 bit linear samples, use
+	tobytes() for an RTP payload"""
+	try:
+		table = ENCODE_TABLES[payloadType]
+	except KeyError:
+		raise CodecError("Payload type {} is not G.711".format(payloadType))
+	return table[np.asarray(samples, dtype=np.int16).view(np.uint16)]
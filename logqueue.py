@@ -0,0 +1,151 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Logging without blocking the event loop: the loggers of all modules put
+# their records into one bounded queue, a background thread formats them and
+# writes them to the console. Messages are formatted lazily (logger.info("...
+# %s", value)), so records below the level cost nothing and the formatting
+# happens in the writer thread. Each call site (category) may log rate
+# records per second on average, the number of suppressed records is added
+# to the next one that passes.
+#
+################################################################################
+
+import os
+import queue
+import atexit
+import logging
+import logging.handlers
+
+from ratelimit import TokenBucketLimiter
+from config import g_config
+
+g_sipconfig = g_config['modules']['python']['sip']
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+class RateLimitFilter(logging.Filter):
+	"""Limits the records of each call site (source file and line) to rate per
+	second with bursts of burst records, using token buckets"""
+	def __init__(self, rate, burst):
+		logging.Filter.__init__(self)
+		self.__limiter = TokenBucketLimiter(rate, burst)
+
+		# Records suppressed per call site since the last one that passed
+		self.__suppressed = {}
+		self.suppressed = 0
+
+	def filter(self, record):
+		key = (record.pathname, record.lineno)
+		if not self.__limiter.allow(key, record.created):
+			self.__suppressed[key] = self.__suppressed.get(key, 0) + 1
+			self.suppressed += 1
+			return False
+
+		if self.__suppressed:
+			count = self.__suppressed.pop(key, 0)
+			if count:
+				record.suppressed = count
+		return True
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+	"""Puts records into the queue as they are (the writer thread formats
+	them, so arguments must not be changed after logging) and drops them if
+	it holds maxsize records. A SimpleQueue is used, it is implemented in C
+	and does not need the condition variables of a bounded Queue."""
+	def __init__(self, maxsize):
+		logging.handlers.QueueHandler.__init__(self, queue.SimpleQueue())
+		self.maxsize = maxsize
+		self.dropped = 0
+
+	def prepare(self, record):
+		return record
+
+	def enqueue(self, record):
+		if self.queue.qsize() >= self.maxsize:
+			self.dropped += 1
+			return
+		self.queue.put_nowait(record)
+
+class SuppressedFormatter(logging.Formatter):
+	"""Adds the number of suppressed records of the call site"""
+	def format(self, record):
+		s = logging.Formatter.format(self, record)
+		count = getattr(record, 'suppressed', 0)
+		if count:
+			s += " ({} similar messages suppressed)".format(count)
+		return s
+
+# Handler shared by all loggers and the thread writing its queue (see
+# getLogger)
+g_handler = None
+g_listener = None
+
+def __startListener():
+	global g_listener
+	console = logging.StreamHandler()
+	console.setFormatter(SuppressedFormatter(LOG_FORMAT))
+	g_listener = logging.handlers.QueueListener(g_handler.queue, console)
+	g_listener.start()
+
+def __stopListener():
+	if g_listener is not None and g_listener._thread is not None:
+		g_listener.stop()
+
+def __afterFork():
+	"""The writer thread does not survive fork(), a child process gets its own
+	queue and thread"""
+	if g_handler is not None:
+		g_handler.queue = queue.SimpleQueue()
+		__startListener()
+
+def getHandler():
+	global g_handler
+	if g_handler is None:
+		g_handler = LazyQueueHandler(g_sipconfig['log_queue_size'])
+		if g_sipconfig['log_rate'] > 0:
+			g_handler.addFilter(RateLimitFilter(g_sipconfig['log_rate'],
+				g_sipconfig['log_burst']))
+		__startListener()
+		atexit.register(__stopListener)
+		os.register_at_fork(after_in_child=__afterFork)
+	return g_handler
+
+def getLogger(name):
+	"""Returns the logger name writing through the queue"""
+	logger = logging.getLogger(name)
+	logger.setLevel(g_sipconfig['log_level'])
+	if not logger.handlers:
+		logger.addHandler(getHandler())
+	return logger
+
+def flush():
+	"""Waits until all queued records have been written"""
+	if g_listener is not None and g_listener._thread is not None:
+		g_listener.stop()
+		g_listener.start()
+
+def stats():
+	if g_handler is None:
+		return {}
+	suppressed = sum(f.suppressed for f in g_handler.filters)
+	return {'log_dropped': g_handler.dropped, 'log_suppressed': suppressed}
@@ -0,0 +1,177 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import socket
+import logqueue
+from collections import deque
+
+import connection
+from config import g_config
+
+# Logging
+logger = logqueue.getLogger("media")
+
+g_sipconfig = g_config['modules']['python']['sip']
+
+# Largest RTP packet that is received (RTP over UDP stays below the MTU)
+MAX_PACKET_SIZE = 2048
+
+# Packets read from one port per readiness event
+READ_BATCH_SIZE = 32
+
+class MediaError(Exception):
+	"""Raised when no RTP port is available"""
+
+class MediaManager(object):
+	"""Binds all RTP ports of a contiguous range at startup and hands them
+	out to RTP streams from a free list. All sockets are registered with the
+	event loop, received packets are passed to the stream owning the local
+	port (packets for ports without a stream are dropped)."""
+	def __init__(self, address='', firstPort=30000, count=1000):
+		self.address = address
+		self.__loop = connection.getLoop()
+
+		# Local port -> socket, and local port -> stream using it
+		self.__sockets = {}
+		self.__owners = {}
+
+		# Ports are reused in the order they were released, so that late
+		# packets of an old call are unlikely to reach the next one
+		self.__free = deque()
+
+		for port in range(firstPort, firstPort + count):
+			sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			try:
+				sock.bind((address, port))
+			except OSError as e:
+				logger.warning("Could not bind RTP port %s: %s", port, e)
+				sock.close()
+				continue
+
+			sock.setblocking(False)
+			self.__sockets[port] = sock
+			self.__free.append(port)
+			self.__loop.add_reader(sock.fileno(), self.__readReady, port)
+
+		logger.info("RTP ports %s-%s: %s available", firstPort,
+			firstPort + count - 1, len(self.__free))
+
+		# Receive buffer shared by all ports
+		self.__buffer = bytearray(MAX_PACKET_SIZE)
+
+		# Statistics
+		self.received = 0
+		self.sent = 0
+		self.stray = 0
+
+	def __len__(self):
+		"""Number of ports in use"""
+		return len(self.__owners)
+
+	def available(self):
+		"""Number of free ports"""
+		return len(self.__free)
+
+	def allocate(self, stream):
+		"""Assigns a free port to the stream (which receives packets in
+		handle_packet(data, address)), returns the port or None"""
+		if not self.__free:
+			return None
+
+		port = self.__free.popleft()
+		self.__owners[port] = stream
+		return port
+
+	def release(self, port):
+		"""Returns a port to the free list"""
+		if self.__owners.pop(port, None) is not None:
+			self.__free.append(port)
+
+	def sendto(self, port, data, address):
+		"""Sends an RTP packet from a local port, packets that cannot be sent
+		right away are dropped (as they could be on the network)"""
+		try:
+			self.__sockets[port].sendto(data, address)
+		except (BlockingIOError, InterruptedError):
+			return 0
+		except OSError as e:
+			# ICMP errors of earlier packets (e.g. port unreachable)
+			logger.debug("RTP port %s: %s", port, e)
+			return 0
+		self.sent += 1
+		return len(data)
+
+	def __readReady(self, port):
+		sock = self.__sockets[port]
+		buf = self.__buffer
+		for i in range(READ_BATCH_SIZE):
+			try:
+				nbytes, address = sock.recvfrom_into(buf)
+			except (BlockingIOError, InterruptedError):
+				break
+			except OSError as e:
+				# ICMP errors caused by packets sent from this port
+				logger.debug("RTP port %s: %s", port, e)
+				continue
+
+			stream = self.__owners.get(port)
+			if stream is None:
+				self.stray += 1
+				continue
+
+			self.received += 1
+			try:
+				stream.handle_packet(bytes(buf[:nbytes]), address)
+			except Exception:
+				logger.exception("Unhandled exception in RTP stream")
+
+	def stats(self):
+		return {'rtp_ports_used': len(self.__owners),
+			'rtp_ports_free': len(self.__free),
+			'rtp_received': self.received, 'rtp_sent': self.sent,
+			'rtp_stray': self.stray}
+
+	def close(self):
+		for port, sock in self.__sockets.items():
+			self.__loop.remove_reader(sock.fileno())
+			sock.close()
+		self.__sockets.clear()
+		self.__owners.clear()
+		self.__free.clear()
+
+# Media manager used by all RTP streams (see getMediaManager)
+g_mediaManager = None
+
+def getMediaManager():
+	"""Returns the media manager, the port range from the SIP configuration
+	is bound on the first call"""
+	global g_mediaManager
+	if g_mediaManager is None:
+		g_mediaManager = MediaManager(g_sipconfig['rtp_ip'],
+			g_sipconfig['rtp_port_start'], g_sipconfig['rtp_port_count'])
+	return g_mediaManager
+
+def setMediaManager(manager):
+	"""Replaces the media manager (e.g. with one for a part of the port
+	range in worker processes)"""
+	global g_mediaManager
+	g_mediaManager = manager
@@ -0,0 +1,286 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Metrics of the SIP server in the Prometheus text format: counters with
+# labels, histograms with fixed buckets and values collected from stats
+# dictionaries when the metrics are scraped. Updating a metric is a dictionary
+# or list update, so it can be done for every message. The metrics are served
+# over HTTP on a local TCP port or Unix socket by the event loop.
+#
+################################################################################
+
+import os
+import socket
+import bisect
+
+import logqueue
+from connection import connection
+from config import g_config
+
+# Logging
+logger = logqueue.getLogger("metrics")
+
+g_sipconfig = g_config['modules']['python']['sip']
+
+# Upper bounds (seconds) of the latency histogram buckets, the last bucket
+# (+Inf) takes everything above
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+	0.0025, 0.005, 0.01, 0.025, 0.1)
+
+# Size limit of a scrape request, and the content type of the text format
+MAX_REQUEST_SIZE = 8192
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def escape(value):
+	if isinstance(value, bytes):
+		value = value.decode('utf-8', 'replace')
+	return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace(
+		"\n", "\\n")
+
+def formatLabels(names, values, extra=""):
+	labels = ["{}=\"{}\"".format(n, escape(v)) for n, v in zip(names, values)]
+	if extra:
+		labels.append(extra)
+	return "{" + ",".join(labels) + "}" if labels else ""
+
+def formatValue(value):
+	if isinstance(value, float):
+		if value == float("inf"):
+			return "+Inf"
+		return repr(value)
+	return str(value)
+
+class Counter(object):
+	"""Counter with a value per combination of label values. The label values
+	must come from a small set, never from the network directly."""
+	__slots__ = ("name", "help", "labels", "values")
+
+	def __init__(self, name, help, labels=()):
+		self.name = name
+		self.help = help
+		self.labels = labels
+
+		# Tuple of label values -> count
+		self.values = {}
+
+	def inc(self, key=(), amount=1):
+		values = self.values
+		values[key] = values.get(key, 0) + amount
+
+	def render(self, lines):
+		lines.append("# HELP {} {}".format(self.name, self.help))
+		lines.append("# TYPE {} counter".format(self.name))
+		for key, value in sorted(self.values.items()):
+			lines.append("{}{} {}".format(self.name,
+				formatLabels(self.labels, key), formatValue(value)))
+
+class Histogram(object):
+	"""Histogram with fixed bucket bounds (le), the count of each bucket is
+	only made cumulative when rendered"""
+	__slots__ = ("name", "help", "buckets", "counts", "sum")
+
+	def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+		self.name = name
+		self.help = help
+		self.buckets = list(buckets)
+		self.counts = [0] * (len(buckets) + 1)
+		self.sum = 0.0
+
+	def observe(self, value):
+		self.counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.sum += value
+
+	@property
+	def count(self):
+		return sum(self.counts)
+
+	def render(self, lines):
+		lines.append("# HELP {} {}".format(self.name, self.help))
+		lines.append("# TYPE {} histogram".format(self.name))
+		total = 0
+		for bound, count in zip(self.buckets + [float("inf")], self.counts):
+			total += count
+			lines.append("{}_bucket{{le=\"{}\"}} {}".format(self.name,
+				formatValue(bound), total))
+		lines.append("{}_sum {}".format(self.name, formatValue(self.sum)))
+		lines.append("{}_count {}".format(self.name, total))
+
+class StatsCollector(object):
+	"""Exports the values of a stats dictionary (e.g. Sip.stats) as metrics
+	named prefix + key, the keys in gauges as gauges and all others as
+	counters"""
+	def __init__(self, function, prefix="sip_", gauges=()):
+		self.function = function
+		self.prefix = prefix
+		self.gauges = gauges
+
+	def render(self, lines):
+		for key, value in sorted(self.function().items()):
+			if key in self.gauges:
+				name, kind = self.prefix + key, "gauge"
+			else:
+				name, kind = self.prefix + key + "_total", "counter"
+			lines.append("# TYPE {} {}".format(name, kind))
+			lines.append("{} {}".format(name, formatValue(value)))
+
+class Registry(object):
+	"""All metrics of the process, rendered in the order of registration"""
+	def __init__(self):
+		self.__metrics = {}
+
+	def __register(self, name, metric):
+		if name in self.__metrics:
+			raise ValueError("Metric {} already registered".format(name))
+		self.__metrics[name] = metric
+		return metric
+
+	def counter(self, name, help, labels=()):
+		return self.__register(name, Counter(name, help, labels))
+
+	def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+		return self.__register(name, Histogram(name, help, buckets))
+
+	def collect(self, name, function, prefix="sip_", gauges=()):
+		"""Exports the stats dictionary returned by function (see
+		StatsCollector), name identifies the collector"""
+		return self.__register(name, StatsCollector(function, prefix, gauges))
+
+	def unregister(self, name):
+		self.__metrics.pop(name, None)
+
+	def get(self, name):
+		return self.__metrics.get(name)
+
+	def render(self):
+		"""Returns all metrics in the Prometheus text format"""
+		lines = []
+		for metric in self.__metrics.values():
+			metric.render(lines)
+		lines.append("")
+		return "\n".join(lines)
+
+class MetricsConnection(connection):
+	"""Accepted scrape connection: answers one HTTP request and closes"""
+	def __init__(self, sock, registry):
+		connection.__init__(self, 'tcp', sock)
+		self.__registry = registry
+		self.__request = bytearray()
+		self.__sendBuffer = bytearray()
+
+	def readable(self):
+		return not self.__sendBuffer
+
+	def writable(self):
+		return len(self.__sendBuffer) > 0
+
+	def handle_read(self):
+		data = self.recv(4096)
+		if not data:
+			return
+
+		self.__request += data
+		if b"\r\n\r\n" not in self.__request and \
+				b"\n\n" not in self.__request:
+			if len(self.__request) > MAX_REQUEST_SIZE:
+				self.close()
+			return
+
+		requestLine = bytes(self.__request.split(b"\n", 1)[0]).split()
+		method = requestLine[0] if requestLine else b""
+		if len(requestLine) >= 2 and method in (b"GET", b"HEAD") and \
+				requestLine[1].split(b"?")[0] in (b"/", b"/metrics"):
+			status = "200 OK"
+			body = self.__registry.render().encode('utf-8')
+		else:
+			status = "404 Not Found"
+			body = b"Not found\n"
+
+		self.__sendBuffer += "HTTP/1.0 {}\r\nContent-Type: {}\r\n" \
+			"Content-Length: {}\r\nConnection: close\r\n\r\n".format(status,
+			CONTENT_TYPE, len(body)).encode('utf-8')
+		if method != b"HEAD":
+			self.__sendBuffer += body
+
+	def handle_write(self):
+		bytesSent = connection.send(self, self.__sendBuffer)
+		del self.__sendBuffer[:bytesSent]
+
+		if not self.__sendBuffer:
+			self.close()
+
+class MetricsServer(connection):
+	"""Listening scrape endpoint: "host:port" or the path of a Unix socket
+	(starting with "/")"""
+	def __init__(self, registry, address):
+		self.registry = registry
+		self.address = address
+
+		if address.startswith("/"):
+			# The listening Unix socket is handed to the connection like an
+			# accepted one, listen() makes it accept connections
+			if os.path.exists(address):
+				os.unlink(address)
+			sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			sock.bind(address)
+			connection.__init__(self, 'tcp', sock)
+			self.connected = False
+		else:
+			host, _, port = address.rpartition(":")
+			connection.__init__(self, 'tcp')
+			self.set_reuse_addr()
+			self.bind((host or "127.0.0.1", int(port)))
+
+		self.listen(16)
+		logger.info("Serving metrics on %s", address)
+
+	def handle_accept(self):
+		pair = self.accept()
+		if pair is None:
+			return
+
+		MetricsConnection(pair[0], self.registry)
+
+	def close(self):
+		if self.socket is not None and self.address.startswith("/"):
+			try:
+				os.unlink(self.address)
+			except OSError:
+				pass
+		connection.close(self)
+
+# Registry of the process (see getRegistry)
+g_registry = None
+
+def getRegistry():
+	global g_registry
+	if g_registry is None:
+		g_registry = Registry()
+	return g_registry
+
+def serve(address=None):
+	"""Starts the scrape endpoint of the registry on address (default
+	metrics_address), returns None if no address is configured"""
+	if address is None:
+		address = g_sipconfig['metrics_address']
+	if not address:
+		return None
+	return MetricsServer(getRegistry(), address)
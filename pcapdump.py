@@ -0,0 +1,233 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Stream dumps in pcap format: every RTP packet is stored with its capture
+# time and synthesized IPv4 and UDP headers, source and destination tell the
+# direction and the remote address. A sidecar index (<dump>.idx) has a fixed
+# size entry per packet (time, file offset, payload length, direction), so a
+# reader can binary search for a point in time without scanning the dump.
+#
+################################################################################
+
+import os
+import time
+import socket
+import struct
+from collections import namedtuple
+
+# pcap file header (microsecond timestamps, version 2.4) with link type raw
+# IPv4, and the header of each record
+PCAP_MAGIC = 0xa1b2c3d4
+LINKTYPE_RAW = 101
+SNAPLEN = 65535
+PCAP_HEADER = struct.Struct("<IHHiIII")
+RECORD_HEADER = struct.Struct("<IIII")
+
+# IPv4 header without options followed by the UDP header (checksum 0)
+IP_UDP_HEADER = struct.Struct("!BBHHHBBH4s4sHHHH")
+IP_HEADER_SIZE = 20
+UDP_HEADER_SIZE = 8
+IPPROTO_UDP = 17
+TTL = 64
+
+# Index entry: capture time, offset of the pcap record, payload length,
+# direction
+INDEX_ENTRY = struct.Struct("<dQIB3x")
+
+# Packet directions
+INBOUND, OUTBOUND = 0, 1
+
+Packet = namedtuple("Packet", "time direction source destination payload")
+
+class PcapFormatError(Exception):
+	"""Raised for a file that is not a pcap dump"""
+
+def packAddress(address):
+	"""Packed IPv4 address, 0.0.0.0 for anything else (e.g. host names)"""
+	try:
+		return socket.inet_aton(address or "0.0.0.0")
+	except OSError:
+		return b"\0\0\0\0"
+
+def addressSum(packed):
+	"""Sum of the 16 bit words of a packed IPv4 address"""
+	return (packed[0] << 8 | packed[1]) + (packed[2] << 8 | packed[3])
+
+class PcapStreamDump(object):
+	"""Writes the packets of one RTP stream to a pcap dump and its index,
+	both through the dump writer (see dumpwriter.DumpWriter)"""
+	def __init__(self, writer, name, localAddress):
+		self.__pcap = writer.open(name)
+		self.__index = writer.open(name + ".idx")
+		self.__pcap.write(PCAP_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, SNAPLEN,
+			LINKTYPE_RAW))
+
+		self.__local = packAddress(localAddress[0])
+		self.__localPort = localAddress[1]
+		self.__localSum = addressSum(self.__local)
+
+		# Remote address of the last packet (packed and summed)
+		self.__remote = None
+		self.__remotePacked = None
+		self.__remoteSum = 0
+
+		# IP identification field
+		self.__id = 0
+
+	def write(self, data, direction, remote, timestamp=None):
+		"""Adds a packet sent to (OUTBOUND) or received from (INBOUND) the
+		remote (address, port)"""
+		if timestamp is None:
+			timestamp = time.time()
+
+		if remote[0] != self.__remote:
+			self.__remote = remote[0]
+			self.__remotePacked = packAddress(remote[0])
+			self.__remoteSum = addressSum(self.__remotePacked)
+
+		if direction == INBOUND:
+			src, sport = self.__remotePacked, remote[1]
+			dst, dport = self.__local, self.__localPort
+		else:
+			src, sport = self.__local, self.__localPort
+			dst, dport = self.__remotePacked, remote[1]
+
+		# IPv4 header checksum, the address words are summed once per remote
+		n = len(data)
+		totalLength = IP_HEADER_SIZE + UDP_HEADER_SIZE + n
+		self.__id = (self.__id + 1) & 0xffff
+		s = 0x4500 + totalLength + self.__id + (TTL << 8 | IPPROTO_UDP) + \
+			self.__localSum + self.__remoteSum
+		s = (s & 0xffff) + (s >> 16)
+		s = (s & 0xffff) + (s >> 16)
+
+		seconds = int(timestamp)
+		record = RECORD_HEADER.pack(seconds,
+			int((timestamp - seconds) * 1000000), totalLength, totalLength) + \
+			IP_UDP_HEADER.pack(0x45, 0, totalLength, self.__id, 0, TTL,
+			IPPROTO_UDP, ~s & 0xffff, src, dst, sport, dport,
+			UDP_HEADER_SIZE + n, 0) + data
+
+		# The offset is only valid if the record has been accepted, records
+		# are accepted completely or not at all
+		offset = self.__pcap.accepted
+		if self.__pcap.write(record):
+			self.__index.write(INDEX_ENTRY.pack(timestamp, offset, n,
+				direction))
+
+	def close(self):
+		self.__pcap.close()
+		self.__index.close()
+
+class PcapDumpReader(object):
+	"""Reads a pcap dump written by PcapStreamDump. packets() uses the index
+	to seek to a time range, scan() reads the whole dump without it."""
+	def __init__(self, path):
+		self.path = path
+		self.__file = open(path, "rb")
+		header = self.__file.read(PCAP_HEADER.size)
+		if len(header) < PCAP_HEADER.size or \
+				PCAP_HEADER.unpack(header)[0] != PCAP_MAGIC:
+			self.__file.close()
+			raise PcapFormatError("Not a pcap dump: {}".format(path))
+
+		# Only complete index entries are used (the dump may still be written)
+		self.__index = None
+		self.__count = 0
+		indexPath = path + ".idx"
+		if os.path.exists(indexPath):
+			self.__index = open(indexPath, "rb")
+			self.__count = os.path.getsize(indexPath) // INDEX_ENTRY.size
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def __len__(self):
+		"""Number of indexed packets"""
+		return self.__count
+
+	def close(self):
+		self.__file.close()
+		if self.__index:
+			self.__index.close()
+
+	def entry(self, i):
+		"""Index entry i: (time, offset, length, direction)"""
+		self.__index.seek(i * INDEX_ENTRY.size)
+		return INDEX_ENTRY.unpack(self.__index.read(INDEX_ENTRY.size))
+
+	def find(self, t):
+		"""Number of the first indexed packet captured at or after t (binary
+		search, O(log n) reads of the index)"""
+		lo, hi = 0, self.__count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self.entry(mid)[0] < t:
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo
+
+	def __readRecord(self):
+		"""Reads the record at the current position, returns (time, source,
+		destination, payload) or None at the end of the file"""
+		header = self.__file.read(RECORD_HEADER.size)
+		if len(header) < RECORD_HEADER.size:
+			return None
+
+		seconds, micros, length, _ = RECORD_HEADER.unpack(header)
+		data = self.__file.read(length)
+		if len(data) < length:
+			return None
+
+		fields = IP_UDP_HEADER.unpack_from(data)
+		source = (socket.inet_ntoa(fields[8]), fields[10])
+		destination = (socket.inet_ntoa(fields[9]), fields[11])
+		return (seconds + micros / 1000000.0, source, destination,
+			data[IP_HEADER_SIZE + UDP_HEADER_SIZE:])
+
+	def packets(self, start=None, end=None):
+		"""Yields the packets captured in [start, end) using the index"""
+		first = 0 if start is None else self.find(start)
+		for i in range(first, self.__count):
+			t, offset, length, direction = self.entry(i)
+			if end is not None and t >= end:
+				break
+
+			self.__file.seek(offset)
+			record = self.__readRecord()
+			if record is None:
+				break
+			yield Packet(t, direction, record[1], record[2], record[3])
+
+	def scan(self):
+		"""Yields all packets by reading the dump sequentially (direction is
+		None, it is not stored in the pcap records)"""
+		self.__file.seek(PCAP_HEADER.size)
+		while True:
+			record = self.__readRecord()
+			if record is None:
+				break
+			yield Packet(record[0], None, record[1], record[2], record[3])
@@ -0,0 +1,216 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Playback of a prerecorded announcement to active sessions. The announcement
+# is encoded into RTP packets once, all streams are paced by one scheduler
+# that sends the next packet of every stream each 20ms. Packets are sent from
+# the announcement's buffer after patching sequence number, timestamp and
+# SSRC of the stream in place, so sending allocates nothing.
+#
+################################################################################
+
+import os
+import wave
+import random
+import struct
+import logqueue
+
+import connection
+from rtpstats import RTP_HEADER, RTP_VERSION
+from config import g_config
+
+# Logging
+logger = logqueue.getLogger("playback")
+
+g_sipconfig = g_config['modules']['python']['sip']
+
+# PCMU (the only payload type offered in our SDP), 20ms packets
+PAYLOAD_TYPE = 0
+SAMPLE_RATE = 8000
+PACKET_TIME = 0.02
+PACKET_SAMPLES = 160
+ULAW_SILENCE = 0xff
+
+# Sequence number, timestamp and SSRC, patched into each packet
+RTP_VARIABLE = struct.Struct("!HII")
+RTP_VARIABLE_OFFSET = 2
+
+class Announcement(object):
+	"""μ-law audio as a buffer of RTP packets of 20ms with the fixed header
+	fields filled in (the marker bit is set on the first packet)"""
+	def __init__(self, codes):
+		frames = max((len(codes) + PACKET_SAMPLES - 1) // PACKET_SAMPLES, 1)
+		self.packetSize = RTP_HEADER.size + PACKET_SAMPLES
+		self.frames = frames
+		self.buffer = bytearray(self.packetSize * frames)
+
+		for i in range(frames):
+			offset = i * self.packetSize
+			payload = codes[i * PACKET_SAMPLES:(i + 1) * PACKET_SAMPLES]
+			payload += bytes([ULAW_SILENCE]) * (PACKET_SAMPLES - len(payload))
+			RTP_HEADER.pack_into(self.buffer, offset, RTP_VERSION << 6,
+				PAYLOAD_TYPE | (0x80 if i == 0 else 0), 0, 0, 0)
+			self.buffer[offset + RTP_HEADER.size:offset + self.packetSize] = \
+				payload
+		self.__view = memoryview(self.buffer)
+
+	def packet(self, frame, seq, timestamp, ssrc):
+		"""Packet of frame with the given header values (a view of the
+		buffer, valid until the next call)"""
+		offset = frame * self.packetSize
+		RTP_VARIABLE.pack_into(self.buffer, offset + RTP_VARIABLE_OFFSET, seq,
+			timestamp, ssrc)
+		return self.__view[offset:offset + self.packetSize]
+
+def loadAnnouncement(path):
+	"""Reads an announcement from a WAV file (16 bit mono at 8000 Hz, encoded
+	with g711, which requires NumPy) or a file of raw μ-law codes"""
+	if os.path.splitext(path)[1].lower() != ".wav":
+		with open(path, "rb") as f:
+			return Announcement(f.read())
+
+	import g711
+	with wave.open(path, "rb") as f:
+		if f.getnchannels() != 1 or f.getsampwidth() != 2 or \
+				f.getframerate() != SAMPLE_RATE:
+			raise ValueError("{}: WAV file must be 16 bit mono at {} Hz".format(
+				path, SAMPLE_RATE))
+		samples = f.readframes(f.getnframes())
+	return Announcement(g711.encode(g711.codes(samples).view("<i2"),
+		g711.PCMU).tobytes())
+
+class Playback(object):
+	"""Playback state of one stream: random SSRC, sequence number and
+	timestamp as recommended by RFC 3550, and the next frame"""
+	__slots__ = ("stream", "ssrc", "seq", "timestamp", "frame")
+
+	def __init__(self, stream):
+		self.stream = stream
+		self.ssrc = random.getrandbits(32)
+		self.seq = random.getrandbits(16)
+		self.timestamp = random.getrandbits(32)
+		self.frame = 0
+
+class PlaybackScheduler(object):
+	"""Sends the announcement to all playing streams from a single timer every
+	interval. Deadlines are absolute (no drift), if the loop falls behind by
+	whole intervals the missed packets are skipped (timestamp and frame move
+	on, the sequence numbers stay contiguous)."""
+	def __init__(self, announcement, repeat=True, interval=PACKET_TIME):
+		self.announcement = announcement
+		self.repeat = repeat
+		self.interval = interval
+		self.__playbacks = {}
+
+		# Timer handle, its event loop and the deadline of the next tick
+		self.__handle = None
+		self.__loop = None
+		self.__next = 0
+
+		# Ticks, packets sent, packets skipped because the loop was late and
+		# the largest lateness of a tick
+		self.ticks = 0
+		self.sent = 0
+		self.skipped = 0
+		self.maxLateness = 0.0
+
+	def __len__(self):
+		return len(self.__playbacks)
+
+	def add(self, stream):
+		"""Starts playing to stream (which has send(data, dump))"""
+		self.__playbacks[stream] = Playback(stream)
+
+		eventLoop = connection.getLoop()
+		if self.__handle is None or self.__loop is not eventLoop:
+			self.__loop = eventLoop
+			self.__next = eventLoop.time() + self.interval
+			self.__handle = eventLoop.call_at(self.__next, self.__tick)
+
+	def remove(self, stream):
+		self.__playbacks.pop(stream, None)
+
+	def __tick(self):
+		now = self.__loop.time()
+		lateness = now - self.__next
+		self.ticks += 1
+		if lateness > self.maxLateness:
+			self.maxLateness = lateness
+		missed = int(lateness / self.interval)
+		self.skipped += missed * len(self.__playbacks)
+
+		announcement = self.announcement
+		frames = announcement.frames
+		advance = missed + 1
+		finished = None
+		for p in self.__playbacks.values():
+			p.stream.send(announcement.packet(p.frame, p.seq, p.timestamp,
+				p.ssrc), False)
+			p.seq = (p.seq + 1) & 0xffff
+			p.timestamp = (p.timestamp + advance * PACKET_SAMPLES) & 0xffffffff
+			p.frame += advance
+			if p.frame >= frames:
+				if self.repeat:
+					p.frame %= frames
+				else:
+					finished = finished or []
+					finished.append(p.stream)
+		self.sent += len(self.__playbacks)
+
+		if finished:
+			for stream in finished:
+				del self.__playbacks[stream]
+
+		if self.__playbacks:
+			self.__next += advance * self.interval
+			self.__handle = self.__loop.call_at(self.__next, self.__tick)
+		else:
+			self.__handle = None
+
+	def stats(self):
+		return {
+			'playback_streams': len(self.__playbacks),
+			'playback_sent': self.sent,
+			'playback_skipped': self.skipped,
+			'playback_max_lateness': self.maxLateness
+		}
+
+	def close(self):
+		if self.__handle is not None:
+			self.__handle.cancel()
+			self.__handle = None
+		self.__playbacks.clear()
+
+# Scheduler shared by all streams of this process (see getPlaybackScheduler)
+g_playbackScheduler = None
+
+def getPlaybackScheduler():
+	"""Returns the shared playback scheduler, loading the announcement on the
+	first call, or None if playback is disabled (no playback_file)"""
+	global g_playbackScheduler
+	if g_playbackScheduler is None and g_sipconfig['playback_file']:
+		announcement = loadAnnouncement(g_sipconfig['playback_file'])
+		logger.info("Loaded announcement %s (%s packets)",
+			g_sipconfig['playback_file'], announcement.frames)
+		g_playbackScheduler = PlaybackScheduler(announcement,
+			g_sipconfig['playback_repeat'])
+	return g_playbackScheduler
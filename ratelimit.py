@@ -0,0 +1,86 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import time
+from collections import OrderedDict
+
+def sourceKey(address, prefix24=False):
+	"""Key of a source address for the rate limiter: the address itself or
+	its /24 network (IPv4)"""
+	if prefix24 and address.count(".") == 3:
+		return address.rpartition(".")[0]
+	return address
+
+class TokenBucketLimiter(object):
+	"""Per-source token buckets: each source may send burst datagrams at
+	once and rate datagrams per second on average. The buckets are kept in a
+	bounded LRU table, the least recently seen source is evicted when it is
+	full (an evicted source starts again with a full bucket)."""
+	def __init__(self, rate, burst, maxSources=65536):
+		self.rate = rate
+		self.burst = burst
+		self.__maxSources = maxSources
+
+		# Source key -> [tokens, time of the last update]
+		self.__buckets = OrderedDict()
+
+		# Statistics
+		self.allowed = 0
+		self.shed = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self.__buckets)
+
+	def allow(self, key, now=None):
+		"""Takes a token from the bucket of key, returns False if it is empty
+		and the datagram has to be shed"""
+		if now is None:
+			now = time.monotonic()
+
+		buckets = self.__buckets
+		bucket = buckets.get(key)
+		if bucket is None:
+			if len(buckets) >= self.__maxSources:
+				buckets.popitem(last=False)
+				self.evictions += 1
+			buckets[key] = [self.burst - 1, now]
+			self.allowed += 1
+			return True
+
+		buckets.move_to_end(key)
+		tokens = bucket[0] + (now - bucket[1]) * self.rate
+		if tokens > self.burst:
+			tokens = self.burst
+		bucket[1] = now
+
+		if tokens < 1:
+			bucket[0] = tokens
+			self.shed += 1
+			return False
+
+		bucket[0] = tokens - 1
+		self.allowed += 1
+		return True
+
+	def clear(self):
+		self.__buckets.clear()
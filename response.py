@@ -0,0 +1,67 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import string
+
+def compileFormat(text):
+	"""Compiles a template string with "{name}" (string) and "{name:d}"
+	(integer) fields into a printf-style format string and the list of field
+	names in the order of their appearance"""
+	fmt = []
+	names = []
+	for literal, name, spec, _ in string.Formatter().parse(text):
+		fmt.append(literal.replace("%", "%%"))
+		if name is not None:
+			fmt.append(spec == "d" and "%d" or "%s")
+			names.append(name)
+
+	return "".join(fmt), names
+
+class ResponseTemplate(object):
+	"""SIP message with precompiled static parts. Everything apart from the
+	fields is formatted once when the template is created, render() only
+	splices in the per-request values (in a single formatting operation) and
+	returns bytes ready for sending. A Content-Length header and the empty line
+	after the headers are added automatically."""
+	def __init__(self, headerLines, bodyLines=None):
+		if bodyLines:
+			headerLines = headerLines + ["Content-Length: {contentLength:d}"]
+			self.__body = compileFormat("\n".join(bodyLines) + "\n")
+		else:
+			headerLines = headerLines + ["Content-Length: 0"]
+			self.__body = None
+
+		self.__headers = compileFormat("\n".join(headerLines) + "\n\n")
+
+	def render(self, **fields):
+		"""Returns the message (bytes) with all fields (str or int) filled
+		in"""
+		fmt, names = self.__headers
+		if not self.__body:
+			return (fmt % tuple([fields[n] for n in names])).encode('utf-8')
+
+		bodyFmt, bodyNames = self.__body
+		body = bodyFmt % tuple([fields[n] for n in bodyNames])
+		fields['contentLength'] = body.isascii() and len(body) or \
+			len(body.encode('utf-8'))
+
+		return (fmt % tuple([fields[n] for n in names]) + body).encode('utf-8')
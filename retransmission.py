@@ -0,0 +1,94 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import time
+import hashlib
+from collections import OrderedDict
+
+# SIP timer T1 (RTT estimate) and timer B/F (INVITE / non-INVITE transaction
+# timeout): a client stops retransmitting a request after 64*T1 seconds
+T1 = 0.5
+TIMER_B = 64 * T1
+
+def datagramDigest(data):
+	"""Short digest identifying the exact content of a datagram"""
+	return hashlib.blake2b(data, digest_size=16).digest()
+
+class RetransmissionCache(object):
+	"""Bounded LRU cache of the responses sent for a request datagram, keyed
+	by (source address, datagram digest). Exact retransmissions of a request
+	are answered by replaying the cached responses without parsing the request
+	again. Entries expire after the transaction timeout (timer B/F)."""
+	def __init__(self, maxEntries=4096, ttl=TIMER_B):
+		self.__entries = OrderedDict()
+		self.__maxEntries = maxEntries
+		self.__ttl = ttl
+
+		# Statistics
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self.__entries)
+
+	def get(self, key, now=None):
+		"""Returns the tuple of responses (bytes) sent for the request
+		identified by key, or None if it has not been seen or has expired"""
+		if now is None:
+			now = time.time()
+
+		entry = self.__entries.get(key)
+		if entry is None or entry[0] < now:
+			if entry is not None:
+				del self.__entries[key]
+			self.misses += 1
+			return None
+
+		# Mark as most recently used
+		self.__entries.move_to_end(key)
+		self.hits += 1
+		return entry[1]
+
+	def put(self, key, responses, now=None):
+		"""Stores the responses (tuple of bytes) sent for the request
+		identified by key"""
+		if now is None:
+			now = time.time()
+
+		entries = self.__entries
+		entries[key] = (now + self.__ttl, responses)
+		entries.move_to_end(key)
+
+		# Drop expired entries from the least recently used end, then make room
+		# for the new entry
+		while entries:
+			oldestKey, oldest = next(iter(entries.items()))
+			if oldest[0] >= now and len(entries) <= self.__maxEntries:
+				break
+
+			del entries[oldestKey]
+			if oldest[0] >= now:
+				self.evictions += 1
+
+	def clear(self):
+		self.__entries.clear()
@@ -0,0 +1,514 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Vectorized analysis of RTP stream dumps (see pcapdump) with NumPy. The index
+# of a dump is loaded as a structured array, the RTP headers are gathered
+# from the memory mapped pcap file at the offsets of the index, and the
+# statistics of rtpstats are computed per SSRC with array operations (no
+# Python loop over the packets), including the probation and the
+# resynchronization rules of RFC 3550 A.1 for the sequence numbers.
+#
+################################################################################
+
+import os
+import sys
+import glob
+from collections import namedtuple
+
+import numpy as np
+
+from pcapdump import PCAP_MAGIC, PCAP_HEADER, RECORD_HEADER, INDEX_ENTRY, \
+	IP_HEADER_SIZE, UDP_HEADER_SIZE, INBOUND, PcapFormatError
+from rtpstats import RTP_HEADER, RTP_VERSION, CLOCK_RATES, MAX_DROPOUT, \
+	MAX_MISORDER, MIN_SEQUENTIAL, RTP_SEQ_MOD, SourceStats
+
+# Index entries as written by pcapdump.PcapStreamDump (INDEX_ENTRY)
+INDEX_DTYPE = np.dtype([("time", "<f8"), ("offset", "<u8"),
+	("length", "<u4"), ("direction", "u1"), ("pad", "V3")])
+assert INDEX_DTYPE.itemsize == INDEX_ENTRY.size
+
+# Fixed RTP header (RTP_HEADER), and the fields used by the analysis
+RTP_DTYPE = np.dtype([("vpxcc", "u1"), ("mpt", "u1"), ("seq", ">u2"),
+	("timestamp", ">u4"), ("ssrc", ">u4")])
+assert RTP_DTYPE.itemsize == RTP_HEADER.size
+HEADER_DTYPE = np.dtype([("time", "<f8"), ("offset", "<u8"),
+	("length", "<u4"), ("vpxcc", "u1"), ("payloadType", "u1"), ("seq", "<u2"),
+	("timestamp", "<u4"), ("ssrc", "<u4")])
+
+# Offset of the RTP header in a pcap record
+RTP_OFFSET = RECORD_HEADER.size + IP_HEADER_SIZE + UDP_HEADER_SIZE
+
+CLOCK_RATE_TABLE = np.array(CLOCK_RATES, dtype=np.float64)
+
+# Packets ahead of a packet that are compared directly when looking for the
+# next one in order, the packets beyond are searched per bucket of sequence
+# numbers (see nextInOrder), and packets of a bucket that are compared
+# directly before searching its power tables (see firstBeyond)
+SCAN_DISTANCE = 64
+PROBE_DISTANCE = 16
+
+# Analysis of one dump: packets analyzed, packets that are not RTP, number of
+# times the SSRC differed from the previous packet, and SourceStats per SSRC
+StreamAnalysis = namedtuple("StreamAnalysis",
+	"path packets invalid ssrcChanges sources")
+
+def loadIndex(path):
+	"""Index of the dump at path as an INDEX_DTYPE array (only complete
+	entries, the dump may still be written)"""
+	indexPath = path + ".idx"
+	count = os.path.getsize(indexPath) // INDEX_DTYPE.itemsize
+	return np.fromfile(indexPath, dtype=INDEX_DTYPE, count=count)
+
+def loadHeaders(path, direction=INBOUND):
+	"""RTP headers of the packets of the dump at path sent in direction (None
+	for both), returns a HEADER_DTYPE array in capture order (offset is the
+	position of the RTP header in the file) and the number of packets that
+	are not RTP"""
+	index = loadIndex(path)
+	if direction is not None:
+		index = index[index["direction"] == direction]
+
+	size = os.path.getsize(path)
+	if size < PCAP_HEADER.size:
+		raise PcapFormatError("Not a pcap dump: {}".format(path))
+	data = np.memmap(path, dtype=np.uint8, mode="r")
+	if PCAP_HEADER.unpack(data[:PCAP_HEADER.size].tobytes())[0] != PCAP_MAGIC:
+		raise PcapFormatError("Not a pcap dump: {}".format(path))
+
+	# Gather the fixed RTP header of every packet that is long enough (and
+	# has been written completely, the index may be ahead of the dump or the
+	# dump may have been cut short) into one (n, 12) array
+	start = index["offset"].astype(np.int64) + RTP_OFFSET
+	valid = (index["length"] >= RTP_HEADER.size) & \
+		(start + index["length"] <= size)
+	raw = data[start[valid, None] + np.arange(RTP_HEADER.size)]
+	rtp = np.ascontiguousarray(raw).view(RTP_DTYPE).reshape(-1)
+
+	isRtp = (rtp["vpxcc"] >> 6) == RTP_VERSION
+	rtp = rtp[isRtp]
+	headers = np.empty(len(rtp), dtype=HEADER_DTYPE)
+	headers["time"] = index["time"][valid][isRtp]
+	headers["offset"] = start[valid][isRtp]
+	headers["length"] = index["length"][valid][isRtp]
+	headers["vpxcc"] = rtp["vpxcc"]
+	headers["payloadType"] = rtp["mpt"] & 0x7f
+	headers["seq"] = rtp["seq"]
+	headers["timestamp"] = rtp["timestamp"]
+	headers["ssrc"] = rtp["ssrc"]
+	return headers, len(index) - len(headers)
+
+def signed(delta, bits):
+	"""Differences of sequence numbers (16 bits) or timestamps (32 bits) as
+	signed values"""
+	half = 1 << (bits - 1)
+	return ((delta + half) & ((1 << bits) - 1)) - half
+
+def lastBefore(mask):
+	"""Index of the last set element of mask before each position (-1 if
+	there is none)"""
+	n = len(mask)
+	last = np.full(n, -1, dtype=np.int64)
+	if n > 1:
+		np.maximum.accumulate(np.where(mask[:-1], np.arange(n - 1), -1),
+			out=last[1:])
+	return last
+
+def firstFrom(mask):
+	"""Index of the first set element of mask at or after each position
+	(len(mask) if there is none)"""
+	n = len(mask)
+	first = np.where(mask, np.arange(n), n)
+	return np.minimum.accumulate(first[::-1])[::-1]
+
+def probationEnds(step, groupStart, starts):
+	"""Index of the packet of each group that ends the probation of RFC 3550
+	A.1 (the last of MIN_SEQUENTIAL packets in sequence), len(step) if the
+	group never leaves it. step is the difference of each sequence number
+	to the previous one."""
+	n = len(step)
+	index = np.arange(n)
+	count = np.cumsum(step == 1)
+
+	# The MIN_SEQUENTIAL - 1 steps up to the packet are all in sequence (the
+	# first packet of a group counts as the first one in sequence)
+	steps = MIN_SEQUENTIAL - 1
+	back = index - steps
+	ends = (back >= groupStart) & \
+		(count - count[np.maximum(back, 0)] == steps)
+	return np.minimum.reduceat(np.where(ends, index, n), starts)
+
+def powerTables(values, reduce):
+	"""Sparse table of values: level k holds reduce() of the 2^k values
+	starting at each position (as far as there are any)"""
+	tables = [values]
+	step = 1
+	while step * 2 <= len(values):
+		table = tables[-1].copy()
+		reduce(table[:-step], tables[-1][step:], out=table[:-step])
+		tables.append(table)
+		step *= 2
+	return tables
+
+def beyond(values, position, bound, above):
+	"""Whether values[position] is at least bound (above) or less than bound
+	(not above)"""
+	value = values[np.minimum(position, len(values) - 1)]
+	return np.where(above, value >= bound, value < bound)
+
+def firstBeyond(values, lo, hi, bound, above):
+	"""Position of the first value in [lo, hi) that is at least bound (above)
+	or less than bound (not above), hi if there is none. The first values
+	are compared directly, the remaining ones are searched in the power
+	tables of the maxima (above) or minima of the values."""
+	position = lo.copy()
+	pending = np.arange(len(lo))
+	for distance in range(PROBE_DISTANCE):
+		current = position[pending]
+		done = (current >= hi[pending]) | \
+			beyond(values, current, bound[pending], above[pending])
+		pending = pending[~done]
+		position[pending] += 1
+		if len(pending) == 0:
+			return position
+
+	last = len(values) - 1
+	for isAbove, reduce in ((True, np.maximum), (False, np.minimum)):
+		query = pending[above[pending] == isAbove]
+		if len(query) == 0:
+			continue
+		tables = powerTables(values, reduce)
+		current = position[query]
+		end = hi[query]
+		limit = bound[query]
+		for level in range(len(tables) - 1, -1, -1):
+			# Skip the next 2^level values if none of them qualifies
+			step = 1 << level
+			block = tables[level][np.minimum(current, last)]
+			skip = (current + step <= end) & \
+				((block < limit) if isAbove else (block >= limit))
+			current += np.where(skip, step, 0)
+		position[query] = current
+	found = (position < hi) & beyond(values, position, bound, above)
+	return np.where(found, position, hi)
+
+def bucketPositions(bucket, bounds, buckets, after):
+	"""Position in the packets sorted by bucket (starting at bounds) of the
+	first packet of buckets[i] after after[i]: the start of the bucket plus
+	the number of its packets up to after[i]"""
+	positions = np.empty(len(buckets), dtype=np.int64)
+	queries = np.argsort(buckets.astype(np.uint8), kind="stable")
+	split = np.searchsorted(buckets[queries], np.arange(len(bounds)))
+	for b in range(len(bounds) - 1):
+		query = queries[split[b]:split[b + 1]]
+		if len(query) > 0:
+			count = np.cumsum(bucket == b, dtype=np.int32)
+			positions[query] = bounds[b] + count[after[query]]
+	return positions
+
+def searchInOrder(seq, origins, after, limit):
+	"""Position of the first packet after after[i] and at most limit[i] whose
+	sequence number is less than MAX_DROPOUT ahead of the one of packet
+	origins[i] (len(seq) if there is none).
+
+	The packets are sorted by bucket (MAX_DROPOUT sequence numbers) and
+	position, the range of sequence numbers of an origin is then covered by
+	one-sided searches in at most three buckets: the first packet of the
+	bucket after the position with a sequence number at or above (or below)
+	a bound."""
+	n = len(seq)
+	bucket = seq // MAX_DROPOUT
+	order = np.argsort(bucket.astype(np.uint8), kind="stable")
+	bounds = np.searchsorted(bucket[order],
+		np.arange((RTP_SEQ_MOD - 1) // MAX_DROPOUT + 2))
+	values = seq[order].astype(np.uint16)
+
+	# The range [start, start + MAX_DROPOUT) split at the wrap around
+	start = seq[origins]
+	stop = start + MAX_DROPOUT
+	pieces = [(np.arange(len(origins)), start,
+		np.minimum(stop, RTP_SEQ_MOD))]
+	wrapped = np.flatnonzero(stop > RTP_SEQ_MOD)
+	pieces.append((wrapped, np.zeros(len(wrapped), dtype=np.int64),
+		stop[wrapped] - RTP_SEQ_MOD))
+
+	# One-sided searches (query, bucket, bound, above) of the pieces [a, b):
+	# at or above a in the bucket of a, unless the piece starts with the
+	# bucket and ends in it, and below b in the bucket of b - 1
+	searches = []
+	for query, a, b in pieces:
+		low = a // MAX_DROPOUT
+		high = (b - 1) // MAX_DROPOUT
+		inside = (high == low) & (a == low * MAX_DROPOUT)
+		searches.append((query[~inside], low[~inside], a[~inside],
+			np.ones(np.count_nonzero(~inside), dtype=bool)))
+		below = (high != low) | inside
+		searches.append((query[below], high[below], b[below],
+			np.zeros(np.count_nonzero(below), dtype=bool)))
+	query, buckets, bound, above = (np.concatenate(x)
+		for x in zip(*searches))
+
+	lo = bucketPositions(bucket, bounds, buckets, after[query])
+	hi = bounds[buckets + 1]
+	position = firstBeyond(values, lo, hi, bound, above)
+	position = np.where(position < hi, order[np.minimum(position, n - 1)], n)
+	position[position > limit[query]] = n
+	found = np.full(len(origins), n, dtype=np.int64)
+	np.minimum.at(found, query, position)
+	return found
+
+def nextInOrder(seq, groupEnd):
+	"""Position of the next packet of the same group whose sequence number is
+	less than MAX_DROPOUT ahead of the one of each packet (len(seq) if there
+	is none). The packets up to SCAN_DISTANCE ahead are compared directly
+	(fewer when most of them don't qualify, as in streams of random
+	sequence numbers), the remaining ones are searched with
+	searchInOrder."""
+	n = len(seq)
+	following = np.full(n, n, dtype=np.int64)
+	pending = np.arange(n)
+	for distance in range(1, SCAN_DISTANCE + 1):
+		candidate = pending + distance
+		inGroup = candidate <= groupEnd[pending]
+		pending = pending[inGroup]
+		candidate = candidate[inGroup]
+		hit = ((seq[candidate] - seq[pending]) & 0xffff) < MAX_DROPOUT
+		following[pending[hit]] = candidate[hit]
+		pending = pending[~hit]
+		if len(pending) == 0:
+			return following
+		if distance >= 4 and np.count_nonzero(hit) * 4 < len(hit):
+			break
+
+	following[pending] = searchInOrder(seq, pending, pending + distance,
+		groupEnd[pending])
+	return following
+
+def markChains(links, origins):
+	"""Marks the packets reached from origins by following links (a link of
+	len(links) ends a chain). Runs of links to the next packet are collapsed,
+	the remaining links are followed by pointer doubling."""
+	n = len(links)
+	index = np.arange(n)
+	breaks = links != index + 1
+	breaks[-1] = True
+	runEnd = firstFrom(breaks)
+
+	# Collapsed chains: a break links to the end of the run its link enters
+	positions = np.flatnonzero(breaks)
+	m = len(positions)
+	node = np.full(n + 1, m, dtype=np.int64)
+	node[positions] = np.arange(m)
+	target = links[positions]
+	link = np.full(m + 1, m, dtype=np.int64)
+	link[:m] = np.where(target < n, node[runEnd[np.minimum(target, n - 1)]],
+		m)
+
+	# After the k-th round the breaks less than 2^k links away from an origin
+	# are reached, the chains are complete when none of them links 2^k
+	# breaks ahead
+	reached = np.zeros(m + 1, dtype=bool)
+	reached[node[runEnd[origins]]] = True
+	while True:
+		targets = link[reached]
+		targets = targets[targets < m]
+		if len(targets) == 0:
+			break
+		reached[targets] = True
+		link = link[link]
+
+	# Mark the runs from where a chain enters them
+	target = target[reached[:m]]
+	entries = np.concatenate([origins, target[target < n]])
+	marks = np.bincount(entries, minlength=n + 1) - \
+		np.bincount(runEnd[entries] + 1, minlength=n + 1)
+	return np.cumsum(marks[:n]) > 0
+
+def followChains(seq, groupEnd, active, initial):
+	"""The packets in order (that advance the highest sequence number) after
+	the probation, returns the (re)starts of the sequence, the packets in
+	order, the jumps and the highest sequence number before each packet.
+
+	The packets in order form chains: each one is the next packet less than
+	MAX_DROPOUT ahead of the previous one, and the packets between them are
+	either reordered or jumps. The chains are computed for the (re)starts of
+	the sequence, a jump followed by the next sequence number restarts it,
+	which moves the following chain; this repeats until the restarts don't
+	change."""
+	n = len(seq)
+	following = nextInOrder(seq, groupEnd)
+	restart = np.zeros(n, dtype=bool)
+	while True:
+		# Chains end at the next (re)start of the sequence
+		origin = initial | restart
+		nextOrigin = np.append(firstFrom(origin)[1:], n)
+		links = np.where(following < nextOrigin, following, n)
+		inOrder = markChains(links, np.flatnonzero(origin))
+
+		# Highest sequence number before each packet, jumps that are
+		# followed by the next sequence number since the last (re)start
+		highest = seq[np.maximum(lastBefore(inOrder), 0)]
+		udelta = (seq - highest) & 0xffff
+		jump = active & (udelta >= MAX_DROPOUT) & \
+			(udelta <= RTP_SEQ_MOD - MAX_MISORDER)
+		badSeq = lastBefore(jump & ~restart)
+		confirmed = jump & (badSeq > lastBefore(origin)) & \
+			(seq == (seq[np.maximum(badSeq, 0)] + 1) & 0xffff)
+		if np.array_equal(confirmed, restart):
+			return origin, inOrder, jump, highest
+		restart = confirmed
+
+def sequenceStates(seq, starts, ends, group):
+	"""Sequence number tracking of RFC 3550 A.1 (rtpstats.RtpSourceStats)
+	for the packets of each group, returns per group the expected and
+	received packets since the last (re)start of the sequence and the
+	number of reordered (or duplicate) packets"""
+	n = len(seq)
+	groups = len(starts)
+	index = np.arange(n)
+	step = np.zeros(n, dtype=np.int64)
+	step[1:] = (seq[1:] - seq[:-1]) & 0xffff
+
+	probation = probationEnds(step, starts[group], starts)
+	active = index > probation[group]
+	initial = np.zeros(n, dtype=bool)
+	initial[probation[probation < n]] = True
+
+	if np.all(step[active] < MAX_DROPOUT):
+		# Every packet after the probation is in order
+		origin = initial
+		inOrder = active | initial
+		jump = np.zeros(n, dtype=bool)
+		highest = np.append(seq[:1], seq[:-1])
+	else:
+		origin, inOrder, jump, highest = followChains(seq, ends[group],
+			active, initial)
+
+	reordered = active & ~inOrder & ~jump
+	base = np.maximum.reduceat(np.where(origin, index, -1), starts)
+	current = (index >= base[group]) & (base[group] >= 0)
+	wraps = np.bincount(group[current & inOrder & ~origin & (seq < highest)],
+		minlength=groups)
+	maxSeq = seq[np.maximum.reduceat(np.where(inOrder, index, 0), starts)]
+	expected = np.where(base >= 0,
+		wraps * RTP_SEQ_MOD + maxSeq - seq[np.maximum(base, 0)] + 1, 0)
+	received = np.bincount(group[current & (inOrder | reordered)],
+		minlength=groups)
+	return expected, received, np.bincount(group[reordered],
+		minlength=groups)
+
+def analyzeHeaders(headers):
+	"""SourceStats per SSRC (ordered by SSRC) of a HEADER_DTYPE array in
+	capture order, the same values as rtpstats.RtpStreamStats"""
+	n = len(headers)
+	if n == 0:
+		return []
+
+	# Group the packets by SSRC, the stable sort keeps the capture order
+	# within each group
+	h = headers[np.argsort(headers["ssrc"], kind="stable")]
+	first = np.empty(n, dtype=bool)
+	first[0] = True
+	np.not_equal(h["ssrc"][1:], h["ssrc"][:-1], out=first[1:])
+	starts = np.flatnonzero(first)
+	ends = np.append(starts[1:], n) - 1
+	group = np.cumsum(first) - 1
+	groups = len(starts)
+
+	expected, received, reordered = sequenceStates(
+		h["seq"].astype(np.int64), starts, ends, group)
+
+	# Interarrival jitter, J(i) = J(i-1) + (|D(i-1, i)| - J(i-1)) / 16,
+	# unrolled: the last value is the sum of |D| weighted with
+	# 1/16 * (15/16)^k for the k-th last packet of the group
+	t = h["time"]
+	d = np.zeros(n)
+	d[1:] = np.diff(t) - signed(np.diff(h["timestamp"].astype(np.int64)),
+		32) / CLOCK_RATE_TABLE[h["payloadType"][1:]]
+	d[first] = 0
+	weights = np.power(15 / 16, (ends[group] - np.arange(n))) / 16
+	jitter = np.bincount(group, weights=np.abs(d) * weights,
+		minlength=groups)
+
+	packets = ends - starts + 1
+	size = np.bincount(group, weights=h["length"], minlength=groups)
+	duration = t[ends] - t[starts]
+	positive = duration > 0
+	rate = np.zeros(groups)
+	rate[positive] = (packets[positive] - 1) / duration[positive]
+	bitrate = np.zeros(groups)
+	bitrate[positive] = size[positive] / duration[positive]
+	lost = expected - received
+
+	# Payload type histogram per group
+	histogram = np.bincount(group * 128 + h["payloadType"],
+		minlength=groups * 128).reshape(groups, 128)
+
+	sources = []
+	for g in range(groups):
+		types = np.flatnonzero(histogram[g])
+		sources.append(SourceStats(int(h["ssrc"][starts[g]]), int(packets[g]),
+			int(received[g]), int(size[g]), int(expected[g]), int(lost[g]),
+			int(reordered[g]), float(jitter[g]), float(duration[g]),
+			float(rate[g]), float(bitrate[g]),
+			dict(zip(types.tolist(), histogram[g][types].tolist()))))
+	return sources
+
+def analyze(path, direction=INBOUND):
+	"""StreamAnalysis of the dump at path (received packets by default)"""
+	headers, invalid = loadHeaders(path, direction)
+	ssrcChanges = int(np.count_nonzero(
+		headers["ssrc"][1:] != headers["ssrc"][:-1]))
+	return StreamAnalysis(path, len(headers), invalid, ssrcChanges,
+		analyzeHeaders(headers))
+
+def analyzeDirectory(directory, pattern="stream_*.pcap", direction=INBOUND):
+	"""StreamAnalysis of every dump in directory that has an index"""
+	results = []
+	for path in sorted(glob.glob(os.path.join(directory, pattern))):
+		if not os.path.exists(path + ".idx"):
+			continue
+		try:
+			results.append(analyze(path, direction))
+		except PcapFormatError:
+			continue
+	return results
+
+def payloadTypes(results):
+	"""Payload type histogram over all SSRCs of a list of StreamAnalysis"""
+	histogram = {}
+	for result in results:
+		for source in result.sources:
+			for pt, count in source.payloadTypes.items():
+				histogram[pt] = histogram.get(pt, 0) + count
+	return histogram
+
+if __name__ == '__main__':
+	results = analyzeDirectory(sys.argv[1] if len(sys.argv) > 1 else ".")
+	for result in results:
+		print("{} packets={} invalid={} ssrc_changes={}".format(result.path,
+			result.packets, result.invalid, result.ssrcChanges))
+		for s in result.sources:
+			print("  ssrc={:08x} packets={} lost={} reordered={} "
+				"jitter={:.2f}ms rate={:.1f}/s pt={}".format(s.ssrc, s.packets,
+				s.lost, s.reordered, s.jitter * 1000, s.rate,
+				s.payloadTypes))
+	print("payload types: {}".format(payloadTypes(results)))
@@ -0,0 +1,218 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# RTP stream statistics per SSRC: sequence number loss and reordering (RFC
+# 3550 A.1, with probation and resynchronization after large jumps),
+# interarrival jitter (RFC 3550 A.8), packet rate and payload types.
+# RtpStreamStats is updated with every received packet of a live stream,
+# rtpanalysis computes the same values for whole stream dumps.
+#
+################################################################################
+
+import struct
+from collections import namedtuple
+
+# Fixed RTP header: V/P/X/CC, M/PT, sequence number, timestamp, SSRC
+RTP_HEADER = struct.Struct("!BBHII")
+RTP_VERSION = 2
+
+# RTP timestamp clock rates of the static payload types (RFC 3551), dynamic
+# and unassigned types are assumed to be audio at 8000 Hz
+DEFAULT_CLOCK_RATE = 8000
+CLOCK_RATES = [DEFAULT_CLOCK_RATE] * 128
+for _pt, _rate in ((6, 16000), (10, 44100), (11, 44100), (14, 90000),
+		(16, 11025), (17, 22050), (25, 90000), (26, 90000), (28, 90000),
+		(31, 90000), (32, 90000), (33, 90000), (34, 90000)):
+	CLOCK_RATES[_pt] = _rate
+
+# Maximum number of SSRCs tracked per stream, packets of further SSRCs are
+# only counted (the SSRC is chosen by the sender)
+MAX_SOURCES = 16
+
+# Sequence number tracking of RFC 3550 A.1: a source is valid after
+# MIN_SEQUENTIAL packets in sequence, a jump of MAX_DROPOUT or more ahead (or
+# more than MAX_MISORDER back) is ignored unless the next packet follows it,
+# which restarts the sequence (e.g. the sender has restarted)
+MAX_DROPOUT = 3000
+MAX_MISORDER = 100
+MIN_SEQUENTIAL = 2
+RTP_SEQ_MOD = 1 << 16
+
+# Statistics of one SSRC
+# packets: all packets, received: packets counted by RFC 3550 A.1 (not those
+#   during probation or ignored jumps, and only since the last restart)
+# lost: expected - received as in RFC 3550 (negative with duplicates)
+# jitter: interarrival jitter in seconds
+# rate, bitrate: packets and payload bytes per second
+SourceStats = namedtuple("SourceStats", "ssrc packets received bytes expected "
+	"lost reordered jitter duration rate bitrate payloadTypes")
+
+def signed16(n):
+	"""Difference of two sequence numbers as a signed value"""
+	return ((n + 0x8000) & 0xffff) - 0x8000
+
+def signed32(n):
+	"""Difference of two RTP timestamps as a signed value"""
+	return ((n + 0x80000000) & 0xffffffff) - 0x80000000
+
+class RtpSourceStats(object):
+	"""Running statistics of the packets of one SSRC"""
+	__slots__ = ("ssrc", "packets", "received", "bytes", "reordered",
+		"payloadTypes", "__base", "__maxSeq", "__cycles", "__badSeq",
+		"__probation", "__jitter", "__first", "__last", "__lastTimestamp")
+
+	def __init__(self, ssrc):
+		self.ssrc = ssrc
+		self.packets = 0
+		self.received = 0
+		self.bytes = 0
+		self.reordered = 0
+		self.payloadTypes = {}
+
+		# RFC 3550 A.1 state: first sequence number, highest one (16 bits)
+		# and its wrap arounds, the sequence number that confirms a jump, and
+		# the packets still needed to validate the source
+		self.__base = 0
+		self.__maxSeq = 0
+		self.__cycles = 0
+		self.__badSeq = RTP_SEQ_MOD + 1
+		self.__probation = MIN_SEQUENTIAL
+
+		# Interarrival jitter in seconds, arrival time and RTP timestamp of
+		# the last packet
+		self.__jitter = 0.0
+		self.__first = 0.0
+		self.__last = 0.0
+		self.__lastTimestamp = 0
+
+	def update(self, seq, timestamp, payloadType, size, arrival):
+		"""Adds a packet received at arrival (seconds)"""
+		self.payloadTypes[payloadType] = \
+			self.payloadTypes.get(payloadType, 0) + 1
+		self.bytes += size
+
+		if self.packets == 0:
+			self.__initSeq(seq)
+			self.__maxSeq = (seq - 1) & 0xffff
+			self.__first = arrival
+		else:
+			# D(i-1, i) = (Rj - Ri) - (Sj - Si), J += (|D| - J) / 16
+			d = (arrival - self.__last) - signed32(
+				timestamp - self.__lastTimestamp) / CLOCK_RATES[payloadType]
+			self.__jitter += (abs(d) - self.__jitter) / 16
+
+		self.packets += 1
+		self.__last = arrival
+		self.__lastTimestamp = timestamp
+		self.__updateSeq(seq)
+
+	def __initSeq(self, seq):
+		self.__base = self.__maxSeq = seq
+		self.__badSeq = RTP_SEQ_MOD + 1
+		self.__cycles = 0
+		self.received = 0
+
+	def __updateSeq(self, seq):
+		"""update_seq() of RFC 3550 A.1, a packet less than MAX_MISORDER
+		below the highest sequence number has been reordered"""
+		udelta = (seq - self.__maxSeq) & 0xffff
+		if self.__probation:
+			# The source is valid after MIN_SEQUENTIAL packets in sequence
+			if seq == (self.__maxSeq + 1) & 0xffff:
+				self.__probation -= 1
+				self.__maxSeq = seq
+				if self.__probation == 0:
+					self.__initSeq(seq)
+					self.received += 1
+			else:
+				self.__probation = MIN_SEQUENTIAL - 1
+				self.__maxSeq = seq
+		elif udelta < MAX_DROPOUT:
+			# In order, with a permissible gap
+			if seq < self.__maxSeq:
+				self.__cycles += RTP_SEQ_MOD
+			self.__maxSeq = seq
+			self.received += 1
+		elif udelta <= RTP_SEQ_MOD - MAX_MISORDER:
+			# A large jump, the sequence restarts if the next packet follows
+			# it, otherwise the packet is ignored
+			if seq == self.__badSeq:
+				self.__initSeq(seq)
+				self.received += 1
+			else:
+				self.__badSeq = (seq + 1) & 0xffff
+		else:
+			# Duplicate or reordered packet
+			self.reordered += 1
+			self.received += 1
+
+	def summary(self):
+		expected = 0
+		if not self.__probation:
+			expected = self.__cycles + self.__maxSeq - self.__base + 1
+		duration = self.__last - self.__first
+		rate = (self.packets - 1) / duration if duration > 0 else 0.0
+		bitrate = self.bytes / duration if duration > 0 else 0.0
+		return SourceStats(self.ssrc, self.packets, self.received, self.bytes,
+			expected, expected - self.received, self.reordered, self.__jitter,
+			duration, rate, bitrate, dict(self.payloadTypes))
+
+class RtpStreamStats(object):
+	"""Statistics of all SSRCs of a live RTP stream, updated with every
+	received packet"""
+	__slots__ = ("sources", "invalid", "untracked", "ssrcChanges",
+		"__current")
+
+	def __init__(self):
+		self.sources = {}
+
+		# Packets that are not RTP, and packets of SSRCs beyond MAX_SOURCES
+		self.invalid = 0
+		self.untracked = 0
+
+		# Number of times the SSRC differed from the previous packet
+		self.ssrcChanges = 0
+		self.__current = None
+
+	def update(self, data, arrival):
+		"""Adds a received packet, arrival is its time in seconds"""
+		if len(data) < RTP_HEADER.size or data[0] >> 6 != RTP_VERSION:
+			self.invalid += 1
+			return
+
+		_, mpt, seq, timestamp, ssrc = RTP_HEADER.unpack_from(data)
+		if ssrc != self.__current:
+			if self.__current is not None:
+				self.ssrcChanges += 1
+			self.__current = ssrc
+
+		source = self.sources.get(ssrc)
+		if source is None:
+			if len(self.sources) >= MAX_SOURCES:
+				self.untracked += 1
+				return
+			source = self.sources[ssrc] = RtpSourceStats(ssrc)
+		source.update(seq, timestamp, mpt & 0x7f, len(data), arrival)
+
+	def summary(self):
+		"""SourceStats of every SSRC, ordered by SSRC"""
+		return [self.sources[ssrc].summary() for ssrc in sorted(self.sources)]
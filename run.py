@@ -20,18 +20,73 @@
 #
 ################################################################################
 
-import asyncore
+import connection
+import dumpwriter
+import eventstore
+import media
+import metrics
+import playback
 import sip
+import workers
+from config import g_config
 
-if __name__ == '__main__':
-	s = sip.Sip()
+g_sipconfig = g_config['modules']['python']['sip']
+
+def runSingle():
+	# Bind the RTP port range
+	rtp = media.getMediaManager()
+
+	# Load the announcement before accepting calls
+	scheduler = playback.getPlaybackScheduler()
+
+	# UDP and TCP listeners share one table of SIP sessions
+	sessions = sip.newSessionTable()
+	s = sip.Sip(sessions=sessions)
 	s.bind(('localhost', 5060))
 
+	t = sip.SipTcp(sessions)
+	t.bind(('localhost', 5060))
+	t.listen(128)
+
+	# Serve the metrics, including the stats of the UDP listener
+	metrics.getRegistry().collect("stats", s.stats,
+		gauges=workers.GAUGES | workers.MAXIMA)
+	metricsServer = metrics.serve()
+
+	# Run the asyncio event loop (epoll on Linux) until interrupted
 	try:
-		asyncore.loop()
+		connection.loop()
 	except KeyboardInterrupt:
 		pass
 
 	print("Closing socket ...")
+	if metricsServer is not None:
+		metricsServer.close()
 	s.close()
-	asyncore.loop()
+	t.close()
+	if scheduler is not None:
+		scheduler.close()
+	rtp.close()
+	dumpwriter.getDumpWriter().close()
+	if eventstore.g_eventStore is not None:
+		eventstore.g_eventStore.close()
+
+def runWorkers(count):
+	# Worker processes share the port with SO_REUSEPORT, the supervisor
+	# restarts crashed workers and merges their stats
+	supervisor = workers.Supervisor(count, ('localhost', 5060))
+	supervisor.start()
+	try:
+		supervisor.run()
+	except KeyboardInterrupt:
+		pass
+
+	print("Stopping workers ...")
+	supervisor.stop()
+	print("Stats: {}".format(supervisor.stats()))
+
+if __name__ == '__main__':
+	if g_sipconfig['workers'] > 0:
+		runWorkers(g_sipconfig['workers'])
+	else:
+		runSingle()
@@ -0,0 +1,123 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import time
+from collections import OrderedDict
+
+# Results of SessionTable.admit
+ADMITTED, SOURCE_LIMIT, TABLE_FULL = range(3)
+
+# Sessions looked at per eviction before giving up (sessions with recent RTP
+# traffic get a second chance)
+EVICTION_CANDIDATES = 8
+
+class SessionTable(object):
+	"""Bounded table of SIP sessions keyed by Call-ID, ordered by the last
+	SIP request of each session. New sessions are admitted with admit(): a
+	source may hold at most maxPerSource sessions, and when the table is full
+	the least recently active session is evicted (closed) if it has been idle
+	for at least minIdle seconds. Lookup, touch and eviction are O(1).
+
+	Sessions need the properties callId, remoteAddress and lastActivity
+	(time.monotonic) and a close() method, which has to remove the session
+	from the table."""
+	def __init__(self, maxSessions=10000, maxPerSource=100, minIdle=5):
+		self.maxSessions = maxSessions
+		self.maxPerSource = maxPerSource
+		self.minIdle = minIdle
+
+		self.__sessions = OrderedDict()
+		self.__perSource = {}
+
+		# Statistics
+		self.evictions = 0
+		self.rejectedSource = 0
+		self.rejectedFull = 0
+
+	def __len__(self):
+		return len(self.__sessions)
+
+	def __contains__(self, callId):
+		return callId in self.__sessions
+
+	def __getitem__(self, callId):
+		return self.__sessions[callId]
+
+	def get(self, callId, default=None):
+		return self.__sessions.get(callId, default)
+
+	def __setitem__(self, callId, session):
+		if callId in self.__sessions:
+			del self[callId]
+
+		self.__sessions[callId] = session
+		address = session.remoteAddress
+		self.__perSource[address] = self.__perSource.get(address, 0) + 1
+
+	def __delitem__(self, callId):
+		session = self.__sessions.pop(callId)
+		address = session.remoteAddress
+		count = self.__perSource[address] - 1
+		if count:
+			self.__perSource[address] = count
+		else:
+			del self.__perSource[address]
+
+	def touch(self, callId):
+		"""Marks the session as most recently active"""
+		if callId in self.__sessions:
+			self.__sessions.move_to_end(callId)
+
+	def sessionsOf(self, address):
+		"""Number of sessions of a source address"""
+		return self.__perSource.get(address, 0)
+
+	def admit(self, address, now=None):
+		"""Checks whether a new session from address may be added, evicting
+		the least recently active session if the table is full. Returns
+		ADMITTED, SOURCE_LIMIT or TABLE_FULL."""
+		if self.__perSource.get(address, 0) >= self.maxPerSource:
+			self.rejectedSource += 1
+			return SOURCE_LIMIT
+
+		if len(self.__sessions) < self.maxSessions:
+			return ADMITTED
+
+		if now is None:
+			now = time.monotonic()
+
+		sessions = self.__sessions
+		for i in range(min(EVICTION_CANDIDATES, len(sessions))):
+			callId, session = next(iter(sessions.items()))
+			if now - session.lastActivity < self.minIdle:
+				# Still active (e.g. RTP traffic): look at the next one
+				sessions.move_to_end(callId)
+				continue
+
+			session.close()
+			if callId in sessions:
+				del self[callId]
+			self.evictions += 1
+			return ADMITTED
+
+		self.rejectedFull += 1
+		return TABLE_FULL
@@ -25,12 +25,31 @@
 #
 ################################################################################
 
+import os
+import sys
 import logging
 import time
+import re
+import errno
+import collections
 import random
-import hashlib
 
-from connection import connection
+from connection import connection, BufferPool, getTimerWheel
+from retransmission import RetransmissionCache, datagramDigest
+from response import ResponseTemplate
+from ratelimit import TokenBucketLimiter, sourceKey
+import sessiontable
+import logqueue
+import media
+import dumpwriter
+import pcapdump
+import rtpstats
+import digest
+import credentials
+import bruteforce
+import eventstore
+import metrics
+import playback
 from sdp import parseSdpMessage, SdpParsingError
 from config import g_config
 
@@ -38,13 +57,7 @@ from config import g_config
 g_sipconfig = g_config['modules']['python']['sip']
 
 # Setup logging mechanism
-logger = logging.getLogger('sip')
-logger.setLevel(logging.DEBUG)
-logConsole = logging.StreamHandler()
-logConsole.setLevel(logging.DEBUG)
-logConsole.setFormatter(logging.Formatter(
-	"%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
-logger.addHandler(logConsole)
+logger = logqueue.getLogger('sip')
 
 TRYING                      = '100'
 RINGING                     = '180'
@@ -193,165 +206,539 @@ for k, v in shortHeaders.items():
     longHeaders[v] = k
 del k, v
 
+# Lowercase header identifiers in both long and short form (as bytes) mapped to
+# the long form which is used as key in the headers dictionary
+headerIdentifiers = {}
+for k, v in shortHeaders.items():
+	headerIdentifiers[k.encode('ascii')] = k
+	headerIdentifiers[v.encode('ascii')] = k
+del k, v
+
+# Raw header identifiers as they appear on the wire (e.g. b"Call-ID") that
+# have already been resolved, so the common spellings need a single lookup.
+# Bounded because the spelling is under the control of the remote host.
+headerIdentifierCache = dict(headerIdentifiers)
+HEADER_IDENTIFIER_CACHE_SIZE = 1024
+
+# Characters stripped from the message and from each line
+WHITESPACE = b"\n\r\t "
+
+# Framing of SIP messages on stream transports: end of the headers, value of
+# the Content-Length header (long or short form) and the largest message that
+# is buffered for a single connection
+HEADER_END = re.compile(rb"\r?\n[ \t]*\r?\n")
+CONTENT_LENGTH = re.compile(
+	rb"^[ \t]*(?:content-length|l)[ \t]*:[ \t]*([0-9]+)", re.I | re.M)
+MAX_STREAM_MESSAGE_SIZE = 65536
+
+# User part of a SIP URI in a From header (the caller's account)
+SIP_USER = re.compile(r"sips?:([^@;>\s]+)@")
+
+# Headers (long or short form) of a request that is answered without being
+# parsed (see rejectHeaders), searched in its first REJECT_SCAN_SIZE bytes
+REJECT_HEADERS = re.compile(
+	rb"^[ \t]*(from|f|call-id|i|cseq)[ \t]*:([^\r\n]*)", re.I | re.M)
+REJECT_SCAN_SIZE = 2048
+
+# Label of the sip_requests_total metric per message type, requests with
+# other methods are counted as "other"
+METHOD_LABELS = {'INVITE': "INVITE", 'ACK': "ACK", 'OPTIONS': "OPTIONS",
+	'BYE': "BYE", 'CANCEL': "CANCEL", 'REGISTER': "REGISTER",
+	'SIP/2.0': "response"}
+
+# Metrics updated for every message (see metrics.py)
+g_requestsMetric = metrics.getRegistry().counter("sip_requests_total",
+	"SIP messages received by method", ("method",))
+g_responsesMetric = metrics.getRegistry().counter("sip_responses_total",
+	"SIP responses sent by status code", ("code",))
+g_parseErrorsMetric = metrics.getRegistry().counter("sip_parse_errors_total",
+	"SIP messages that could not be parsed by reason", ("reason",))
+g_parseSecondsMetric = metrics.getRegistry().histogram("sip_parse_seconds",
+	"Time to parse a SIP message")
+g_handleSecondsMetric = metrics.getRegistry().histogram("sip_handle_seconds",
+	"Time to handle a parsed SIP message")
+
+# Largest payload of a UDP datagram over IPv4, the size of the receive buffers
+# (IP fragments are reassembled by the kernel)
+MAX_DATAGRAM_SIZE = 65507
+
+# Templates of all responses sent by the honeypot, see
+# compileResponseTemplates()
+responseTemplates = {}
+
+def getRealm():
+	"""Realm of the digest challenges"""
+	return g_sipconfig['realm'] or "{}@{}".format(g_sipconfig['user'],
+		g_sipconfig['ip'])
+
+def compileResponseTemplates():
+	"""(Re)compiles the response templates from the SIP configuration. The
+	config-derived headers are encoded once, the handlers only fill in the
+	per-request fields. Has to be called again when g_sipconfig changes."""
+	global g_sipconfig
+
+	def escape(value):
+		return "{}".format(value).replace("{", "{{").replace("}", "}}")
+
+	user = escape(g_sipconfig['user'])
+	ip = escape(g_sipconfig['ip'])
+	via = "Via: SIP/2.0/UDP {}:{}".format(ip, escape(g_sipconfig['port']))
+	sipFrom = "{0} <sip:{0}@{1}>".format(user, ip)
+	userAgent = "User-Agent: " + escape(g_sipconfig['useragent'])
+	realm = escape(getRealm()).replace('"', '\\"')
+
+	# Responses within a session (INVITE and BYE)
+	def sessionResponse(code):
+		return ["SIP/2.0 " + RESPONSE[code], via, "Max-Forwards: 70",
+			"To: {to}", "From: " + sipFrom, "Call-ID: {callId}",
+			"CSeq: {cseq}", "Contact: " + sipFrom, userAgent]
+
+	responseTemplates['ringing'] = ResponseTemplate(
+		sessionResponse(RINGING))
+	responseTemplates['invite_ok'] = ResponseTemplate(
+		sessionResponse(OK) + ["Content-Type: application/sdp"],
+		["v=0", "o=... 0 0 IN IP4 localhost", "t=0 0",
+			"m=audio {rtpPort:d} RTP/AVP 0"])
+	responseTemplates['bye_ok'] = ResponseTemplate(sessionResponse(OK))
+
+	# Responses to requests outside of a session
+	def response(code):
+		return ["SIP/2.0 " + RESPONSE[code], via, "To: {to}",
+			"From: " + sipFrom, "Call-ID: {callId}", "CSeq: {cseq}",
+			"Contact: " + sipFrom]
+
+	responseTemplates['options_ok'] = ResponseTemplate(response(OK) + [
+		"Allow: INVITE, ACK, CANCEL, OPTIONS, BYE",
+		"Accept: application/sdp", "Accept-Language: en"])
+	responseTemplates['cancel_ok'] = ResponseTemplate(response(OK))
+	responseTemplates['message_too_large'] = ResponseTemplate(
+		response(MESSAGE_TOO_LARGE))
+	responseTemplates['busy_here'] = ResponseTemplate(response(BUSY_HERE))
+	responseTemplates['bad_request'] = ResponseTemplate(response(BAD_REQUEST))
+	responseTemplates['unavailable'] = ResponseTemplate(
+		response(UNAVAILABLE) + ["Retry-After: 5"])
+
+	# Sent to blocked sources (and 'unavailable' to rate limited ones),
+	# rendered from the request headers without handling the request (see
+	# Sip.handle_read)
+	responseTemplates['blocked'] = ResponseTemplate(response(FORBIDDEN))
+	responseTemplates['unauthorized'] = ResponseTemplate(
+		response(UNAUTHORIZED) + ['WWW-Authenticate: Digest ' + \
+			'realm="{}",nonce="{{nonce}}",opaque="1234567890"'.format(realm)])
+	responseTemplates['unauthorized_stale'] = ResponseTemplate(
+		response(UNAUTHORIZED) + ['WWW-Authenticate: Digest ' + \
+			'realm="{}",nonce="{{nonce}}",opaque="1234567890",'
+			'stale=TRUE'.format(realm)])
+
+compileResponseTemplates()
+
+# Key of the digest nonces, created when the module is loaded so that forked
+# worker processes validate each other's nonces
+g_nonceKey = g_sipconfig['nonce_key'].encode('utf-8') or os.urandom(32)
+g_digestAuth = None
+
+def getDigestAuth():
+	"""Returns the digest authentication with the accounts of the
+	credentials file, or the one configured account (user and secret)"""
+	global g_digestAuth
+	if g_digestAuth is None:
+		path = g_sipconfig['credentials_file']
+		store = credentials.CredentialStore(getRealm(), path or None,
+			g_sipconfig['credentials_reload_interval'])
+		if not path:
+			store.add(g_sipconfig['user'], getRealm(), g_sipconfig['secret'])
+
+		g_digestAuth = digest.DigestAuth(
+			digest.NonceFactory(g_nonceKey, g_sipconfig['nonce_expiry']),
+			store, g_sipconfig['digest_cache_size'])
+	return g_digestAuth
+
+def newSessionTable():
+	"""Creates a session table with the limits from the SIP configuration"""
+	return sessiontable.SessionTable(g_sipconfig['max_sessions'],
+		g_sipconfig['max_sessions_per_source'],
+		g_sipconfig['session_evict_idle'])
+
 class SipParsingError(Exception):
-	"""Exception class for errors occuring during SIP message parsing"""
+	"""Exception class for errors occuring during SIP message parsing, reason
+	is the kind of error (label of the sip_parse_errors_total metric)"""
+	def __init__(self, message, reason="malformed"):
+		Exception.__init__(self, message)
+		self.reason = reason
+
+class SipMessageTooLarge(SipParsingError):
+	"""Raised by the stream framer for a message exceeding the maximum size,
+	headers holds its raw header lines (None if they are too long already)"""
+	def __init__(self, message, headers=None):
+		SipParsingError.__init__(self, message, "too_large")
+		self.headers = headers
+
+class SipMessage(object):
+	"""SIP request or response parsed from raw bytes. The header lines are
+	split up in a single pass on creation, header values are only decoded (and
+	cached) when they are accessed for the first time. Header values can be
+	read like a dictionary (msg["call-id"], "cseq" in msg)."""
+	__slots__ = ("type", "firstLine", "__raw", "__body", "__values", "__cseq",
+		"__authorization")
+
+	def __init__(self, data):
+		# The parser works on raw bytes and only decodes the values that are
+		# accessed later on
+		if isinstance(data, str):
+			data = data.encode('utf-8')
+		elif not isinstance(data, bytes):
+			data = bytes(data)
+
+		# Make sure decoding header values on demand cannot fail
+		if not data.isascii():
+			try:
+				data.decode('utf-8')
+			except UnicodeDecodeError:
+				raise SipParsingError("Message is not valid UTF-8",
+					"encoding")
+
+		# Sanitize input: remove superfluous leading and trailing newlines and
+		# spaces, then split into lines in one pass
+		data = data.strip(WHITESPACE)
+		lines = data.split(b"\n")
+
+		# Get message type (first word, smallest possible one is "ACK" or
+		# "BYE")
+		line = lines[0].rstrip(WHITESPACE)
+		sep = line.find(b" ")
+		if sep < 3:
+			raise SipParsingError("Malformed request or status line",
+				"request_line")
+
+		self.type = line[:sep].decode('utf-8')
+		self.firstLine = line[sep+1:].decode('utf-8')
+
+		# Record the raw (undecoded) value of each header up to the first empty
+		# line, everything after that is the body
+		raw = {}
+		body = b""
+		for i in range(1, len(lines)):
+			line = lines[i]
+			name, sep, value = line.partition(b":")
+
+			identifier = headerIdentifierCache.get(name)
+			if identifier is None:
+				# Break on empty line (end of headers)
+				if not line.strip(WHITESPACE):
+					body = b"\n".join(lines[i+1:])
+					break
+
+				if not sep or not name.strip(WHITESPACE):
+					raise SipParsingError("Malformed header line (no ':')",
+						"header_line")
+
+				# Get header identifier (word before the ':')
+				key = name.strip(WHITESPACE).lower()
+				identifier = headerIdentifiers.get(key)
+				if identifier is None:
+					raise SipParsingError("Unknown header type: {}".format(
+						key.decode('utf-8', 'replace')), "unknown_header")
+
+				if len(headerIdentifierCache) < HEADER_IDENTIFIER_CACHE_SIZE:
+					headerIdentifierCache[name] = identifier
+
+			# The Via header can occur multiple times
+			if identifier == "via":
+				if identifier not in raw:
+					raw["via"] = [value]
+				else:
+					raw["via"].append(value)
+
+			# Any other header occurrence replaces the previous one
+			else:
+				raw[identifier] = value
+
+		self.__raw = raw
+		self.__body = body
+		self.__values = {}
+		self.__cseq = None
+		self.__authorization = None
+
+	@staticmethod
+	def __decode(value):
+		return value.strip(WHITESPACE).decode('utf-8')
+
+	def __contains__(self, name):
+		return name in self.__raw
+
+	def __getitem__(self, name):
+		"""Returns the decoded value of a header (long form identifier), a list
+		of values for the Via header. Raises KeyError for missing headers."""
+		value = self.__values.get(name)
+		if value is not None:
+			return value
+
+		value = self.__raw[name]
+		if name == "via":
+			value = [self.__decode(v) for v in value]
+		else:
+			value = self.__decode(value)
 
-def parseSipMessage(msg):
-	"""Parses a SIP message (string), returns a tupel (type, firstLine, header,
-	body)"""
-	# Sanitize input: remove superfluous leading and trailing newlines and
-	# spaces
-	msg = msg.strip("\n\r\t ")
+		self.__values[name] = value
+		return value
+
+	def get(self, name, default=None):
+		if name not in self.__raw:
+			return default
 
-	# Split request/status line plus headers and body: we don't care about the
-	# body in the SIP parser
-	parts = msg.split("\n\n", 1)
-	if len(parts) < 1:
-		logger.error("Message too short")
-		raise SipParsingError("Message too short")
+		return self[name]
 
-	msg = parts[0]
+	@property
+	def headers(self):
+		"""Dictionary of all header values (decodes every header)"""
+		return dict((name, self[name]) for name in self.__raw)
 
-	# Python way of doing a ? b : c
-	body = len(parts) == 2 and parts[1] or ""
+	@property
+	def body(self):
+		return self.__body.decode('utf-8')
 
-	# Normalize line feed and carriage return to \n
-	msg = msg.replace("\n\r", "\n")
+	@property
+	def requestUri(self):
+		"""Request-URI of a request (the first line without the version)"""
+		return self.firstLine.rpartition(" ")[0]
 
-	# Split lines into a list, each item containing one line
-	lines = msg.split('\n')
+	@property
+	def via(self):
+		"""List of all Via header values in the order of appearance"""
+		return self.get("via", [])
 
-	# Get message type (first word, smallest possible one is "ACK" or "BYE")
-	sep = lines[0].find(' ')
-	if sep < 3:
-		raise SipParsingError("Malformed request or status line")
+	@property
+	def cseq(self):
+		"""Tupel (sequence number, method) of the CSeq header"""
+		if self.__cseq is None:
+			parts = self["cseq"].split()
+			if len(parts) != 2 or not parts[0].isdigit():
+				raise SipParsingError("Malformed CSeq header", "cseq")
 
-	msgType = lines[0][:sep]
-	firstLine = lines[0][sep+1:]
+			self.__cseq = (int(parts[0]), parts[1])
 
-	# Done with first line: delete from list of lines
-	del lines[0]
+		return self.__cseq
 
-	# Parse header
+	@property
+	def authorization(self):
+		"""Tupel (scheme, parameter dictionary) of the Authorization header or
+		None if the message does not contain one"""
+		if self.__authorization is None and "authorization" in self:
+			scheme, _, authLine = self["authorization"].partition(' ')
+
+			# Get Authorization header parts (a="a", b="b", c="c", ...) and put
+			# them in a dictionary for easy lookup
+			params = {}
+			for x in authLine.split(','):
+				k, _, v = x.partition('=')
+				params[k.strip(' \t\r\n')] = v.strip(' \n\r\t"\'')
+
+			self.__authorization = (scheme, params)
+
+		return self.__authorization
+
+def rejectHeaders(buf, nbytes):
+	"""From, Call-ID and CSeq of the request in the first nbytes of buf,
+	found by a scan of its first REJECT_SCAN_SIZE bytes without parsing the
+	request. Returns a dict of the decoded values by long form identifier,
+	None for responses, ACKs (which are never answered) and requests without
+	all of them within the scanned bytes."""
+	end = min(nbytes, REJECT_SCAN_SIZE)
+	start = buf[:end].lstrip(WHITESPACE)
+	if start.startswith(b"SIP/2.0 ") or start.startswith(b"ACK "):
+		return None
+
+	m = HEADER_END.search(buf, 0, end)
+	if m is not None:
+		end = m.start()
 	headers = {}
-	for i in range(len(lines)):
-		# Take first line and remove from list of lines
-		line = lines.pop(0)
-
-		# Strip each line of leading and trailing whitespaces
-		line = line.strip("\n\r\t ")
-
-		# Break on empty line (end of headers)
-		if len(line.strip(' ')) == 0:
-			break
-
-		# Parse header lines
-		sep = line.find(':')
-		if sep < 1:
-			raise SipParsingError("Malformed header line (no ':')")
-
-		# Get header identifier (word before the ':')
-		identifier = line[:sep]
-		identifier = identifier.lower()
-
-		# Check for valid header
-		if identifier not in shortHeaders.keys() and \
-			identifier not in longHeaders.keys():
-			raise SipParsingError("Unknown header type: {}".format(identifier))
-
-		# Get long header identifier if necessary
-		if identifier in longHeaders.keys():
-			identifier = longHeaders[identifier]
-
-		# Get header value (line after ':')
-		value = line[sep+1:].strip(' ')
-
-		# The Via header can occur multiple times
-		if identifier == "via":
-			if identifier not in headers:
-				headers["via"] = [value]
-			else:
-				headers["via"].append(value)
+	for m in REJECT_HEADERS.finditer(buf, 0, end):
+		headers[headerIdentifiers[m.group(1).lower()]] = m.group(2)
+	if len(headers) < 3:
+		return None
 
-		# Assign any other header value directly to the header key
-		else:
-			headers[identifier] = value
+	try:
+		return {k: bytes(v).strip(WHITESPACE).decode('utf-8')
+			for k, v in headers.items()}
+	except UnicodeDecodeError:
+		return None
 
-	# Return message type, header dictionary, and body string
-	return (msgType, firstLine, headers, body)
+def parseSipMessage(msg):
+	"""Parses a SIP message (bytes, bytearray, memoryview or string), returns a
+	tupel (type, firstLine, header, body)"""
+	msg = SipMessage(msg)
 
-class RtpUdpStream(connection):
+	# Return message type, header dictionary, and body string
+	return (msg.type, msg.firstLine, msg.headers, msg.body)
+
+class SipStreamFramer(object):
+	"""Incremental framer for SIP over stream transports (TCP). Received data
+	is appended to a buffer, complete messages are split off using the header
+	terminator (empty line) and the Content-Length header."""
+	def __init__(self, maxMessageSize=MAX_STREAM_MESSAGE_SIZE):
+		self.__buffer = bytearray()
+		self.__maxMessageSize = maxMessageSize
+
+		# Position up to which the buffer has been searched for the end of the
+		# headers, so that a message arriving in many small reads is not
+		# scanned from the beginning every time (the search resumes at the
+		# last line break before that position)
+		self.__scanned = 0
+
+		# Total length of the message at the start of the buffer, known as
+		# soon as its headers are complete
+		self.__messageLength = None
+
+	def feed(self, data):
+		"""Appends received data and returns a list of complete messages
+		(bytes). Raises SipParsingError if the stream cannot be framed."""
+		buf = self.__buffer
+		buf += data
+		messages = []
+
+		while True:
+			# Skip keep-alive line breaks between messages (RFC 5626)
+			start = 0
+			while start < len(buf) and buf[start] in WHITESPACE:
+				start += 1
+			if start:
+				del buf[:start]
+				self.__scanned = 0
+
+			if self.__messageLength is None:
+				# Search for the empty line after the headers
+				m = HEADER_END.search(buf,
+					max(buf.rfind(b"\n", 0, self.__scanned) - 1, 0))
+				if not m:
+					self.__scanned = len(buf)
+					if len(buf) > self.__maxMessageSize:
+						raise SipMessageTooLarge("Message headers too long")
+					break
+
+				m2 = CONTENT_LENGTH.search(buf, 0, m.start())
+				contentLength = m2 and int(m2.group(1)) or 0
+				self.__messageLength = m.end() + contentLength
+				if self.__messageLength > self.__maxMessageSize:
+					raise SipMessageTooLarge("Message too large",
+						bytes(buf[:m.start()]))
+
+			# Wait for the rest of the body
+			if len(buf) < self.__messageLength:
+				break
+
+			messages.append(bytes(buf[:self.__messageLength]))
+
+			# Deleting from the front of a bytearray does not move the
+			# remaining data
+			del buf[:self.__messageLength]
+			self.__messageLength = None
+			self.__scanned = 0
+
+		return messages
+
+class RtpUdpStream(object):
 	"""RTP stream that can send data and writes the whole conversation to a
-	file"""
-	def __init__(self, address, port):
-		connection.__init__(self, 'udp')
+	file. The stream uses a port of the media manager, which passes received
+	packets to handle_packet."""
+	def __init__(self, address, port, mediaManager=None, dumpWriter=None):
+		# The address and port of the remote host (converted first, so that
+		# an invalid port does not leave a local port allocated)
+		self.__address = address
+		self.__port = int(port)
 
-		# Bind to free random port for incoming RTP traffic
-		self.bind(('',0))
-		self.__localport = self.getsockname()[1]
+		# Take a port from the preallocated RTP port range
+		if mediaManager is None:
+			mediaManager = media.getMediaManager()
+		self.__media = mediaManager
+		self.__localport = self.__media.allocate(self)
+		if self.__localport is None:
+			raise media.MediaError("No free RTP port")
 
-		# The address and port of the remote host
-		self.__address = address
-		self.__port = port
+		# Time of the last packet received (time.monotonic), used to detect
+		# inactive sessions
+		self.lastActivity = time.monotonic()
 
-		# Send byte buffer
-		self.__sendBuffer = b''
+		# Per-SSRC statistics of the received packets (see rtpstats), created
+		# with the first packet
+		self.stats = None
+
+		# Playback scheduler while the announcement is played to the remote
+		# host
+		self.__playback = None
 
 		# Create a stream dump file with date and time and random ID in case of
-		# flooding attacks
+		# flooding attacks (the file is written by the dump writer thread)
 		dumpDateTime = time.strftime("%Y%m%d_%H:%M:%S")
 		dumpId = random.randint(1000, 9999)
-		streamDumpFile = "stream_{0}_{1}.rtpdump".format(dumpDateTime, dumpId)
+		streamDumpFile = "stream_{0}_{1}.pcap".format(dumpDateTime, dumpId)
 
-		# Catch IO errors
-		try:
-			self.__streamDump = open(streamDumpFile, "wb")
-		except IOError as e:
-			logger.error("Could not open stream dump file: {}".format(e))
-			self.__streamDump = None
+		# pcap dump with an index, packets are framed with their time and
+		# addresses (see pcapdump)
+		if dumpWriter is None:
+			dumpWriter = dumpwriter.getDumpWriter()
+		self.__streamDump = pcapdump.PcapStreamDump(dumpWriter, streamDumpFile,
+			self.getsockname())
 
-		logger.debug("Created RTP channel :{} <-> :{}".format(
-			self.__localport, self.__port))
+		logger.debug("Created RTP channel :%s <-> :%s",
+			self.__localport, self.__port)
 
-	def writable(self):
-		return len(self.__sendBuffer) > 0
+	@property
+	def closed(self):
+		return self.__localport is None
 
-	def handle_close(self):
-		self.close()
+	def getsockname(self):
+		return (self.__media.address, self.__localport)
 
-	def handle_read(self):
-		# Don't have to get address and port because they're already known since
-		# __init__
+	def handle_packet(self, data, address):
+		"""Called by the media manager for every packet received on the local
+		port"""
 		logger.debug("Incoming RTP data ...")
-		data, _ = self.recvfrom(1024)
-
-		# Write data to disk
-		# TODO: Make sure this cannot cause DoS
-		if self.__streamDump:
-			self.__streamDump.write(data)
+		self.lastActivity = time.monotonic()
 
-	def handle_write(self):
-		# Because of the writable function, handle_write will only be called if
-		# there is data in the send buffer
-		bytesSent = self.send(self.__sendBuffer)
+		if self.stats is None:
+			self.stats = rtpstats.RtpStreamStats()
+		self.stats.update(data, self.lastActivity)
 
-		# Write the sent part of the buffer to the stream dump file
-		# TODO: separate inbound and outbound traffic?
+		# Buffer data for the dump writer (bounded by the dump quotas)
 		if self.__streamDump:
-			self.__streamDump.write(self.__sendBuffer[:bytesSend])
+			self.__streamDump.write(data, pcapdump.INBOUND, address)
+
+	def startPlayback(self):
+		"""Starts playing the announcement to the remote host (if playback is
+		enabled)"""
+		scheduler = playback.getPlaybackScheduler()
+		if scheduler is not None and self.__localport is not None:
+			self.__playback = scheduler
+			scheduler.add(self)
+
+	def send(self, msg, dump=True):
+		"""Sends an RTP packet to the remote host (packets are dropped if the
+		socket buffer is full, RTP has no retransmissions). The announcement
+		is sent with dump=False, its packets are known."""
+		if self.__localport is None:
+			return
 
-		# Shift sending window for next send or handle_write operation
-		self.__sendBuffer = self.__sendBuffer[bytesSend:]
+		if isinstance(msg, str):
+			msg = msg.encode('utf-8')
+		self.__media.sendto(self.__localport, msg, (self.__address, self.__port))
 
-	def send(self, msg):
-		# Append to send buffer, handle_write will take care of socket operation
-		self.__sendBuffer += msg.encode('utf-8')
+		# Write the sent packet to the stream dump file
+		if dump and self.__streamDump:
+			self.__streamDump.write(msg, pcapdump.OUTBOUND,
+				(self.__address, self.__port))
 
 	def close(self):
+		if self.__playback is not None:
+			self.__playback.remove(self)
+			self.__playback = None
+
 		if self.__streamDump:
 			self.__streamDump.close()
+			self.__streamDump = None
 
-		connection.close(self)
+		if self.__localport is not None:
+			self.__media.release(self.__localport)
+			self.__localport = None
 
 class SipSession(object):
 	"""Usually, a new SipSession instance is created when the SIP server
@@ -359,181 +746,525 @@ class SipSession(object):
 	NO_SESSION, SESSION_SETUP, ACTIVE_SESSION, SESSION_TEARDOWN = range(4)
 	sipConnection = None
 
-	def __init__(self, conInfo, rtpPort, inviteHeaders):
-		if not SipSession.sipConnection:
+	# Only the values needed by later requests are kept (not the INVITE
+	# message), everything else is part of the shared response templates
+	__slots__ = ("__sipConnection", "__onClose", "__timer", "__state",
+		"__callId", "__sipTo", "__cseq", "__remoteAddress", "__remoteSipPort",
+		"__remoteRtpPort", "__rtpStream", "__lastActivity")
+
+	# Number of sessions that have been closed because of a timeout
+	expiredCount = 0
+
+	def __init__(self, conInfo, rtpPort, inviteMessage, sipConnection=None,
+			onClose=None):
+		# Responses go back over the connection the INVITE came in on (UDP
+		# socket or TCP connection), the class variable is the fallback
+		self.__sipConnection = sipConnection or SipSession.sipConnection
+		if not self.__sipConnection:
 			logger.error("SIP connection class variable not set")
 
-		# Store incoming information of the remote host
-		self.__inviteHeaders = inviteHeaders
-		self.__state = SipSession.SESSION_SETUP
-		self.__remoteAddress = conInfo[0]
+		# Called with the session when it is closed (to remove it from the
+		# table of sessions)
+		self.__onClose = onClose
+
+		# Timeout of the current state, see __setState
+		self.__timer = None
+
+		# Store incoming information of the remote host (a flood comes from
+		# few addresses, so the address strings are shared)
+		self.__state = SipSession.NO_SESSION
+		self.__remoteAddress = sys.intern(conInfo[0])
 		self.__remoteSipPort = conInfo[1]
 		self.__remoteRtpPort = rtpPort
 
-		# Generate static values for SIP messages
-		global g_sipconfig
-		self.__sipTo = inviteHeaders['from']
-		self.__sipFrom = "{0} <sip:{0}@{1}>".format(g_sipconfig['user'],
-			g_sipconfig['ip'])
-		self.__sipVia = "SIP/2.0/UDP {}:{}".format(g_sipconfig['ip'],
-			g_sipconfig['port'])
+		# Time of the last SIP request of this session (time.monotonic)
+		self.__lastActivity = time.monotonic()
+
+		# Per-session values for SIP responses
+		self.__callId = inviteMessage['call-id']
+		self.__sipTo = inviteMessage['from']
+		self.__cseq = inviteMessage['cseq']
 
 		# Create RTP stream instance and pass address and port of listening
 		# remote RTP host
 		self.__rtpStream = RtpUdpStream(self.__remoteAddress,
 			self.__remoteRtpPort)
+		self.__setState(SipSession.SESSION_SETUP)
 
 		# Send 180 Ringing to make honeypot appear more human-like
 		# TODO: Delay between 180 and 200
-		msgLines = []
-		msgLines.append("SIP/2.0 " + RESPONSE[RINGING])
-		msgLines.append("Via: " + self.__sipVia)
-		msgLines.append("Max-Forwards: 70")
-		msgLines.append("To: " + self.__sipTo)
-		msgLines.append("From: " + self.__sipFrom)
-		msgLines.append("Call-ID: {}".format(self.__inviteHeaders['call-id']))
-		msgLines.append("CSeq: 1 INVITE")
-		msgLines.append("Contact: " + self.__sipFrom)
-		msgLines.append("User-Agent: " + g_sipconfig['useragent'])
-		SipSession.sipConnection.send('\n'.join(msgLines))
+		self.__sipConnection.send(responseTemplates['ringing'].render(
+			to=self.__sipTo, callId=self.__callId, cseq=self.__cseq))
 
 		# Send our RTP port to the remote host as a 200 OK response to the
 		# remote host's INVITE request
-		logger.debug("getsockname: {}".format(self.__rtpStream.getsockname()))
+		logger.debug("getsockname: %s", self.__rtpStream.getsockname())
 		localRtpPort = self.__rtpStream.getsockname()[1]
-		
-		msgLines = []
-		msgLines.append("SIP/2.0 " + RESPONSE[OK])
-		msgLines.append("Via: " + self.__sipVia)
-		msgLines.append("Max-Forwards: 70")
-		msgLines.append("To: " + self.__sipTo)
-		msgLines.append("From: " + self.__sipFrom)
-		msgLines.append("Call-ID: {}".format(self.__inviteHeaders['call-id']))
-		msgLines.append("CSeq: 1 INVITE")
-		msgLines.append("Contact: " + self.__sipFrom)
-		msgLines.append("User-Agent: " + g_sipconfig['useragent'])
-		msgLines.append("Content-Type: application/sdp")
-		msgLines.append("\nv=0")
-		msgLines.append("o=... 0 0 IN IP4 localhost")
-		msgLines.append("t=0 0")
-		msgLines.append("m=audio {} RTP/AVP 0".format(localRtpPort))
-		SipSession.sipConnection.send('\n'.join(msgLines))
-
-	def handle_ACK(self, headers, body):
+
+		self.__sipConnection.send(responseTemplates['invite_ok'].render(
+			to=self.__sipTo, callId=self.__callId, cseq=self.__cseq,
+			rtpPort=localRtpPort))
+
+	def handle_ACK(self, msg):
+		self.__lastActivity = time.monotonic()
 		if self.__state == SipSession.SESSION_SETUP:
 			logger.debug(
 				"Waiting for ACK after INVITE -> got ACK -> active session")
-			logger.info("Connection accepted (session {})".format(
-				self.__inviteHeaders['call-id']))
+			logger.info("Connection accepted (session %s)",
+				self.__callId)
 
-			# Set current state to active (ready for multimedia stream)
-			self.__state = SipSession.ACTIVE_SESSION
+			# Set current state to active (ready for multimedia stream) and
+			# start talking back
+			self.__setState(SipSession.ACTIVE_SESSION)
+			self.__rtpStream.startPlayback()
 
-	def handle_BYE(self, headers, body):
-		global g_sipconfig
+	def handle_BYE(self, msg):
+		self.__lastActivity = time.monotonic()
+
+		# A BYE ends the media stream immediately, the session is kept until
+		# the teardown timeout to answer retransmitted BYEs
+		self.__rtpStream.close()
+		if self.__state != SipSession.SESSION_TEARDOWN:
+			self.__setState(SipSession.SESSION_TEARDOWN)
 
-		# Only close down RTP stream if session is active
+		# Send OK response to other client
+		self.__sipConnection.send(responseTemplates['bye_ok'].render(
+			to=self.__sipTo, callId=self.__callId, cseq=msg['cseq']))
+
+	@property
+	def callId(self):
+		return self.__callId
+
+	@property
+	def state(self):
+		return self.__state
+
+	@property
+	def remoteAddress(self):
+		return self.__remoteAddress
+
+	@property
+	def lastActivity(self):
+		"""Time of the last SIP request or RTP packet (time.monotonic)"""
+		return max(self.__lastActivity, self.__rtpStream.lastActivity)
+
+	@property
+	def rtpStats(self):
+		"""rtpstats.SourceStats of every SSRC received so far"""
+		stats = self.__rtpStream.stats
+		return stats.summary() if stats is not None else []
+
+	def __setState(self, state):
+		"""Changes the state and (re)starts the timeout of the new state"""
+		self.__state = state
+		self.__record({
+			SipSession.SESSION_SETUP: eventstore.SESSION_SETUP,
+			SipSession.ACTIVE_SESSION: eventstore.SESSION_ACTIVE,
+			SipSession.SESSION_TEARDOWN: eventstore.SESSION_TEARDOWN
+		}[state])
+
+		timers = getTimerWheel()
+		if self.__timer is not None:
+			timers.cancel(self.__timer)
+
+		timeout = {
+			SipSession.SESSION_SETUP: g_sipconfig['session_setup_timeout'],
+			SipSession.ACTIVE_SESSION: g_sipconfig['session_rtp_timeout'],
+			SipSession.SESSION_TEARDOWN:
+				g_sipconfig['session_teardown_timeout']
+		}[state]
+		self.__timer = timers.schedule(timeout, self.__timeout)
+
+	def __timeout(self):
+		self.__timer = None
+
+		# RTP packets don't touch the timer, check when the last one arrived
+		# and wait for the rest of the inactivity timeout
 		if self.__state == SipSession.ACTIVE_SESSION:
-			self.__rtpStream.close()
+			idle = time.monotonic() - self.__rtpStream.lastActivity
+			remaining = g_sipconfig['session_rtp_timeout'] - idle
+			if remaining > 0:
+				self.__timer = getTimerWheel().schedule(remaining,
+					self.__timeout)
+				return
+
+		if self.__state != SipSession.SESSION_TEARDOWN:
+			logger.info("Session %s timed out", self.callId)
+			SipSession.expiredCount += 1
+
+		self.close()
+
+	def __record(self, kind, data=None):
+		"""Stores a state change of the session as an event"""
+		events = eventstore.g_eventStore
+		if events is not None:
+			events.add(kind, self.__remoteAddress, self.__remoteSipPort,
+				self.__callId, data=data)
+
+	def close(self):
+		"""Closes the RTP stream and removes the session"""
+		if self.__state == SipSession.NO_SESSION:
+			return
+
+		# The state the session ends in tells how it ended (teardown after a
+		# BYE, setup or active after a timeout or CANCEL)
+		if eventstore.g_eventStore is not None:
+			self.__record(eventstore.SESSION_CLOSED, {'state': self.__state,
+				'rtp': [s._asdict() for s in self.rtpStats]})
 
-		# A BYE ends the session immediately
 		self.__state = SipSession.NO_SESSION
+		if self.__timer is not None:
+			getTimerWheel().cancel(self.__timer)
+			self.__timer = None
 
-		# Send OK response to other client
-		msgLines = []
-		msgLines.append("SIP/2.0 200 OK")
-		msgLines.append("Via: " + self.__sipVia)
-		msgLines.append("Max-Forwards: 70")
-		msgLines.append("To: " + self.__sipTo)
-		msgLines.append("From: " + self.__sipFrom)
-		msgLines.append("Call-ID: {}".format(self.__inviteHeaders['call-id']))
-		msgLines.append("CSeq: 1 BYE")
-		msgLines.append("Contact: " + self.__sipFrom)
-		msgLines.append("User-Agent: " + g_sipconfig['useragent'])
-		SipSession.sipConnection.send('\n'.join(msgLines))
+		self.__rtpStream.close()
+		if self.__onClose:
+			self.__onClose(self)
 
 class Sip(connection):
-	"""Only UDP connections are supported at the moment"""
-	def __init__(self):
-		connection.__init__(self, 'udp')
+	"""SIP server on a UDP socket (default) or on an accepted TCP connection
+	(see SipTcpConnection)"""
+	def __init__(self, proto='udp', sock=None, sessions=None):
+		connection.__init__(self, proto, sock)
 
 		# Set SIP connection in session class variable
-		SipSession.sipConnection = self
+		if not sock:
+			SipSession.sipConnection = self
+
+		# Table of SIP sessions (key is call-id), may be shared with other
+		# connections so that a dialog can span transports
+		if sessions is None:
+			sessions = newSessionTable()
+		self.__sessions = sessions
+
+		# Responses sent for recent datagrams, replayed for retransmissions
+		# (only UDP, stream transports don't retransmit)
+		self.__retransmissions = None
+		if proto == 'udp':
+			self.__retransmissions = RetransmissionCache(
+				g_sipconfig['retransmission_cache_size'],
+				g_sipconfig['retransmission_cache_ttl'])
+
+		# Responses sent while handling the current datagram
+		self.__sentResponses = None
+
+		# Datagrams are received in batches into preallocated buffers, the
+		# responses to a batch are queued and sent together at its end
+		self.__batchSize = g_sipconfig['recv_batch_size']
+		self.__bufferPool = None
+		if proto == 'udp':
+			self.__bufferPool = BufferPool(MAX_DATAGRAM_SIZE, self.__batchSize)
+
+		# Larger messages are answered with 513 Message Too Large
+		self.maxMessageSize = g_sipconfig['max_message_size']
+
+		# Admission control, applied to received datagrams before parsing
+		self.__limiter = None
+		if proto == 'udp' and g_sipconfig['ratelimit_rate'] > 0:
+			self.__limiter = TokenBucketLimiter(g_sipconfig['ratelimit_rate'],
+				g_sipconfig['ratelimit_burst'], g_sipconfig['ratelimit_sources'])
+		self.__sendQueue = collections.deque()
+		self.__queueing = False
+
+		# In worker mode (see workers.py) datagrams of dialogs that belong to
+		# another worker process are forwarded to it by this router
+		self.router = None
+
+		# Requests and authentication results are stored as events (None if
+		# no event database is configured)
+		self.__events = eventstore.getEventStore()
+
+	def send(self, data):
+		"""Sends a SIP message (bytes) to the remote host of the message that
+		is currently handled"""
+		logger.debug("sending to (%s:%s)",
+			self.__remoteAddress, self.__remoteSipPort)
+		if self.__sentResponses is not None:
+			self.__sentResponses.append(data)
+
+		self.__sendQueue.append(
+			(data, (self.__remoteAddress, self.__remoteSipPort)))
+		if not self.__queueing:
+			self.flush()
+
+	def flush(self):
+		"""Sends all queued datagrams. If the socket buffer is full, the rest
+		is sent by handle_write once the socket is writable again."""
+		queue = self.__sendQueue
+		while queue:
+			data, address = queue[0]
+			try:
+				self.sendto(data, address)
+			except (BlockingIOError, InterruptedError):
+				break
+			except OSError as e:
+				logger.error("Could not send to %s:%s: %s",
+					address[0], address[1], e)
+			else:
+				# Status code of "SIP/2.0 200 OK..."
+				g_responsesMetric.inc((data[8:11],))
+			queue.popleft()
 
-		# Dictionary with SIP sessions (key is call-id)
-		self.__sessions = {}
+	def writable(self):
+		return len(self.__sendQueue) > 0
 
-	def send(self, s):
-		logger.debug("sending to ({}:{})".format(
-			self.__remoteAddress, self.__remoteSipPort))
-		self.sendto(s.encode('utf-8'),
-			(self.__remoteAddress, self.__remoteSipPort))
+	def handle_write(self):
+		self.flush()
+
+	def stats(self):
+		"""Dictionary of counters describing the work done by this
+		connection"""
+		stats = {
+			'sessions': len(self.__sessions),
+			'sessions_expired': SipSession.expiredCount,
+			'sessions_evicted': self.__sessions.evictions,
+			'sessions_rejected_source': self.__sessions.rejectedSource,
+			'sessions_rejected_full': self.__sessions.rejectedFull,
+			'tcp_connections': SipTcpConnection.openCount,
+			'tcp_idle_closed': SipTcpConnection.idleCount,
+			'tcp_rejected': SipTcp.rejectedCount
+		}
+		if self.__retransmissions is not None:
+			stats['retransmission_hits'] = self.__retransmissions.hits
+			stats['retransmission_misses'] = self.__retransmissions.misses
+			stats['retransmission_evictions'] = \
+				self.__retransmissions.evictions
+		if self.__limiter is not None:
+			stats['ratelimit_shed'] = self.__limiter.shed
+			stats['ratelimit_evictions'] = self.__limiter.evictions
+		if media.g_mediaManager is not None:
+			stats.update(media.g_mediaManager.stats())
+		if dumpwriter.g_dumpWriter is not None:
+			stats.update(dumpwriter.g_dumpWriter.stats())
+		if playback.g_playbackScheduler is not None:
+			stats.update(playback.g_playbackScheduler.stats())
+		if g_digestAuth is not None:
+			stats['auth_authorized'] = g_digestAuth.authorized
+			stats['auth_stale'] = g_digestAuth.stale
+			stats['auth_failed'] = g_digestAuth.failed
+			stats['credentials_accounts'] = len(g_digestAuth.accounts)
+			stats['credentials_reloads'] = g_digestAuth.accounts.reloads
+		if bruteforce.g_detector is not None:
+			stats.update(bruteforce.g_detector.stats())
+		if eventstore.g_eventStore is not None:
+			stats.update(eventstore.g_eventStore.stats())
+		stats.update(logqueue.stats())
+		return stats
 
 	def handle_read(self):
-		"""Callback for handling incoming SIP traffic"""
-		# TODO: Handle long messages
-		data, conInfo = self.recvfrom(1024)
+		"""Callback for handling incoming SIP traffic. Drains up to
+		recv_batch_size datagrams per readiness event into buffers from the
+		pool, handles them and then sends all responses."""
+		pool = self.__bufferPool
+		limiter = self.__limiter
+		prefix24 = g_sipconfig['ratelimit_prefix24']
+		detector = None
+		if g_sipconfig['bruteforce_block_time'] > 0:
+			detector = bruteforce.getDetector()
+		now = time.monotonic()
+		batch = []
+		for i in range(self.__batchSize):
+			buf = pool.get()
+			try:
+				nbytes, conInfo = self.recvfrom_into(buf)
+			except (BlockingIOError, InterruptedError):
+				pool.put(buf)
+				break
+			except OSError as e:
+				# ICMP errors caused by earlier datagrams are reported here
+				pool.put(buf)
+				if e.errno == errno.ECONNREFUSED:
+					continue
+				raise
+
+			# Shed datagrams of sources over their budget before parsing
+			if limiter is not None and \
+					not limiter.allow(sourceKey(conInfo[0], prefix24), now):
+				if g_sipconfig['ratelimit_reply']:
+					self.__reject('unavailable', buf, nbytes, conInfo)
+				pool.put(buf)
+				continue
+
+			# Sources caught guessing passwords get a 403
+			if detector is not None and detector.blocked(conInfo[0], now):
+				self.__reject('blocked', buf, nbytes, conInfo)
+				pool.put(buf)
+				continue
+
+			batch.append((buf, nbytes, conInfo))
+
+		self.__queueing = True
+		try:
+			for buf, nbytes, conInfo in batch:
+				# A datagram that cannot be handled only loses itself, not
+				# the rest of the batch
+				try:
+					self.handle_datagram(memoryview(buf)[:nbytes], conInfo)
+				except Exception:
+					logger.exception("Unhandled exception for datagram from "
+						"%s:%s", conInfo[0], conInfo[1])
+		finally:
+			self.__queueing = False
+			for buf, nbytes, conInfo in batch:
+				pool.put(buf)
+			self.flush()
+
+	def __reject(self, name, buf, nbytes, conInfo):
+		"""Queues the response template name for a request that is not
+		handled. Only the headers of the response are read from the request
+		(see rejectHeaders), datagrams that are not requests or lack them
+		are dropped silently."""
+		headers = rejectHeaders(buf, nbytes)
+		if headers is None:
+			return
+		self.__sendQueue.append((responseTemplates[name].render(
+			to=headers['from'], callId=headers['call-id'],
+			cseq=headers['cseq']), conInfo))
+
+	def handle_datagram(self, data, conInfo):
+		"""Handles a single datagram (bytes-like) received from conInfo"""
+		if self.router is not None and self.router.forward(data, conInfo):
+			return
+
+		if len(data) > self.maxMessageSize:
+			# Only the headers are parsed to address the response
+			g_parseErrorsMetric.inc(("too_large",))
+			m = HEADER_END.search(data, 0, self.maxMessageSize)
+			self.sendTooLarge(m and data[:m.start()], conInfo)
+			return
+
+		# Replay the responses for an exact retransmission without parsing
+		key = (conInfo, datagramDigest(data))
+		responses = self.__retransmissions.get(key)
+		if responses is not None:
+			logger.debug("Retransmission from %s:%s",
+				conInfo[0], conInfo[1])
+			self.__sendQueue.extend((r, conInfo) for r in responses)
+			if not self.__queueing:
+				self.flush()
+			return
+
+		self.__sentResponses = []
+		try:
+			self.handle_message(data, conInfo)
+		finally:
+			responses = tuple(self.__sentResponses)
+			self.__sentResponses = None
+
+		self.__retransmissions.put(key, responses)
+
+	def sendTooLarge(self, headers, conInfo):
+		"""Answers a request from conInfo exceeding maxMessageSize with 513
+		Message Too Large, headers are its raw header lines (None if they
+		could not be found within the size limit)"""
 		self.__remoteAddress = conInfo[0]
 		self.__remoteSipPort = conInfo[1]
 
-		# Get byte data and decode to string
-		data = data.decode("utf-8")
+		logger.warning("Message from %s:%s exceeds %s bytes",
+			conInfo[0], conInfo[1], self.maxMessageSize)
+		if headers is None:
+			return
+
+		try:
+			msg = SipMessage(headers)
+		except SipParsingError as e:
+			logger.error("Error while parsing SIP message: %s", e)
+			return
+
+		# Responses are never answered
+		if msg.type == 'SIP/2.0':
+			return
+
+		if self.__checkForMissingHeaders(msg, ["from", "call-id", "cseq"]):
+			return
+
+		self.send(responseTemplates['message_too_large'].render(
+			to=msg['from'], callId=msg['call-id'], cseq=msg['cseq']))
+
+	def handle_message(self, data, conInfo):
+		"""Parses a complete SIP message (bytes) received from the remote host
+		conInfo (address, port) and hands it to its sip_* handler"""
+		self.__remoteAddress = conInfo[0]
+		self.__remoteSipPort = conInfo[1]
 
-		# Parse SIP message
+		# Parse SIP message (the parser works directly on the received bytes)
+		start = time.perf_counter()
 		try:
-			msgType, firstLine, headers, body = parseSipMessage(data)
+			msg = SipMessage(data)
 		except SipParsingError as e:
+			g_parseErrorsMetric.inc((e.reason,))
 			logger.error(e)
 			return
+		parsed = time.perf_counter()
+		g_parseSecondsMetric.observe(parsed - start)
 
+		# Requests are stored before they are handled, so rejected ones are
+		# stored as well (data may be a view of a reused receive buffer)
+		if self.__events is not None and msg.type != 'SIP/2.0':
+			self.__events.add(msg.type, conInfo[0], conInfo[1],
+				msg.get('call-id'), msg.get('user-agent'), bytes(data))
+
+		# Header values are parsed on demand, so a malformed value can still
+		# show up while handling the message
+		try:
+			self.dispatch(msg)
+		except SipParsingError as e:
+			g_parseErrorsMetric.inc((e.reason,))
+			logger.error(e)
+		g_handleSecondsMetric.observe(time.perf_counter() - parsed)
+
+	def dispatch(self, msg):
+		"""Dispatches a parsed SIP message to its sip_* handler"""
+		msgType = msg.type
+		g_requestsMetric.inc((METHOD_LABELS.get(msgType, "other"),))
 		if msgType == 'INVITE':
-			self.sip_INVITE(firstLine, headers, body)
+			self.sip_INVITE(msg)
 		elif msgType == 'ACK':
-			self.sip_ACK(firstLine, headers, body)
+			self.sip_ACK(msg)
 		elif msgType == 'OPTIONS':
-			self.sip_OPTIONS(firstLine, headers, body)
+			self.sip_OPTIONS(msg)
 		elif msgType == 'BYE':
-			self.sip_BYE(firstLine, headers, body)
+			self.sip_BYE(msg)
 		elif msgType == 'CANCEL':
-			self.sip_CANCEL(firstLine, headers, body)
+			self.sip_CANCEL(msg)
 		elif msgType == 'REGISTER':
-			self.sip_REGISTER(firstLine, headers, body)
+			self.sip_REGISTER(msg)
 		elif msgType == 'SIP/2.0':
-			self.sip_RESPONSE(firstLine, headers, body)
-		elif msgType == 'Error':
-			logger.error("Error on parsing SIP message")
+			self.sip_RESPONSE(msg)
 		else:
 			logger.error("Error: unknown header")
 
 	# SIP message type handlers
-	def sip_INVITE(self, requestLine, headers, body):
+	def sip_INVITE(self, msg):
 		global g_sipconfig
 
 		# Print SIP header
 		logger.info("Received INVITE")
-		for k, v in headers.items():
-			logger.info("SIP header {}: {}".format(k, v))
+		if logger.isEnabledFor(logging.INFO):
+			for k, v in msg.headers.items():
+				logger.info("SIP header %s: %s", k, v)
 
-		if self.__checkForMissingHeaders(headers, ["accept", "content-type"]):
+		if self.__checkForMissingHeaders(msg, ["accept", "content-type"]):
 			return
 
 		# Check authentication
 		if g_sipconfig['use_authentication']:
-			r = self.__challengeINVITE(headers)
+			r = self.__challengeINVITE(msg)
 			if not r: return
 
 		# Header has to define Content-Type: application/sdp if body contains
 		# SDP message. Also, Accept has to be set to sdp so that we can send
 		# back a SDP response.
-		if headers["content-type"] != "application/sdp":
+		if msg["content-type"] != "application/sdp":
 			logger.error("INVITE without SDP message: exit")
 			return
 
-		if headers["accept"] != "application/sdp":
+		if msg["accept"] != "application/sdp":
 			logger.error("INVITE without SDP message: exit")
 			return
 
 		# Check for SDP body
+		body = msg.body
 		if not body:
 			logger.error("INVITE without SDP message: exit")
 			return
@@ -542,6 +1273,7 @@ class Sip(connection):
 		try:
 			sessionDescription, mediaDescriptions = parseSdpMessage(body)
 		except SdpParsingError as e:
+			g_parseErrorsMetric.inc(("sdp",))
 			logger.error(e)
 			return
 
@@ -565,92 +1297,106 @@ class Sip(connection):
 			logger.error("SDP media description has to be of audio type: exit")
 			return
 
-		rtpPort = mediaDescriptionParts[1]
+		# The RTP port is checked before a local port is allocated for it
+		if len(mediaDescriptionParts) < 2 or \
+				not mediaDescriptionParts[1].isascii() or \
+				not mediaDescriptionParts[1].isdigit() or \
+				not 0 < int(mediaDescriptionParts[1]) < 65536:
+			logger.error("SDP media description has an invalid port: exit")
+			self.send(responseTemplates['bad_request'].render(to=msg['from'],
+				callId=msg['call-id'], cseq=msg['cseq']))
+			return
+
+		rtpPort = int(mediaDescriptionParts[1])
 
 		# Read Call-ID field and create new SipSession instance on first INVITE
 		# request received (remote host might send more than one because of time
 		# outs or because he wants to flood the honeypot)
-		callId = headers["call-id"]
+		callId = msg["call-id"]
 		if callId in self.__sessions:
-			logger.info("SIP session with Call-ID {} already exists".format(
-				callId))
+			logger.info("SIP session with Call-ID %s already exists",
+				callId)
+			return
+
+		# Reject the session before an RTP port is allocated if the source
+		# has too many sessions or the table is full of active sessions
+		admission = self.__sessions.admit(self.__remoteAddress)
+		if admission == sessiontable.ADMITTED and \
+				not media.getMediaManager().available():
+			admission = sessiontable.TABLE_FULL
+		if admission != sessiontable.ADMITTED:
+			if admission == sessiontable.SOURCE_LIMIT:
+				template = 'busy_here'
+				logger.warning("Too many sessions from %s",
+					self.__remoteAddress)
+			else:
+				template = 'unavailable'
+				logger.warning("Session table or RTP port range full")
+
+			self.send(responseTemplates[template].render(to=msg['from'],
+				callId=callId, cseq=msg['cseq']))
 			return
 
 		# Establish a new SIP session
 		newSession = SipSession((self.__remoteAddress, self.__remoteSipPort),
-			rtpPort, headers)
+			rtpPort, msg, self, self.__removeSession)
 
 		# Store session object in sessions dictionary
 		self.__sessions[callId] = newSession
 
-	def sip_ACK(self, requestLine, headers, body):
+	def sip_ACK(self, msg):
 		logger.info("Received ACK")
 
-		if self.__checkForMissingHeaders(headers):
+		if self.__checkForMissingHeaders(msg):
 			return
 
 		# Get SIP session for given Call-ID
 		try:
-			s = self.__sessions[headers["call-id"]]
+			s = self.__sessions[msg["call-id"]]
 		except KeyError:
 			logger.error("Given Call-ID does not belong to a session: exit")
 			return
 		
 		# Handle incoming ACKs depending on current state
-		s.handle_ACK(headers, body)
+		self.__sessions.touch(msg["call-id"])
+		s.handle_ACK(msg)
 
-	def sip_OPTIONS(self, requestLine, headers, body):
+	def sip_OPTIONS(self, msg):
 		logger.info("Received OPTIONS")
 
 		# Construct OPTIONS response
-		global g_sipconfig
-		msgLines = []
-		msgLines.append("SIP/2.0 " + RESPONSE[OK])
-		msgLines.append("Via: SIP/2.0/UDP {}:{}".format(g_sipconfig['ip'],
-			g_sipconfig['port']))
-		msgLines.append("To: " + headers['from'])
-		msgLines.append("From: {0} <sip:{0}@{1}>".format(g_sipconfig['user'],
-			g_sipconfig['ip']))
-		msgLines.append("Call-ID: " + headers['call-id'])
-		msgLines.append("CSeq: " + headers['cseq'])
-		msgLines.append("Contact: {0} <sip:{0}@{1}>".format(g_sipconfig['user'],
-			g_sipconfig['ip']))
-		msgLines.append("Allow: INVITE, ACK, CANCEL, OPTIONS, BYE")
-		msgLines.append("Accept: application/sdp")
-		msgLines.append("Accept-Language: en")
-
-		self.send('\n'.join(msgLines))
-
-	def sip_BYE(self, requestLine, headers, body):
+		self.send(responseTemplates['options_ok'].render(to=msg['from'],
+			callId=msg['call-id'], cseq=msg['cseq']))
+
+	def sip_BYE(self, msg):
 		logger.info("Received BYE")
 
-		if self.__checkForMissingHeaders(headers):
+		if self.__checkForMissingHeaders(msg):
 			return
 
 		# Get SIP session for given Call-ID
 		try:
-			s = self.__sessions[headers["call-id"]]
+			s = self.__sessions[msg["call-id"]]
 		except KeyError:
 			logger.error("Given Call-ID does not belong to a session: exit")
 			return
 		
 		# Handle incoming BYE request depending on current state
-		s.handle_BYE(headers, body)
+		self.__sessions.touch(msg["call-id"])
+		s.handle_BYE(msg)
 
-	def sip_CANCEL(self, requestLine, headers, body):
+	def sip_CANCEL(self, msg):
 		logger.info("Received CANCEL")
 
 		# Check mandatory headers
-		if self.__checkForMissingHeaders(headers):
+		if self.__checkForMissingHeaders(msg):
 			return
 
 		# Get Call-Id and check if there's already a SipSession
-		callId = headers['call-id']
+		callId = msg['call-id']
 
 		# Get CSeq to find out which request to cancel
-		cseq = headers['cseq'].split(' ')
-		cseqNumber = cseq[0]
-		cseqMethod = cseq[1]
+		cseqNumber, cseqMethod = msg.cseq
 
 		if cseqMethod == "INVITE" or cseqMethod == "ACK":
 			# Find SipSession and delete it
@@ -659,37 +1405,29 @@ class Sip(connection):
 					"CANCEL request does not match any existing SIP session")
 				return
 
-			# No RTP connection has been made yet so deleting the session
-			# instance is sufficient
-			del self.__session[callId]
+			# Closes the RTP stream and removes the session
+			self.__sessions[callId].close()
 
 		
 		# Construct CANCEL response
-		global g_sipconfig
-		msgLines = []
-		msgLines.append("SIP/2.0 " + RESPONSE[OK])
-		msgLines.append("Via: SIP/2.0/UDP {}:{}".format(g_sipconfig['ip'],
-			g_sipconfig['port']))
-		msgLines.append("To: " + headers['from'])
-		msgLines.append("From: {0} <sip:{0}@{1}>".format(g_sipconfig['user'],
-			g_sipconfig['ip']))
-		msgLines.append("Call-ID: " + headers['call-id'])
-		msgLines.append("CSeq: " + headers['cseq'])
-		msgLines.append("Contact: {0} <sip:{0}@{1}>".format(g_sipconfig['user'],
-			g_sipconfig['ip']))
-
-		self.send('\n'.join(msgLines))
-
-	def sip_REGISTER(self, requestLine, headers, body):
+		self.send(responseTemplates['cancel_ok'].render(to=msg['from'],
+			callId=msg['call-id'], cseq=msg['cseq']))
+
+	def __removeSession(self, session):
+		"""Called by a session when it is closed (BYE, CANCEL or timeout)"""
+		if self.__sessions.get(session.callId) is session:
+			del self.__sessions[session.callId]
+
+	def sip_REGISTER(self, msg):
 		logger.info("Received REGISTER")
 
-	def sip_RESPONSE(self, statusLine, headers, body):
+	def sip_RESPONSE(self, msg):
 		logger.info("Received a response")
 
-	def __checkForMissingHeaders(self, headers, mandatoryHeaders=[]):
+	def __checkForMissingHeaders(self, msg, mandatoryHeaders=[]):
 		"""
 		Check for specific missing headers given as a list in the second
-		argument are present as keys in the dictionary of headers.
+		argument are present in the SIP message.
 		If list of mandatory headers is omitted, a set of common standard
 		headers is used: To, From, Call-ID, CSeq, and Contact.
 		"""
@@ -699,67 +1437,198 @@ class Sip(connection):
 		headerMissing = False
 
 		for m in mandatoryHeaders:
-			if m not in headers:
-				logger.warning("Mandatory header {} not in message".format(m))
+			if m not in msg:
+				logger.warning("Mandatory header %s not in message", m)
 				headerMissing = True
 
 		return headerMissing
 
-	def __challengeINVITE(self, headers):
-		global g_sipconfig
+	def __challengeINVITE(self, msg):
+		"""Checks the Authorization header of an INVITE, answers with a
+		challenge (401) if it is missing or stale. Returns (expected response,
+		received response) if the request is authorized, (None, None) for
+		callers with an account without password."""
+		auth = getDigestAuth()
+		caller = SIP_USER.search(msg['from'])
+		if caller and auth.accounts.isOpen((caller.group(1), getRealm())):
+			self.__recordAuth(msg, "open", caller.group(1), getRealm())
+			return None, None
+
+		if "authorization" not in msg:
+			# Send 401 Unauthorized response with a nonce bound to the source
+			self.__recordAuth(msg, "challenged")
+			self.send(responseTemplates['unauthorized'].render(
+				to=msg['from'], callId=msg['call-id'], cseq=msg['cseq'],
+				nonce=auth.nonces.issue(self.__remoteAddress)))
+			return
 
-		def hash(s):
-			return hashlib.md5(s.encode('utf-8')).hexdigest()
-
-		nonce = hash("{}".format(time.time()))
-
-		if "authorization" not in headers:
-			# Send 401 Unauthorized response
-			msgLines = []
-			msgLines.append('SIP/2.0 ' + RESPONSE[UNAUTHORIZED])
-			msgLines.append("Via: SIP/2.0/UDP {}:{}".format(
-				g_sipconfig['ip'], g_sipconfig['port']))
-			msgLines.append("To: " + headers['from'])
-			msgLines.append("From: {0} <sip:{0}@{1}>".format(
-				g_sipconfig['user'], g_sipconfig['ip']))
-			msgLines.append("Call-ID: " + headers['call-id'])
-			msgLines.append("CSeq: " + headers['cseq'])
-			msgLines.append("Contact: {0} <sip:{0}@{1}>".format(
-				g_sipconfig['user'], g_sipconfig['ip']))
-			msgLines.append('WWW-Authenticate: Digest ' + \
-				'realm="{}@{}",'.format(g_sipconfig['user'],
-					g_sipconfig['ip']) + \
-				'nonce="{}",'.format(nonce) + \
-				'opaque="{}"'.format('1234567890'))
-
-			self.send('\n'.join(msgLines))
-		else:
-			# Check against config file
-			authMethod, authLine = headers['authorization'].split(' ', 1)
-			if authMethod != 'Digest':
-				logger.error("Authorization is not Digest")
-				return
+		authMethod, authLineDict = msg.authorization
+		if authMethod != 'Digest':
+			logger.error("Authorization is not Digest")
+			self.__recordAuth(msg, "not_digest")
+			bruteforce.getDetector().failure(self.__remoteAddress, None, None)
+			return
 
-			# Get Authorization header parts (a="a", b="b", c="c", ...) and put
-			# them in a dictionary for easy lookup
-			authLineParts = [x.strip(' \t\r\n') for x in authLine.split(',')]
-			authLineDict = {}
-			for x in authLineParts:
-				parts = x.split('=')
-				authLineDict[parts[0]] = parts[1].strip(' \n\r\t"\'')
-
-			# The calculation of the expected response is taken from
-			# Sipvicious (c) Sandro Gaucci
-			# TODO: compare config values to values in Authorization header
-			realm = "{}@{}".format(g_sipconfig['user'], g_sipconfig['ip'])
-			uri = "sip:" + realm
-			a1 = hash("{}:{}:{}".format(
-				g_sipconfig['user'], realm, g_sipconfig['secret']))
-			a2 = hash("INVITE:{}".format(uri))
-			expected = hash("{}:{}:{}".format(a1, nonce, a2))
-
-			if expected != authLineDict['response']:
-				logger.error("Authorization failed")
-				return
+		result, expected = auth.verify("INVITE", authLineDict,
+			self.__remoteAddress, msg.requestUri)
+		username = authLineDict.get('username')
+		realm = authLineDict.get('realm')
+		if result == digest.STALE:
+			# Right credentials with an expired nonce, challenge again
+			self.__recordAuth(msg, "stale", username, realm)
+			self.send(responseTemplates['unauthorized_stale'].render(
+				to=msg['from'], callId=msg['call-id'], cseq=msg['cseq'],
+				nonce=auth.nonces.issue(self.__remoteAddress)))
+			return
+
+		if result != digest.AUTHORIZED:
+			logger.error("Authorization failed")
+			self.__recordAuth(msg, "failed", username, realm)
+			bruteforce.getDetector().failure(self.__remoteAddress, username,
+				realm)
+			return
+
+		self.__recordAuth(msg, "authorized", username, realm)
+		return expected, authLineDict['response']
+
+	def __recordAuth(self, msg, result, username=None, realm=None):
+		"""Stores the result of an authentication attempt as an event"""
+		if self.__events is not None:
+			self.__events.add(eventstore.AUTH, self.__remoteAddress,
+				self.__remoteSipPort, msg['call-id'], msg.get('user-agent'),
+				data={'result': result, 'username': username, 'realm': realm})
+
+class SipTcpConnection(Sip):
+	"""Accepted SIP-over-TCP connection: the byte stream is split into
+	messages which are handled by the same sip_* handlers as UDP datagrams.
+	A connection without data for tcp_idle_timeout seconds is closed."""
+
+	# Number of open connections (see SipTcp.handle_accept), and of
+	# connections that have been closed because of the idle timeout
+	openCount = 0
+	idleCount = 0
+
+	def __init__(self, sock, conInfo, sessions=None):
+		Sip.__init__(self, 'tcp', sock, sessions)
+		SipTcpConnection.openCount += 1
+
+		self.__conInfo = conInfo
+		self.__framer = SipStreamFramer(self.maxMessageSize)
+
+		# Reads don't touch the idle timer, it checks when the last data
+		# arrived and waits for the rest of the timeout
+		self.__lastActivity = time.monotonic()
+		self.__timer = None
+		if g_sipconfig['tcp_idle_timeout'] > 0:
+			self.__timer = getTimerWheel().schedule(
+				g_sipconfig['tcp_idle_timeout'], self.__idle)
+
+		# Send byte buffer
+		self.__sendBuffer = bytearray()
+
+		# Set when the connection is closed as soon as the send buffer has
+		# been written (after a 513 response)
+		self.__closing = False
+
+	def send(self, data):
+		# Append to send buffer, handle_write will take care of socket operation
+		g_responsesMetric.inc((data[8:11],))
+		self.__sendBuffer += data
+		self.updateEvents()
+
+	def readable(self):
+		return not self.__closing
+
+	def writable(self):
+		return len(self.__sendBuffer) > 0
+
+	def handle_read(self):
+		data = self.recv(65536)
+		if not data:
+			return
+
+		self.__lastActivity = time.monotonic()
+		try:
+			messages = self.__framer.feed(data)
+		except SipMessageTooLarge as e:
+			# The stream cannot be resynchronized after the rejected message
+			g_parseErrorsMetric.inc((e.reason,))
+			self.sendTooLarge(e.headers, self.__conInfo)
+			self.__closing = True
+			if not self.__sendBuffer:
+				self.close()
+			return
+		except SipParsingError as e:
+			g_parseErrorsMetric.inc((e.reason,))
+			logger.error("Closing TCP connection from %s:%s: %s",
+				self.__conInfo[0], self.__conInfo[1], e)
+			self.close()
+			return
+
+		for msg in messages:
+			self.handle_message(msg, self.__conInfo)
+
+	def handle_write(self):
+		bytesSent = connection.send(self, self.__sendBuffer)
+		del self.__sendBuffer[:bytesSent]
+
+		if self.__closing and not self.__sendBuffer:
+			self.close()
+
+	def __idle(self):
+		self.__timer = None
+		idle = time.monotonic() - self.__lastActivity
+		remaining = g_sipconfig['tcp_idle_timeout'] - idle
+		if remaining > 0:
+			self.__timer = getTimerWheel().schedule(remaining, self.__idle)
+			return
+
+		logger.info("Closing idle TCP connection from %s:%s",
+			self.__conInfo[0], self.__conInfo[1])
+		SipTcpConnection.idleCount += 1
+		self.close()
+
+	def close(self):
+		if self.socket is None:
+			return
+
+		SipTcpConnection.openCount -= 1
+		if self.__timer is not None:
+			getTimerWheel().cancel(self.__timer)
+			self.__timer = None
+		Sip.close(self)
+
+class SipTcp(connection):
+	"""Listening SIP-over-TCP socket, every accepted connection is handled by
+	its own SipTcpConnection. Connections beyond tcp_max_connections open
+	ones are closed right away."""
+
+	# Number of connections closed because too many were open
+	rejectedCount = 0
+
+	def __init__(self, sessions=None):
+		connection.__init__(self, 'tcp')
+		self.set_reuse_addr()
+
+		# SIP sessions shared by all accepted connections
+		if sessions is None:
+			sessions = newSessionTable()
+		self.__sessions = sessions
+
+	def handle_accept(self):
+		pair = self.accept()
+		if pair is None:
+			return
+
+		sock, conInfo = pair
+		if SipTcpConnection.openCount >= g_sipconfig['tcp_max_connections']:
+			logger.debug("Rejecting TCP connection from %s:%s, %s "
+				"connections are open", conInfo[0], conInfo[1],
+				SipTcpConnection.openCount)
+			SipTcp.rejectedCount += 1
+			sock.close()
+			return
 
-			return expected, authLineDict['response']
+		logger.debug("Accepted TCP connection from %s:%s",
+			conInfo[0], conInfo[1])
+		SipTcpConnection(sock, conInfo, self.__sessions)
@@ -0,0 +1,44 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Test setup: the stream dumps of RTP streams created by the tests are
+# written to a temporary directory instead of dump_directory.
+#
+################################################################################
+
+import shutil
+import tempfile
+
+import dumpwriter
+from dumpwriter import DumpWriter
+
+g_dumpDirectory = None
+
+def pytest_configure(config):
+	global g_dumpDirectory
+	g_dumpDirectory = tempfile.mkdtemp()
+	dumpwriter.g_dumpWriter = DumpWriter(g_dumpDirectory)
+
+def pytest_unconfigure(config):
+	dumpwriter.g_dumpWriter.close()
+	dumpwriter.g_dumpWriter = None
+	shutil.rmtree(g_dumpDirectory)
@@ -21,7 +21,6 @@
 ################################################################################
 
 import threading
-import asyncore
 import socket
 import sys
 import os
@@ -41,6 +40,7 @@ else:
 # Manually import module from parent directory
 sip = __import__("sip")
 config = __import__("config")
+connection = __import__("connection")
 parentDir = sys.path.pop(0)
 testDir = parentDir + "/test/streams"
 
@@ -49,7 +49,7 @@ print("Changing directory to " + testDir)
 os.chdir(testDir)
 
 # Delete all stream files
-for oldStreamFile in glob("stream_*_*.rtpdump"):
+for oldStreamFile in glob("stream_*_*.pcap*"):
 	os.remove(oldStreamFile)
 
 def getHeader(data, header):
@@ -84,7 +84,7 @@ class VoipClient:
 			t=0 0
 			m=audio 30123 RTP/AVP 0"""
 
-		sipMsg = """INVITE foo SIP/2.0
+		sipMsg = """INVITE sip:100@localhost SIP/2.0
 			Via: SIP/2.0/UDP 127.0.0.1
 			From: sockerHelper
 			To: foo bar
@@ -260,8 +260,10 @@ class ClientThread(threading.Thread):
 		data = c.recv()
 		assert_equals(data.split('\n')[0], "SIP/2.0 200 OK")
 
-		# Check if stream dump file has been created
-		assert glob("stream_*_*.rtpdump")
+		# Check if stream dump file has been created (dumps are written by a
+		# background thread)
+		sleep(1)
+		assert glob("stream_*_*.pcap")
 
 # Create Honeypot
 s = sip.Sip()
@@ -271,9 +273,9 @@ s.bind(('localhost', 5060))
 ClientThread().start()
 
 try:
-	asyncore.loop()
+	connection.loop()
 except KeyboardInterrupt:
-	print("Asyncore loop interrupted: exit")
+	print("Event loop interrupted: exit")
 except Exception as e:
 	print("Unhandled exception")
 	print(e)
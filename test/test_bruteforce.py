@@ -0,0 +1,167 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import socket
+
+from nose.tools import assert_equals
+
+import bruteforce
+from bruteforce import SlidingWindowCounter, WindowSketch, \
+	BruteForceDetector, SOURCE, ACCOUNT, REALM
+from sip import Sip, g_sipconfig
+
+class TestSlidingWindowCounter(object):
+	def test_window(self):
+		"""Test that events leave the window slot by slot"""
+		c = SlidingWindowCounter(window=60, slots=6)
+		for t in range(0, 60, 5):
+			c.add("a", t)
+		assert_equals(c.count("a", 59), 12)
+
+		# The slot [0, 10) has left the window
+		assert_equals(c.count("a", 60), 10)
+		assert_equals(c.add("a", 65), 11)
+		assert_equals(c.count("a", 115), 1)
+		assert_equals(c.count("a", 200), 0)
+		assert_equals(c.add("a", 200), 1)
+
+	def test_idle_keys_dropped(self):
+		c = SlidingWindowCounter(window=60, slots=6)
+		for i in range(100):
+			c.add(i, 0)
+		c.add("new", 61)
+		assert_equals(len(c), 1)
+
+	def test_approximation(self):
+		"""Test that keys beyond maxKeys are estimated, never too low"""
+		c = SlidingWindowCounter(window=60, slots=6, maxKeys=10)
+		counts = {}
+		for i in range(2000):
+			key = "10.0.0.{}".format(i % 100)
+			counts[key] = c.add(key, 0)
+		assert_equals(len(c), 10)
+		assert_equals(c.approximated, 1800)
+		for key, count in counts.items():
+			assert count >= 20
+
+class TestWindowSketch(object):
+	def test_sliding(self):
+		s = WindowSketch(slots=3, width=64, depth=2)
+		assert_equals([s.add("a", 0) for i in range(3)], [1, 2, 3])
+		assert_equals(s.add("a", 2), 4)
+		assert_equals(s.add("a", 3), 2)
+		assert_equals(s.add("a", 10), 1)
+
+class TestBruteForceDetector(object):
+	def test_threshold_events(self):
+		"""Test that an event is raised once when a count reaches its
+		threshold"""
+		d = BruteForceDetector(window=60, sourceThreshold=3,
+			accountThreshold=5, realmThreshold=100)
+		events = []
+		d.listeners.append(events.append)
+		for i in range(10):
+			d.failure("10.0.0.1", "100", "pbx", now=i)
+		d.failure("10.0.0.2", "100", "pbx", now=10)
+
+		assert_equals([(e.kind, e.key, e.count) for e in events],
+			[(SOURCE, "10.0.0.1", 3), (ACCOUNT, ("100", "pbx"), 5)])
+		assert_equals(list(d.events), events)
+		assert_equals(d.count(REALM, "pbx", now=10), 11)
+
+		# The window has passed, the threshold can be reached again
+		for i in range(3):
+			d.failure("10.0.0.1", "100", "pbx", now=100)
+		assert_equals(len(events), 3)
+
+	def test_block(self):
+		d = BruteForceDetector(sourceThreshold=2, blockTime=30)
+		d.failure("10.0.0.1", "100", "pbx", now=0)
+		assert not d.blocked("10.0.0.1", 0)
+		d.failure("10.0.0.1", "100", "pbx", now=1)
+		assert d.blocked("10.0.0.1", 2)
+		assert not d.blocked("10.0.0.2", 2)
+		assert not d.blocked("10.0.0.1", 31)
+		assert_equals(d.stats()['bruteforce_blocked_requests'], 1)
+
+	def test_block_renewed(self):
+		"""Test that a source still failing after its block is blocked
+		again"""
+		d = BruteForceDetector(window=60, sourceThreshold=2, blockTime=10)
+		for t in range(25):
+			d.failure("10.0.0.1", "100", "pbx", now=t)
+		assert d.blocked("10.0.0.1", 24)
+		assert_equals([e.time for e in d.events if e.kind == SOURCE],
+			[1, 11, 21])
+
+	def test_missing_credentials(self):
+		"""Test that failures without credentials only count the
+		source"""
+		d = BruteForceDetector(sourceThreshold=100, accountThreshold=2,
+			realmThreshold=2)
+		for i in range(5):
+			d.failure("10.0.0.{}".format(i), None, None, now=0)
+		assert_equals(list(d.events), [])
+		assert_equals(d.count(ACCOUNT, (None, None), now=0), 0)
+		assert_equals(d.count(REALM, None, now=0), 0)
+		assert_equals(d.count(SOURCE, "10.0.0.1", now=0), 1)
+
+def test_fast_path():
+	"""Test that a blocked source gets a 403 without its requests being
+	handled or parsed (an unknown header doesn't matter), and that datagrams
+	without the response headers are dropped"""
+	saved = dict(g_sipconfig)
+	g_sipconfig.update(bruteforce_block_time=30)
+	bruteforce.g_detector = BruteForceDetector(sourceThreshold=1,
+		blockTime=30)
+
+	s = Sip()
+	s.bind(('127.0.0.1', 0))
+	c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	c.settimeout(1)
+
+	try:
+		bruteforce.g_detector.failure('127.0.0.1', "100", "pbx")
+		c.sendto(b"OPTIONS sip:foo SIP/2.0\r\nFrom: test\r\n\r\n",
+			s.socket.getsockname())
+		c.sendto(b"OPTIONS sip:foo SIP/2.0\r\nFrom: test\r\nX-Unknown: 1\r\n"
+			b"Call-ID: blocked\r\nCSeq: 1 OPTIONS\r\n\r\n",
+			s.socket.getsockname())
+		s.handle_read()
+
+		response = c.recvfrom(4096)[0]
+		assert response.startswith(b"SIP/2.0 403 Forbidden\n")
+		assert b"\nCall-ID: blocked\n" in response
+		assert b"\nCSeq: 1 OPTIONS\n" in response
+		c.settimeout(0.1)
+		try:
+			c.recvfrom(4096)
+			assert False, "Answered a request without Call-ID"
+		except socket.timeout:
+			pass
+		assert_equals(s.stats()['bruteforce_blocked_requests'], 2)
+		assert_equals(s.stats()['retransmission_misses'], 0)
+	finally:
+		g_sipconfig.update(saved)
+		bruteforce.g_detector = None
+		c.close()
+		s.close()
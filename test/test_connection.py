@@ -46,3 +46,69 @@ def test_connection_from_socket_fail():
 	"""Creation of connection object with invalid argument raises Exception"""
 	import socket
 	connection(sock=12345)
+
+def test_event_loop_read_and_write():
+	"""Callbacks are called by the event loop for incoming data and for a
+	non-empty send buffer"""
+	import socket
+	from connection import getLoop
+
+	class Echo(connection):
+		def __init__(self):
+			connection.__init__(self, 'udp')
+			self.received = []
+			self.sendBuffer = []
+
+		def writable(self):
+			return len(self.sendBuffer) > 0
+
+		def handle_read(self):
+			data, address = self.recvfrom(1024)
+			self.received.append(data)
+			self.sendBuffer.append((data, address))
+
+		def handle_write(self):
+			self.sendto(*self.sendBuffer.pop(0))
+
+	c = Echo()
+	c.bind(('127.0.0.1', 0))
+
+	s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	s.settimeout(1)
+	s.sendto(b"ping", c.getsockname())
+
+	loop = getLoop()
+	loop.call_later(0.1, loop.stop)
+	loop.run_forever()
+
+	assert_equals(c.received, [b"ping"])
+	assert_equals(s.recvfrom(1024)[0], b"ping")
+
+	c.close()
+	s.close()
+
+def test_tcp_accept():
+	"""A listening TCP connection accepts through the event loop"""
+	import socket
+	from connection import getLoop
+
+	class Server(connection):
+		accepted = None
+
+		def handle_accept(self):
+			self.accepted = self.accept()
+
+	server = Server()
+	server.bind(('127.0.0.1', 0))
+	server.listen(5)
+
+	client = socket.create_connection(server.getsockname())
+
+	loop = getLoop()
+	loop.call_later(0.1, loop.stop)
+	loop.run_forever()
+
+	assert server.accepted
+	server.accepted[0].close()
+	client.close()
+	server.close()
@@ -0,0 +1,135 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+from nose.tools import assert_equals, raises
+
+import connection
+from credentials import CredentialStore, CredentialError, parseCredentials
+
+def md5(s):
+	return hashlib.md5(s.encode('utf-8')).hexdigest()
+
+def runLoop(seconds=0.05):
+	loop = connection.getLoop()
+	loop.call_later(seconds, loop.stop)
+	loop.run_forever()
+
+def test_parse():
+	"""Test plain passwords, precomputed HA1, accounts without password and
+	the default realm"""
+	accounts, passwordless = parseCredentials([
+		"# extensions",
+		"100:pbx:1234",
+		"",
+		"101::pass:with:colons",
+		"102:pbx:{HA1}" + md5("102:pbx:secret").upper(),
+		"103::"], "default")
+
+	assert_equals(accounts, {
+		('100', 'pbx'): md5("100:pbx:1234"),
+		('101', 'default'): md5("101:default:pass:with:colons"),
+		('102', 'pbx'): md5("102:pbx:secret")})
+	assert_equals(passwordless, {('103', 'default')})
+
+@raises(CredentialError)
+def test_parse_error():
+	parseCredentials(["100:pbx:1234", "no colons"], "default")
+
+class TestCredentialStore(object):
+	def setup_method(self, method):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, "accounts")
+		with open(self.path, "w") as f:
+			f.write("100::1234\n101::\n")
+
+	def teardown_method(self, method):
+		shutil.rmtree(self.directory)
+
+	def test_lookup(self):
+		store = CredentialStore("pbx", self.path)
+		assert_equals(len(store), 2)
+		assert_equals(store.get(('100', 'pbx')), md5("100:pbx:1234"))
+		assert_equals(store.get(('100', 'other')), None)
+		assert store.isOpen(('101', 'pbx'))
+		assert not store.isOpen(('100', 'pbx'))
+		store.close()
+
+	def test_reload(self):
+		"""Test that a changed file replaces the accounts, and a broken one
+		keeps them"""
+		store = CredentialStore("pbx", self.path)
+		with open(self.path, "w") as f:
+			f.write("".join("{}::pw{}\n".format(i, i) for i in range(1000)))
+		store.reload()
+		for i in range(50):
+			runLoop(0.01)
+			if store.reloads:
+				break
+
+		assert_equals(store.reloads, 1)
+		assert_equals(len(store), 1000)
+		assert_equals(store.get(('999', 'pbx')), md5("999:pbx:pw999"))
+		assert not store.isOpen(('101', 'pbx'))
+
+		with open(self.path, "w") as f:
+			f.write("broken\n")
+		store.reload()
+		for i in range(50):
+			runLoop(0.01)
+			if store.reloadErrors:
+				break
+		assert_equals(store.reloadErrors, 1)
+		assert_equals(len(store), 1000)
+		store.close()
+
+def test_passwordless_caller():
+	"""Test that callers with an account without password are not
+	challenged"""
+	import sip
+	from sip import Sip, SipMessage
+	import digest
+
+	store = CredentialStore(sip.getRealm())
+	store.add('200', '', '')
+	saved = sip.g_digestAuth
+	sip.g_digestAuth = digest.DigestAuth(digest.NonceFactory(b"key"), store)
+	try:
+		s = Sip()
+		sent = []
+		s.send = sent.append
+		msg = SipMessage("""INVITE sip:100@localhost SIP/2.0
+			To: foo
+			From: "x" <sip:200@10.0.0.1>;tag=1
+			Via: foo
+			Call-ID: 123456
+			CSeq: 1 INVITE
+			""")
+		assert_equals(s._Sip__challengeINVITE(msg), (None, None))
+		assert_equals(sent, [])
+		s.close()
+	finally:
+		sip.g_digestAuth = saved
@@ -0,0 +1,129 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import hmac
+import hashlib
+
+from nose.tools import assert_equals
+
+from credentials import CredentialStore
+from digest import NonceFactory, DigestAuth, AUTHORIZED, STALE, UNAUTHORIZED
+
+def md5(s):
+	return hashlib.md5(s.encode('utf-8')).hexdigest()
+
+def authorization(nonce, secret="secret", uri="sip:100@example.com",
+		realm="example.com"):
+	ha1 = md5("100:{}:{}".format(realm, secret))
+	ha2 = md5("INVITE:" + uri)
+	return {'username': '100', 'realm': realm, 'nonce': nonce, 'uri': uri,
+		'response': md5("{}:{}:{}".format(ha1, nonce, ha2))}
+
+class TestNonceFactory(object):
+	def setup_method(self, method):
+		self.nonces = NonceFactory(b"key", 60)
+
+	def test_valid(self):
+		nonce = self.nonces.issue('10.0.0.1', now=1000)
+		assert_equals(len(nonce), 40)
+		assert_equals(nonce, "000003e8" + hmac.digest(b"key",
+			b"000003e8:10.0.0.1", 'sha256').hex()[:32])
+		assert_equals(self.nonces.check(nonce, '10.0.0.1', now=1059),
+			AUTHORIZED)
+
+		# Another process with the same key accepts it
+		assert_equals(NonceFactory(b"key").check(nonce, '10.0.0.1',
+			now=1000), AUTHORIZED)
+
+	def test_expired(self):
+		nonce = self.nonces.issue('10.0.0.1', now=1000)
+		assert_equals(self.nonces.check(nonce, '10.0.0.1', now=1061), STALE)
+
+	def test_forged(self):
+		"""Test that nonces of other addresses, keys or times are rejected"""
+		nonce = self.nonces.issue('10.0.0.1', now=1000)
+		assert_equals(self.nonces.check(nonce, '10.0.0.2', now=1000),
+			UNAUTHORIZED)
+		assert_equals(NonceFactory(b"other").check(nonce, '10.0.0.1',
+			now=1000), UNAUTHORIZED)
+		assert_equals(self.nonces.check("000003e9" + nonce[8:], '10.0.0.1',
+			now=1000), UNAUTHORIZED)
+		assert_equals(self.nonces.check("deadbeef", '10.0.0.1'), UNAUTHORIZED)
+		assert_equals(self.nonces.check("x" * 40, '10.0.0.1'), UNAUTHORIZED)
+
+class TestDigestAuth(object):
+	def setup_method(self, method):
+		accounts = CredentialStore("example.com")
+		accounts.add('100', 'example.com', 'secret')
+		self.auth = DigestAuth(NonceFactory(b"key", 60), accounts,
+			cacheSize=2)
+
+	def test_authorized(self):
+		nonce = self.auth.nonces.issue('10.0.0.1')
+		params = authorization(nonce)
+		assert_equals(self.auth.verify("INVITE", params, '10.0.0.1'),
+			(AUTHORIZED, params['response']))
+
+	def test_wrong_password(self):
+		nonce = self.auth.nonces.issue('10.0.0.1')
+		result, _ = self.auth.verify("INVITE", authorization(nonce, "guess"),
+			'10.0.0.1')
+		assert_equals(result, UNAUTHORIZED)
+		result, _ = self.auth.verify("INVITE", authorization(nonce,
+			realm="other"), '10.0.0.1')
+		assert_equals(result, UNAUTHORIZED)
+		assert_equals(self.auth.failed, 2)
+
+	def test_request_uri(self):
+		"""Test that a response for another Request-URI is rejected"""
+		nonce = self.auth.nonces.issue('10.0.0.1')
+		params = authorization(nonce)
+		assert_equals(self.auth.verify("INVITE", params, '10.0.0.1',
+			"sip:100@example.com")[0], AUTHORIZED)
+		assert_equals(self.auth.verify("INVITE", params, '10.0.0.1',
+			"sip:200@example.com"), (UNAUTHORIZED, None))
+		assert_equals(self.auth.failed, 1)
+
+	def test_stale(self):
+		"""Test that a correct response with an expired nonce is stale, a
+		wrong one is unauthorized"""
+		nonce = self.auth.nonces.issue('10.0.0.1', now=1000)
+		assert_equals(self.auth.verify("INVITE", authorization(nonce),
+			'10.0.0.1')[0], STALE)
+		assert_equals(self.auth.verify("INVITE", authorization(nonce, "guess"),
+			'10.0.0.1')[0], UNAUTHORIZED)
+
+	def test_qop(self):
+		nonce = self.auth.nonces.issue('10.0.0.1')
+		params = authorization(nonce)
+		ha1 = md5("100:example.com:secret")
+		ha2 = md5("INVITE:sip:100@example.com")
+		params.update(qop='auth', nc='00000001', cnonce='abc',
+			response=md5("{}:{}:00000001:abc:auth:{}".format(ha1, nonce, ha2)))
+		assert_equals(self.auth.verify("INVITE", params, '10.0.0.1')[0],
+			AUTHORIZED)
+
+	def test_ha2_cache(self):
+		"""Test that the HA2 cache is bounded"""
+		for uri in ("sip:a", "sip:b", "sip:c"):
+			assert_equals(self.auth.ha2("INVITE", uri), md5("INVITE:" + uri))
+		assert_equals(len(self.auth._DigestAuth__ha2), 2)
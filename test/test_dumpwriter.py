@@ -0,0 +1,100 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_equals
+
+from dumpwriter import DumpWriter
+
+class TestDumpWriter(object):
+	def setup_method(self, method):
+		self.directory = tempfile.mkdtemp()
+
+	def teardown_method(self, method):
+		shutil.rmtree(self.directory)
+
+	def read(self, name):
+		with open(os.path.join(self.directory, name), "rb") as f:
+			return f.read()
+
+	def test_write(self):
+		"""Test that buffered data ends up in the file in order"""
+		w = DumpWriter(self.directory, flushInterval=0.01)
+		d = w.open("a.dump")
+		for i in range(100):
+			assert d.write(b"%03d" % i)
+		w.flush()
+		assert_equals(self.read("a.dump"), b"".join(b"%03d" % i
+			for i in range(100)))
+
+		d.write(b"end")
+		d.close()
+		w.close()
+		assert_equals(self.read("a.dump")[-3:], b"end")
+		assert_equals(w.written, 303)
+
+	def test_stream_quota(self):
+		"""Test that a dump is truncated at its quota"""
+		w = DumpWriter(self.directory, streamQuota=10, flushInterval=0.01)
+		d = w.open("a.dump")
+		assert d.write(b"12345678")
+		assert not d.write(b"abc")
+		assert not d.write(b"d")
+		w.close()
+
+		assert_equals(self.read("a.dump"), b"12345678")
+		assert_equals(w.droppedQuota, 4)
+		assert_equals(w.truncatedStreams, 1)
+
+	def test_global_quota(self):
+		w = DumpWriter(self.directory, globalQuota=10, flushInterval=0.01)
+		assert w.open("a.dump").write(b"123456")
+		assert not w.open("b.dump").write(b"123456")
+		w.close()
+		assert_equals(w.droppedQuota, 6)
+
+	def test_backlog(self):
+		"""Test that data is dropped while too much waits for the disk"""
+		w = DumpWriter(self.directory, maxPending=10, flushInterval=60)
+		d = w.open("a.dump")
+		assert d.write(b"123456")
+		assert not d.write(b"123456")
+		w.close()
+		assert_equals(w.droppedBacklog, 6)
+		assert_equals(self.read("a.dump"), b"123456")
+
+	def test_write_error(self):
+		"""Test that a dump that cannot be written is counted and dropped"""
+		w = DumpWriter(os.path.join(self.directory, "missing"),
+			flushInterval=0.01)
+		d = w.open("a.dump")
+		d.write(b"123")
+		w.flush()
+		assert d.failed
+		assert not d.write(b"456")
+		w.close()
+		assert_equals(w.writeErrors, 1)
+		assert_equals((w.droppedUnwritten, w.droppedClosed), (3, 3))
+		assert_equals(w.stats()['dump_bytes_dropped_errors'], 6)
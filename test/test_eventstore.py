@@ -0,0 +1,134 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import os
+import json
+import shutil
+import tempfile
+
+from nose.tools import assert_equals
+
+import eventstore
+from eventstore import EventStore, openDatabase, query
+from sip import Sip, g_sipconfig
+
+class TestEventStore(object):
+	def setup_method(self, method):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, "events.db")
+
+	def teardown_method(self, method):
+		shutil.rmtree(self.directory)
+
+	def test_batches(self):
+		"""Test that events are written and can be queried by the indexed
+		columns"""
+		store = EventStore(self.path, batchSize=100)
+		for i in range(250):
+			store.add("OPTIONS", "10.0.0.{}".format(i % 5), 5060,
+				"call{}".format(i), "scanner {}".format(i % 2), b"OPTIONS")
+		store.add(eventstore.AUTH, "10.0.0.1", 5060, "call1",
+			data={'result': "failed", 'username': "100"})
+		store.close()
+		assert_equals(store.stats()['events_written'], 251)
+		assert_equals(store.stats()['events_dropped_backlog'], 0)
+
+		db = openDatabase(self.path)
+		assert_equals(len(query(db, source="10.0.0.1")), 51)
+		assert_equals(len(query(db, source="10.0.0.1", userAgent="scanner 1")),
+			25)
+		assert_equals(len(query(db, callId="call7")), 1)
+
+		event = query(db, type=eventstore.AUTH)[0]
+		assert_equals(event[7], None)
+		assert_equals(json.loads(event[8]),
+			{'result': "failed", 'username': "100"})
+
+		first, last = query(db, limit=1)[0], query(db, callId="call249")[0]
+		assert_equals(len(query(db, since=first[1], until=last[1])), 249)
+		db.close()
+
+	def test_wal(self):
+		store = EventStore(self.path)
+		db = openDatabase(self.path)
+		assert_equals(db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+		db.close()
+		store.close()
+
+	def test_backlog(self):
+		"""Test that events are dropped while maxPending wait for the
+		database"""
+		store = EventStore(self.path, batchSize=1000, flushInterval=60,
+			maxPending=10)
+		for i in range(15):
+			store.add("OPTIONS", "10.0.0.1", 5060)
+		assert_equals(store.dropped, 5)
+		store.close()
+		assert_equals(store.written, 10)
+
+def test_sip_events():
+	"""Test that requests, authentication results and session state changes
+	are stored"""
+	sdp = "v=0\no=test 1 1 IN IP4 127.0.0.1\ns=-\nc=IN IP4 127.0.0.1\n" + \
+		"t=0 0\nm=audio 30123 RTP/AVP 0\n"
+	invite = ("INVITE sip:100@localhost SIP/2.0\nVia: SIP/2.0/UDP 127.0.0.1\n"
+		"From: test\nTo: 100\nCall-ID: {}\nCSeq: 1 INVITE\n"
+		"Contact: test\nAccept: application/sdp\nUser-Agent: scanner\n"
+		"Content-Type: application/sdp\nContent-Length: {}\n\n{}")
+	cancel = "CANCEL sip:100@localhost SIP/2.0\nVia: SIP/2.0/UDP 127.0.0.1\n" \
+		"From: test\nTo: 100\nCall-ID: open\nCSeq: 1 INVITE\nContact: test\n\n"
+
+	directory = tempfile.mkdtemp()
+	path = os.path.join(directory, "events.db")
+	eventstore.g_eventStore = EventStore(path)
+	saved = g_sipconfig['use_authentication']
+	s = Sip()
+	s.send = lambda data: None
+	try:
+		s.handle_message(bytearray(invite.format("secret", len(sdp), sdp),
+			"utf-8"), ('127.0.0.1', 5060))
+		g_sipconfig['use_authentication'] = False
+		s.handle_message(invite.format("open", len(sdp), sdp).encode(),
+			('127.0.0.1', 5061))
+		s.handle_message(cancel.encode(), ('127.0.0.1', 5061))
+		eventstore.g_eventStore.close()
+
+		db = openDatabase(path)
+		events = [(e[2], e[4], e[5], e[6]) for e in query(db)]
+		assert_equals(events, [
+			("INVITE", 5060, "secret", "scanner"),
+			(eventstore.AUTH, 5060, "secret", "scanner"),
+			("INVITE", 5061, "open", "scanner"),
+			(eventstore.SESSION_SETUP, 5061, "open", None),
+			("CANCEL", 5061, "open", None),
+			(eventstore.SESSION_CLOSED, 5061, "open", None)])
+
+		message = query(db, type="INVITE")[0][7]
+		assert message.startswith(b"INVITE sip:100@localhost SIP/2.0\n")
+		auth = json.loads(query(db, type=eventstore.AUTH)[0][8])
+		assert_equals(auth['result'], "challenged")
+		db.close()
+	finally:
+		g_sipconfig['use_authentication'] = saved
+		eventstore.g_eventStore = None
+		s.close()
+		shutil.rmtree(directory)
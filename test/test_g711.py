@@ -0,0 +1,56 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import numpy as np
+from nose.tools import assert_equals, raises
+
+import g711
+
+def test_decode_tables():
+	"""Test known values of the decoding tables"""
+	assert_equals(g711.decode(b"\x00\x80\x7f\xff").tolist(),
+		[-32124, 32124, 0, 0])
+	assert_equals(g711.decode(b"\xd5\x55\x2a\xaa", g711.PCMA).tolist(),
+		[8, -8, -32256, 32256])
+
+def test_round_trip():
+	"""Test that encoding decoded codes gives back the codes (except the
+	second μ-law zero)"""
+	codes = np.arange(256, dtype=np.uint8)
+	ulaw = g711.encode(g711.decode(codes, g711.PCMU), g711.PCMU)
+	assert_equals(np.flatnonzero(ulaw != codes).tolist(), [0x7f])
+	alaw = g711.encode(g711.decode(codes, g711.PCMA), g711.PCMA)
+	assert (alaw == codes).all()
+
+def test_encode_monotonic():
+	"""Test that encoding and decoding all 16 bit values keeps their order and
+	the quantization error within the segment step size"""
+	linear = np.arange(-32768, 32768, dtype=np.int16)
+	for payloadType in (g711.PCMU, g711.PCMA):
+		decoded = g711.decode(g711.encode(linear, payloadType),
+			payloadType).astype(np.int64)
+		assert (np.diff(decoded) >= 0).all()
+		assert (np.abs(decoded - linear) <= 1024).all()
+
+@raises(g711.CodecError)
+def test_not_g711():
+	g711.decode(b"\x00", 18)
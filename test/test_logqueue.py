@@ -0,0 +1,80 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import logging
+
+from nose.tools import assert_equals
+
+from logqueue import RateLimitFilter, LazyQueueHandler, SuppressedFormatter
+
+def makeRecord(msg, args=(), lineno=1, created=0):
+	record = logging.LogRecord("sip", logging.ERROR, "sip.py", lineno, msg,
+		args, None)
+	record.created = created
+	return record
+
+class TestRateLimitFilter(object):
+	def test_burst(self):
+		"""Test that a call site may log burst records, then rate per second"""
+		f = RateLimitFilter(rate=10, burst=5)
+		passed = [f.filter(makeRecord("a")) for i in range(8)]
+		assert_equals(passed, [True] * 5 + [False] * 3)
+		assert_equals(f.suppressed, 3)
+
+		# Other call sites have their own bucket
+		assert f.filter(makeRecord("b", lineno=2))
+
+		# The next record that passes carries the number of suppressed ones
+		record = makeRecord("a", created=0.1)
+		assert f.filter(record)
+		assert_equals(record.suppressed, 3)
+		record = makeRecord("a", created=0.2)
+		assert f.filter(record)
+		assert not hasattr(record, 'suppressed')
+
+class TestLazyQueueHandler(object):
+	def test_not_formatted(self):
+		"""Test that records are queued with their arguments"""
+		h = LazyQueueHandler(10)
+		h.handle(makeRecord("Session %s timed out", ("abc",)))
+		record = h.queue.get_nowait()
+		assert_equals(record.msg, "Session %s timed out")
+		assert_equals(record.args, ("abc",))
+		assert_equals(record.getMessage(), "Session abc timed out")
+
+	def test_full(self):
+		"""Test that records are dropped when the queue is full"""
+		h = LazyQueueHandler(2)
+		for i in range(5):
+			h.handle(makeRecord("a"))
+		assert_equals(h.queue.qsize(), 2)
+		assert_equals(h.dropped, 3)
+
+class TestSuppressedFormatter(object):
+	def test_format(self):
+		f = SuppressedFormatter("%(message)s")
+		record = makeRecord("Given Call-ID does not belong to a session")
+		assert_equals(f.format(record),
+			"Given Call-ID does not belong to a session")
+		record.suppressed = 42
+		assert_equals(f.format(record), "Given Call-ID does not belong to a "
+			"session (42 similar messages suppressed)")
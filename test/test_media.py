@@ -0,0 +1,102 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import time
+import socket
+
+from nose.tools import assert_equals, raises
+
+import connection
+import media
+from sip import RtpUdpStream
+
+class StreamMock(object):
+	def __init__(self):
+		self.packets = []
+
+	def handle_packet(self, data, address):
+		self.packets.append(data)
+
+def runLoop(seconds=0.05):
+	"""Runs the event loop for a short time to deliver pending packets"""
+	loop = connection.getLoop()
+	loop.call_later(seconds, loop.stop)
+	loop.run_forever()
+
+class TestMediaManager(object):
+	def setup_method(self, method):
+		self.m = media.MediaManager('127.0.0.1', 41000, 3)
+
+	def teardown_method(self, method):
+		self.m.close()
+
+	def test_allocate_and_release(self):
+		"""Test that ports are handed out from the range and reused in the
+		order they were released"""
+		a, b = StreamMock(), StreamMock()
+		assert_equals(self.m.allocate(a), 41000)
+		assert_equals(self.m.allocate(b), 41001)
+		assert_equals(self.m.available(), 1)
+
+		self.m.release(41000)
+		assert_equals(self.m.allocate(b), 41002)
+		assert_equals(self.m.allocate(a), 41000)
+		assert_equals(self.m.allocate(a), None)
+
+	def test_demultiplex(self):
+		"""Test that packets reach the stream owning the local port"""
+		a, b = StreamMock(), StreamMock()
+		portA = self.m.allocate(a)
+		portB = self.m.allocate(b)
+
+		c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		c.sendto(b"to a", ('127.0.0.1', portA))
+		c.sendto(b"to b", ('127.0.0.1', portB))
+		c.sendto(b"stray", ('127.0.0.1', 41002))
+		runLoop()
+
+		assert_equals(a.packets, [b"to a"])
+		assert_equals(b.packets, [b"to b"])
+		assert_equals(self.m.stray, 1)
+		c.close()
+
+	def test_stream_send(self):
+		"""Test that a stream sends from its local port"""
+		c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		c.bind(('127.0.0.1', 0))
+		c.settimeout(1)
+
+		s = RtpUdpStream('127.0.0.1', c.getsockname()[1], self.m)
+		s.send(b"\x80\x00")
+		data, address = c.recvfrom(1024)
+		assert_equals(data, b"\x80\x00")
+		assert_equals(address, s.getsockname())
+
+		s.close()
+		assert s.closed
+		assert_equals(self.m.available(), 3)
+		c.close()
+
+	@raises(media.MediaError)
+	def test_exhausted(self):
+		for i in range(4):
+			RtpUdpStream('127.0.0.1', 5004, self.m)
@@ -0,0 +1,156 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import os
+import socket
+import shutil
+import tempfile
+
+from nose.tools import assert_equals, raises
+
+import connection
+import metrics
+from metrics import Registry, MetricsServer
+from sip import Sip, g_requestsMetric, g_parseErrorsMetric, \
+	g_responsesMetric, g_parseSecondsMetric
+
+def scrape(family, address, request=b"GET /metrics HTTP/1.0\r\n\r\n"):
+	"""Sends a request to a scrape endpoint, running the event loop until
+	the response is complete"""
+	loop = connection.getLoop()
+
+	async def get():
+		c = socket.socket(family, socket.SOCK_STREAM)
+		c.setblocking(False)
+		await loop.sock_connect(c, address)
+		await loop.sock_sendall(c, request)
+		response = b""
+		while True:
+			data = await loop.sock_recv(c, 65536)
+			if not data:
+				break
+			response += data
+		c.close()
+		return response
+
+	return loop.run_until_complete(get())
+
+class TestRegistry(object):
+	def test_counter(self):
+		r = Registry()
+		c = r.counter("sip_requests_total", "SIP requests", ("method",))
+		c.inc(("INVITE",))
+		c.inc(("INVITE",))
+		c.inc(("OPT\"IONS",), 3)
+		assert_equals(r.render(), "# HELP sip_requests_total SIP requests\n"
+			"# TYPE sip_requests_total counter\n"
+			"sip_requests_total{method=\"INVITE\"} 2\n"
+			"sip_requests_total{method=\"OPT\\\"IONS\"} 3\n")
+
+	def test_histogram(self):
+		"""Test that the buckets are cumulative and include their bound"""
+		r = Registry()
+		h = r.histogram("parse_seconds", "Parse time", (0.001, 0.01))
+		for value in (0.0005, 0.001, 0.005, 0.5):
+			h.observe(value)
+		assert_equals(h.count, 4)
+		lines = r.render().split("\n")
+		assert_equals(lines[2:7], ["parse_seconds_bucket{le=\"0.001\"} 2",
+			"parse_seconds_bucket{le=\"0.01\"} 3",
+			"parse_seconds_bucket{le=\"+Inf\"} 4",
+			"parse_seconds_sum 0.5065",
+			"parse_seconds_count 4"])
+
+	def test_collector(self):
+		"""Test that stats are exported as gauges and counters"""
+		r = Registry()
+		r.collect("stats", lambda: {'sessions': 3, 'rtp_received': 10},
+			gauges={'sessions'})
+		assert_equals(r.render(), "# TYPE sip_rtp_received_total counter\n"
+			"sip_rtp_received_total 10\n"
+			"# TYPE sip_sessions gauge\nsip_sessions 3\n")
+
+	@raises(ValueError)
+	def test_duplicate(self):
+		r = Registry()
+		r.counter("a", "A")
+		r.counter("a", "A")
+
+def test_sip_metrics():
+	"""Test that requests, responses and parse errors are counted"""
+	requests = g_requestsMetric.values.get(("OPTIONS",), 0)
+	ok = g_responsesMetric.values.get((b"200",), 0)
+	unknown = g_parseErrorsMetric.values.get(("unknown_header",), 0)
+	parsed = g_parseSecondsMetric.count
+
+	s = Sip()
+	s.bind(('127.0.0.1', 0))
+	c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	c.settimeout(1)
+	try:
+		c.sendto(b"OPTIONS sip:foo SIP/2.0\r\nFrom: test\r\nCall-ID: metrics\r\n"
+			b"CSeq: 1 OPTIONS\r\n\r\n", s.socket.getsockname())
+		c.sendto(b"OPTIONS sip:foo SIP/2.0\r\nX-Unknown: test\r\n\r\n",
+			s.socket.getsockname())
+		s.handle_read()
+		assert c.recvfrom(4096)[0].startswith(b"SIP/2.0 200 OK")
+	finally:
+		c.close()
+		s.close()
+
+	assert_equals(g_requestsMetric.values[("OPTIONS",)], requests + 1)
+	assert_equals(g_responsesMetric.values[(b"200",)], ok + 1)
+	assert_equals(g_parseErrorsMetric.values[("unknown_header",)],
+		unknown + 1)
+	assert_equals(g_parseSecondsMetric.count, parsed + 1)
+	assert "sip_responses_total{code=\"200\"}" in \
+		metrics.getRegistry().render()
+
+def test_tcp_endpoint():
+	r = Registry()
+	r.counter("sip_requests_total", "SIP requests").inc()
+	server = MetricsServer(r, "127.0.0.1:0")
+	try:
+		address = server.getsockname()
+		response = scrape(socket.AF_INET, address)
+		assert response.startswith(b"HTTP/1.0 200 OK\r\n")
+		assert response.endswith(b"\r\n\r\n" + r.render().encode())
+
+		response = scrape(socket.AF_INET, address,
+			b"GET /other HTTP/1.0\r\n\r\n")
+		assert response.startswith(b"HTTP/1.0 404 Not Found\r\n")
+	finally:
+		server.close()
+
+def test_unix_endpoint():
+	directory = tempfile.mkdtemp()
+	path = os.path.join(directory, "metrics.sock")
+	r = Registry()
+	r.counter("sip_requests_total", "SIP requests").inc()
+	server = MetricsServer(r, path)
+	try:
+		response = scrape(socket.AF_UNIX, path)
+		assert response.endswith(b"sip_requests_total 1\n")
+	finally:
+		server.close()
+		assert not os.path.exists(path)
+		shutil.rmtree(directory)
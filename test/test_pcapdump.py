@@ -0,0 +1,99 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import os
+import struct
+import shutil
+import tempfile
+
+from nose.tools import assert_equals, raises
+
+import pcapdump
+from dumpwriter import DumpWriter
+from pcapdump import PcapStreamDump, PcapDumpReader, INBOUND, OUTBOUND
+
+class TestPcapDump(object):
+	def setup_method(self, method):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, "stream.pcap")
+
+		# 100 packets, one every 20ms, alternating direction
+		w = DumpWriter(self.directory, flushInterval=0.01)
+		d = PcapStreamDump(w, "stream.pcap", ('127.0.0.1', 30000))
+		for i in range(100):
+			d.write(b"packet%d" % i, (INBOUND, OUTBOUND)[i % 2],
+				('10.0.0.1', 5004), timestamp=1000 + i * 0.02)
+		d.close()
+		w.close()
+
+	def teardown_method(self, method):
+		shutil.rmtree(self.directory)
+
+	def test_pcap_format(self):
+		"""Test the pcap file header and the synthesized IPv4/UDP headers"""
+		with open(self.path, "rb") as f:
+			data = f.read()
+
+		magic, major, minor, _, _, _, linktype = \
+			pcapdump.PCAP_HEADER.unpack_from(data)
+		assert_equals((magic, major, minor, linktype),
+			(0xa1b2c3d4, 2, 4, pcapdump.LINKTYPE_RAW))
+
+		# The IPv4 header checksum of the first record is valid
+		offset = pcapdump.PCAP_HEADER.size + pcapdump.RECORD_HEADER.size
+		words = struct.unpack_from("!10H", data, offset)
+		s = sum(words)
+		s = (s & 0xffff) + (s >> 16)
+		assert_equals(s, 0xffff)
+
+	def test_scan(self):
+		"""Test reading the dump sequentially"""
+		with PcapDumpReader(self.path) as r:
+			packets = list(r.scan())
+
+		assert_equals(len(packets), 100)
+		assert_equals(packets[0].payload, b"packet0")
+		assert_equals(packets[0].source, ('10.0.0.1', 5004))
+		assert_equals(packets[0].destination, ('127.0.0.1', 30000))
+		assert_equals(packets[1].source, ('127.0.0.1', 30000))
+		assert abs(packets[99].time - 1001.98) < 1e-5
+
+	def test_time_range(self):
+		"""Test that the index finds the packets of a time range"""
+		with PcapDumpReader(self.path) as r:
+			assert_equals(len(r), 100)
+			assert_equals(r.find(1000.5), 25)
+
+			packets = list(r.packets(1000.5, 1000.6))
+			assert_equals([p.payload for p in packets],
+				[b"packet%d" % i for i in range(25, 30)])
+			assert_equals([p.direction for p in packets],
+				[OUTBOUND, INBOUND, OUTBOUND, INBOUND, OUTBOUND])
+
+			assert_equals(list(r.packets(2000)), [])
+			assert_equals(len(list(r.packets())), 100)
+
+	@raises(pcapdump.PcapFormatError)
+	def test_not_pcap(self):
+		with open(self.path, "wb") as f:
+			f.write(b"not a pcap file at all")
+		PcapDumpReader(self.path)
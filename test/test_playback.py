@@ -0,0 +1,152 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import os
+import wave
+import socket
+import shutil
+import tempfile
+
+from nose.tools import assert_equals
+
+import connection
+import media
+import playback
+from playback import Announcement, PlaybackScheduler, PACKET_SAMPLES
+from rtpstats import RTP_HEADER
+from sip import RtpUdpStream
+
+class StreamMock(object):
+	def __init__(self):
+		self.packets = []
+
+	def send(self, msg, dump=True):
+		self.packets.append((bytes(msg), dump))
+
+def runLoop(seconds):
+	loop = connection.getLoop()
+	loop.call_later(seconds, loop.stop)
+	loop.run_forever()
+
+class TestAnnouncement(object):
+	def test_packets(self):
+		"""Test that the audio is split into 20ms packets and the variable
+		header fields are patched in"""
+		a = Announcement(b"\x01" * 400)
+		assert_equals(a.frames, 3)
+
+		first = bytes(a.packet(0, 1, 2, 3))
+		assert_equals(RTP_HEADER.unpack_from(first), (0x80, 0x80, 1, 2, 3))
+		assert_equals(first[RTP_HEADER.size:], b"\x01" * PACKET_SAMPLES)
+
+		last = bytes(a.packet(2, 0xffff, 0xffffffff, 0x12345678))
+		assert_equals(RTP_HEADER.unpack_from(last),
+			(0x80, 0, 0xffff, 0xffffffff, 0x12345678))
+		assert_equals(last[RTP_HEADER.size:], b"\x01" * 80 + b"\xff" * 80)
+
+	def test_load(self):
+		"""Test loading raw μ-law and WAV files"""
+		directory = tempfile.mkdtemp()
+		try:
+			raw = os.path.join(directory, "announcement.ul")
+			with open(raw, "wb") as f:
+				f.write(b"\x00" * 320)
+			assert_equals(playback.loadAnnouncement(raw).frames, 2)
+
+			path = os.path.join(directory, "announcement.wav")
+			with wave.open(path, "wb") as f:
+				f.setnchannels(1)
+				f.setsampwidth(2)
+				f.setframerate(8000)
+				f.writeframes(b"\0\0" * 480)
+			a = playback.loadAnnouncement(path)
+			assert_equals(a.frames, 3)
+			assert_equals(bytes(a.packet(0, 0, 0, 0))[RTP_HEADER.size:],
+				b"\xff" * PACKET_SAMPLES)
+		finally:
+			shutil.rmtree(directory)
+
+class TestPlaybackScheduler(object):
+	def test_pacing(self):
+		"""Test that all streams get one packet per interval with contiguous
+		sequence numbers and timestamps"""
+		s = PlaybackScheduler(Announcement(bytes(range(256)) * 5))
+		streams = [StreamMock() for i in range(100)]
+		for stream in streams:
+			s.add(stream)
+		runLoop(0.21)
+		s.close()
+
+		assert 8 <= s.ticks <= 11
+		for stream in streams:
+			headers = [RTP_HEADER.unpack_from(p) for p, _ in stream.packets]
+			assert_equals(len(headers), s.ticks)
+			assert_equals(set(h[4] for h in headers), {headers[0][4]})
+			for a, b in zip(headers, headers[1:]):
+				assert_equals((a[2] + 1) & 0xffff, b[2])
+				assert_equals((a[3] + PACKET_SAMPLES) & 0xffffffff, b[3])
+			assert not any(dump for _, dump in stream.packets)
+		assert_equals(s.sent, 100 * s.ticks)
+		assert s.maxLateness < 0.02
+
+	def test_no_repeat(self):
+		"""Test that a stream is removed after the announcement without
+		repeat"""
+		s = PlaybackScheduler(Announcement(b"\x00" * 320), repeat=False)
+		stream = StreamMock()
+		s.add(stream)
+		runLoop(0.1)
+		assert_equals(len(stream.packets), 2)
+		assert_equals(len(s), 0)
+		s.close()
+
+	def test_stream(self):
+		"""Test playback from an RTP stream's port until it is closed"""
+		m = media.MediaManager('127.0.0.1', 41010, 1)
+		c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		c.bind(('127.0.0.1', 0))
+		c.setblocking(False)
+
+		playback.g_playbackScheduler = PlaybackScheduler(
+			Announcement(b"\x00" * 1600))
+		try:
+			stream = RtpUdpStream('127.0.0.1', c.getsockname()[1], m)
+			stream.startPlayback()
+			runLoop(0.05)
+			stream.close()
+			runLoop(0.05)
+
+			received = []
+			while True:
+				try:
+					received.append(c.recvfrom(1024))
+				except BlockingIOError:
+					break
+			assert 1 <= len(received) <= 3
+			assert_equals(received[0][1], ('127.0.0.1', 41010))
+			assert_equals(len(received[0][0]), RTP_HEADER.size + PACKET_SAMPLES)
+			assert_equals(len(playback.g_playbackScheduler), 0)
+		finally:
+			playback.g_playbackScheduler.close()
+			playback.g_playbackScheduler = None
+			m.close()
+			c.close()
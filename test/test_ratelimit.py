@@ -0,0 +1,101 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import socket
+
+from nose.tools import assert_equals
+
+from ratelimit import TokenBucketLimiter, sourceKey
+from sip import Sip, g_sipconfig
+
+class TestTokenBucketLimiter(object):
+	def test_burst_and_rate(self):
+		"""Test that a source may send a burst and then the configured rate"""
+		l = TokenBucketLimiter(rate=10, burst=5)
+		assert_equals([l.allow("10.0.0.1", now=0) for i in range(7)],
+			[True] * 5 + [False] * 2)
+
+		# 0.25s refill 2.5 tokens
+		assert_equals([l.allow("10.0.0.1", now=0.25) for i in range(3)],
+			[True, True, False])
+
+		# Other sources have their own budget
+		assert l.allow("10.0.0.2", now=0.25)
+		assert_equals(l.shed, 3)
+
+	def test_refill_capped_at_burst(self):
+		l = TokenBucketLimiter(rate=10, burst=2)
+		l.allow("a", now=0)
+		assert_equals([l.allow("a", now=100) for i in range(3)],
+			[True, True, False])
+
+	def test_eviction(self):
+		"""Test that the least recently seen source is evicted"""
+		l = TokenBucketLimiter(rate=1, burst=1, maxSources=2)
+		l.allow("a", now=0)
+		l.allow("b", now=0)
+		assert not l.allow("a", now=0)
+		l.allow("c", now=0)
+		assert_equals(len(l), 2)
+		assert_equals(l.evictions, 1)
+
+		# b has been evicted and starts with a full bucket
+		assert l.allow("b", now=0)
+
+def test_source_key():
+	assert_equals(sourceKey("192.168.1.20"), "192.168.1.20")
+	assert_equals(sourceKey("192.168.1.20", True), "192.168.1")
+	assert_equals(sourceKey("::1", True), "::1")
+
+def test_shed_before_parsing():
+	"""Test that datagrams over the budget of a source are answered with a
+	503 and not handled"""
+	saved = dict(g_sipconfig)
+	g_sipconfig.update(ratelimit_rate=1, ratelimit_burst=2,
+		ratelimit_reply=True)
+
+	s = Sip()
+	s.bind(('127.0.0.1', 0))
+	c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	c.settimeout(1)
+
+	try:
+		for i in range(4):
+			c.sendto("OPTIONS sip:foo SIP/2.0\r\nFrom: test\r\n"
+				"Call-ID: shed{}\r\nCSeq: 1 OPTIONS\r\n\r\n".format(i).encode(),
+				s.socket.getsockname())
+		s.handle_read()
+	finally:
+		g_sipconfig.update(saved)
+
+	responses = [c.recvfrom(4096)[0].split(b"\n") for i in range(4)]
+	assert_equals(sorted(r[0] for r in responses),
+		[b"SIP/2.0 200 OK"] * 2 + [b"SIP/2.0 503 Service unavailable"] * 2)
+	assert_equals(sorted(line for r in responses for line in r
+		if line.startswith(b"Call-ID")),
+		[b"Call-ID: shed0", b"Call-ID: shed1", b"Call-ID: shed2",
+			b"Call-ID: shed3"])
+	assert_equals(s.stats()['ratelimit_shed'], 2)
+	assert_equals(s.stats()['retransmission_misses'], 2)
+
+	c.close()
+	s.close()
@@ -0,0 +1,52 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+from nose.tools import assert_equals
+
+from response import ResponseTemplate, compileFormat
+
+def test_compile_format():
+	"""Test compilation of a template string into a bytes format string"""
+	fmt, names = compileFormat("To: {to}\nX: 100%\nPort: {port:d}")
+	assert_equals(fmt, "To: %s\nX: 100%%\nPort: %d")
+	assert_equals(names, ["to", "port"])
+
+class TestResponseTemplate(object):
+	def test_render_without_body(self):
+		"""Test rendering of a response without body"""
+		t = ResponseTemplate(["SIP/2.0 200 OK", "To: {to}", "CSeq: {cseq}"])
+		assert_equals(t.render(to="foo", cseq="1 OPTIONS"),
+			b"SIP/2.0 200 OK\nTo: foo\nCSeq: 1 OPTIONS\nContent-Length: 0\n\n")
+
+	def test_render_with_body(self):
+		"""Test rendering of a response with a body and its length"""
+		t = ResponseTemplate(["SIP/2.0 200 OK", "Call-ID: {callId}"],
+			["v=0", "m=audio {rtpPort:d} RTP/AVP 0"])
+		assert_equals(t.render(callId="1234", rtpPort=30000),
+			b"SIP/2.0 200 OK\nCall-ID: 1234\nContent-Length: 28\n\n" + \
+			b"v=0\nm=audio 30000 RTP/AVP 0\n")
+
+	def test_field_values_are_not_formatted(self):
+		"""Test that braces and percent signs in values are copied as is"""
+		t = ResponseTemplate(["To: {to}"])
+		assert_equals(t.render(to="{x} %s"),
+			b"To: {x} %s\nContent-Length: 0\n\n")
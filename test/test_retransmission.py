@@ -0,0 +1,65 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+from nose.tools import assert_equals
+
+from retransmission import RetransmissionCache, datagramDigest
+
+class TestRetransmissionCache(object):
+	def test_replay(self):
+		"""Test that the stored responses are returned for the same key"""
+		c = RetransmissionCache()
+		key = (('127.0.0.1', 5060), datagramDigest(b"OPTIONS foo SIP/2.0"))
+
+		assert_equals(c.get(key, now=0), None)
+		c.put(key, (b"SIP/2.0 200 OK",), now=0)
+		assert_equals(c.get(key, now=1), (b"SIP/2.0 200 OK",))
+		assert_equals(c.hits, 1)
+		assert_equals(c.misses, 1)
+
+	def test_expiry(self):
+		"""Test that entries expire after the configured time"""
+		c = RetransmissionCache(ttl=32)
+		c.put("a", (), now=0)
+
+		assert_equals(c.get("a", now=32), ())
+		assert_equals(c.get("a", now=33), None)
+		assert_equals(len(c), 0)
+
+	def test_lru_eviction(self):
+		"""Test that the least recently used entry is evicted first"""
+		c = RetransmissionCache(maxEntries=2)
+		c.put("a", (b"a",), now=0)
+		c.put("b", (b"b",), now=0)
+		c.get("a", now=0)
+		c.put("c", (b"c",), now=0)
+
+		assert_equals(len(c), 2)
+		assert_equals(c.evictions, 1)
+		assert_equals(c.get("b", now=0), None)
+		assert_equals(c.get("a", now=0), (b"a",))
+		assert_equals(c.get("c", now=0), (b"c",))
+
+	def test_digest(self):
+		"""Test that different datagrams get different digests"""
+		assert datagramDigest(b"a") != datagramDigest(b"b")
+		assert_equals(datagramDigest(b"a"), datagramDigest(b"a"))
@@ -0,0 +1,268 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import os
+import random
+import shutil
+import tempfile
+
+from nose.tools import assert_equals
+import numpy as np
+
+import rtpanalysis
+from dumpwriter import DumpWriter
+from pcapdump import PcapStreamDump, INBOUND, OUTBOUND
+from rtpstats import RTP_HEADER, RtpStreamStats, RtpSourceStats
+
+def rtp(seq, timestamp, ssrc, payloadType=0, payload=b"\xff" * 160):
+	return RTP_HEADER.pack(0x80, payloadType, seq & 0xffff,
+		timestamp & 0xffffffff, ssrc) + payload
+
+def stream():
+	"""Packets (time, data) of two SSRCs: a clean 20ms PCMU stream and one with
+	a lost packet, a reordered packet, jitter and a sequence number wrap"""
+	packets = []
+	for i in range(50):
+		packets.append((1000 + i * 0.02, rtp(i, i * 160, 0x1111)))
+
+	r = random.Random(1)
+	seqs = list(range(65530, 65530 + 30))
+	del seqs[10]
+	seqs[5], seqs[6] = seqs[6], seqs[5]
+	for n, seq in enumerate(seqs):
+		i = seq - 65530
+		packets.append((1001 + n * 0.02 + r.uniform(0, 0.005),
+			rtp(seq, 4000000000 + i * 160, 0x2222, 8)))
+	packets.sort()
+	return packets
+
+def assertSameStats(sources, expected):
+	assert_equals(len(sources), len(expected))
+	for a, b in zip(sources, expected):
+		assert_equals(a[:7], b[:7])
+		assert_equals(a.payloadTypes, b.payloadTypes)
+		for x, y in zip(a[7:11], b[7:11]):
+			assert abs(x - y) < 1e-9
+
+def headers(seqs, ssrcs):
+	"""HEADER_DTYPE array of packets with the given sequence numbers and
+	SSRCs, 20ms apart"""
+	h = np.zeros(len(seqs), dtype=rtpanalysis.HEADER_DTYPE)
+	h["time"] = 1000 + np.arange(len(seqs)) * 0.02
+	h["length"] = 172
+	h["seq"] = np.asarray(seqs) & 0xffff
+	h["timestamp"] = np.arange(len(seqs)) * 160
+	h["ssrc"] = ssrcs
+	return h
+
+def replay(headers):
+	"""SourceStats per SSRC of a HEADER_DTYPE array computed packet by
+	packet with rtpstats (the reference for rtpanalysis.analyzeHeaders)"""
+	sources = {}
+	for seq, timestamp, payloadType, length, t, ssrc in zip(
+			headers["seq"].tolist(), headers["timestamp"].tolist(),
+			headers["payloadType"].tolist(), headers["length"].tolist(),
+			headers["time"].tolist(), headers["ssrc"].tolist()):
+		if ssrc not in sources:
+			sources[ssrc] = RtpSourceStats(ssrc)
+		sources[ssrc].update(seq, timestamp, payloadType, length, t)
+	return [sources[ssrc].summary() for ssrc in sorted(sources)]
+
+class TestRtpStats(object):
+	def test_clean_stream(self):
+		"""Test the statistics of a stream without loss and jitter"""
+		stats = RtpStreamStats()
+		for i in range(100):
+			stats.update(rtp(i, i * 160, 42), i * 0.02)
+		stats.update(b"not rtp", 2.0)
+
+		s, = stats.summary()
+		# The first packet ends the probation, the second is the base
+		assert_equals((s.ssrc, s.packets, s.received, s.expected, s.lost,
+			s.reordered), (42, 100, 99, 99, 0, 0))
+		assert s.jitter < 1e-9
+		assert abs(s.rate - 50) < 1e-6
+		assert_equals(s.payloadTypes, {0: 100})
+		assert_equals(stats.invalid, 1)
+
+	def test_loss_and_reordering(self):
+		"""Test loss, reordering, SSRC changes and jitter"""
+		stats = RtpStreamStats()
+		for t, data in stream():
+			stats.update(data, t)
+
+		clean, noisy = stats.summary()
+		assert_equals((clean.packets, clean.lost, clean.reordered), (50, 0, 0))
+		assert_equals((noisy.packets, noisy.received, noisy.expected,
+			noisy.lost, noisy.reordered), (29, 28, 29, 1, 1))
+		assert_equals(noisy.payloadTypes, {8: 29})
+		assert 0 < noisy.jitter < 0.01
+		assert_equals(stats.ssrcChanges, 1)
+
+	def test_jumps(self):
+		"""Test that a single stray sequence number is ignored and that a
+		jump confirmed by the next packet restarts the sequence (RFC 3550
+		A.1)"""
+		stats = RtpStreamStats()
+		for n, seq in enumerate([100, 101, 100 - 30000, 100 + 30000, 102]):
+			stats.update(rtp(seq, n * 160, 1), n * 0.02)
+		s, = stats.summary()
+		assert_equals((s.packets, s.received, s.expected, s.lost,
+			s.reordered), (5, 2, 2, 0, 0))
+
+		# The sender restarts at 5000
+		for n, seq in enumerate([5000, 5001, 5002], 5):
+			stats.update(rtp(seq, n * 160, 1), n * 0.02)
+		s, = stats.summary()
+		assert_equals((s.packets, s.received, s.expected, s.lost), (8, 2, 2, 0))
+
+class TestRtpAnalysis(object):
+	def setup_method(self, method):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, "stream_1.pcap")
+
+		w = DumpWriter(self.directory, flushInterval=0.01)
+		d = PcapStreamDump(w, "stream_1.pcap", ('127.0.0.1', 30000))
+		self.live = RtpStreamStats()
+		for t, data in stream():
+			d.write(data, INBOUND, ('10.0.0.1', 5004), timestamp=t)
+			self.live.update(data, t)
+
+			# Our own packets and garbage are ignored or counted as invalid
+			d.write(rtp(0, 0, 0x9999), OUTBOUND, ('10.0.0.1', 5004),
+				timestamp=t)
+		d.write(b"garbage", INBOUND, ('10.0.0.1', 5004), timestamp=1010)
+		d.close()
+		w.close()
+
+	def teardown_method(self, method):
+		shutil.rmtree(self.directory)
+
+	def test_same_as_live(self):
+		"""Test that the vectorized analysis matches the live statistics"""
+		result = rtpanalysis.analyze(self.path)
+		assert_equals((result.packets, result.invalid), (79, 1))
+		assert_equals(result.ssrcChanges, self.live.ssrcChanges)
+
+		assertSameStats(result.sources, self.live.summary())
+
+	def test_directory(self):
+		"""Test analyzing all dumps of a directory, both directions"""
+		results = rtpanalysis.analyzeDirectory(self.directory, direction=None)
+		assert_equals(len(results), 1)
+		assert_equals([s.ssrc for s in results[0].sources],
+			[0x1111, 0x2222, 0x9999])
+		assert_equals(rtpanalysis.payloadTypes(results), {0: 129, 8: 29})
+
+def test_random_streams():
+	"""Test that the vectorized analysis matches the live statistics for
+	streams with jumps, duplicates, reordering, losses and wraps"""
+	r = random.Random(2)
+	directory = tempfile.mkdtemp()
+	try:
+		w = DumpWriter(directory, flushInterval=0.01)
+		d = PcapStreamDump(w, "stream_1.pcap", ('127.0.0.1', 30000))
+		live = RtpStreamStats()
+		t = 1000.0
+		for ssrc in range(1, 13):
+			seq = r.randrange(65536)
+			for i in range(r.randrange(1, 300)):
+				event = r.random()
+				if event < 0.02:
+					seq += r.randrange(3000, 60000)
+				elif event < 0.05:
+					seq -= r.randrange(1, 200)
+				elif event < 0.08:
+					seq += r.randrange(2, 50)
+				elif event > 0.1:
+					seq += 1
+				t += r.uniform(0.01, 0.03)
+				data = rtp(seq, i * 160, ssrc)
+				d.write(data, INBOUND, ('10.0.0.1', 5004), timestamp=t)
+				live.update(data, t)
+		d.close()
+		w.close()
+
+		result = rtpanalysis.analyze(os.path.join(directory, "stream_1.pcap"))
+		assertSameStats(result.sources, live.summary())
+	finally:
+		shutil.rmtree(directory)
+
+def patterns(r, n):
+	"""Sequence numbers of n packets: random ones, pairs of a random one and
+	its successor, a decreasing sequence, a sequence with jumps, losses and
+	reordering, and one mixing sequence numbers close to the limits of RFC
+	3550 A.1"""
+	kind = r.randrange(5)
+	seqs = []
+	seq = r.randrange(65536)
+	for i in range(n):
+		if kind == 0:
+			seq = r.randrange(65536)
+		elif kind == 1:
+			seq = seq + 1 if i % 2 and r.random() < 0.5 else \
+				r.randrange(65536)
+		elif kind == 2:
+			seq -= r.choice([1, 1, 2, 100, 3000])
+		elif kind == 3:
+			event = r.random()
+			if event < 0.05:
+				seq += r.randrange(3000, 62000)
+			elif event < 0.1:
+				seq -= r.randrange(1, 200)
+			elif event < 0.15:
+				seq += r.randrange(3000)
+			else:
+				seq += 1
+		else:
+			seq = r.choice([seq + 1, seq + r.randrange(2990, 3010),
+				seq - r.randrange(95, 105), seq + 32768])
+		seqs.append(seq)
+	return seqs
+
+def test_sequence_patterns():
+	"""Test that the vectorized RFC 3550 A.1 matches rtpstats for
+	interleaved SSRCs with all kinds of sequence numbers, also when most
+	packets are found by the bucket search"""
+	r = random.Random(3)
+	distances = rtpanalysis.SCAN_DISTANCE, rtpanalysis.PROBE_DISTANCE
+	try:
+		for scan, probe in [distances, (1, 1)]:
+			rtpanalysis.SCAN_DISTANCE = scan
+			rtpanalysis.PROBE_DISTANCE = probe
+			for trial in range(200):
+				n = r.randrange(1, 400)
+				h = headers(patterns(r, n),
+					[r.randrange(1, 4) for i in range(n)])
+				assertSameStats(rtpanalysis.analyzeHeaders(h), replay(h))
+	finally:
+		rtpanalysis.SCAN_DISTANCE, rtpanalysis.PROBE_DISTANCE = distances
+
+def test_restarts():
+	"""Test that jumps confirmed by the next packet restart the sequence and
+	that a single jump is ignored"""
+	# Restarts at 40001 and 14, 40003 is ignored
+	seqs = [10, 11, 12, 40000, 40001, 40002, 13, 14, 40003, 30, 31, 32]
+	h = headers(seqs, 1)
+	s, = rtpanalysis.analyzeHeaders(h)
+	assert_equals((s.received, s.expected, s.reordered), (4, 19, 0))
+	assertSameStats([s], replay(h))
@@ -0,0 +1,156 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+from nose.tools import assert_equals
+
+import sessiontable
+from sessiontable import SessionTable
+from sip import Sip, g_sipconfig
+
+class SessionMock(object):
+	def __init__(self, table, callId, address, lastActivity=0):
+		self.table = table
+		self.callId = callId
+		self.remoteAddress = address
+		self.lastActivity = lastActivity
+		self.closed = False
+
+	def close(self):
+		self.closed = True
+		del self.table[self.callId]
+
+class TestSessionTable(object):
+	def add(self, table, callId, address, lastActivity=0):
+		s = SessionMock(table, callId, address, lastActivity)
+		table[callId] = s
+		return s
+
+	def test_per_source_limit(self):
+		t = SessionTable(maxSessions=10, maxPerSource=2)
+		self.add(t, "a", "10.0.0.1")
+		self.add(t, "b", "10.0.0.1")
+		assert_equals(t.admit("10.0.0.1"), sessiontable.SOURCE_LIMIT)
+		assert_equals(t.admit("10.0.0.2"), sessiontable.ADMITTED)
+
+		del t["a"]
+		assert_equals(t.sessionsOf("10.0.0.1"), 1)
+		assert_equals(t.admit("10.0.0.1"), sessiontable.ADMITTED)
+		assert_equals(t.rejectedSource, 1)
+
+	def test_evict_least_recently_active(self):
+		"""Test that a full table evicts the session touched least recently"""
+		t = SessionTable(maxSessions=2, minIdle=5)
+		a = self.add(t, "a", "10.0.0.1")
+		b = self.add(t, "b", "10.0.0.2")
+		t.touch("a")
+
+		assert_equals(t.admit("10.0.0.3", now=100), sessiontable.ADMITTED)
+		assert b.closed
+		assert not a.closed
+		assert_equals(len(t), 1)
+		assert_equals(t.sessionsOf("10.0.0.2"), 0)
+		assert_equals(t.evictions, 1)
+
+	def test_full_of_active_sessions(self):
+		"""Test that sessions active within minIdle are not evicted"""
+		t = SessionTable(maxSessions=2, minIdle=5)
+		self.add(t, "a", "10.0.0.1", lastActivity=98)
+		self.add(t, "b", "10.0.0.2", lastActivity=99)
+
+		assert_equals(t.admit("10.0.0.3", now=100), sessiontable.TABLE_FULL)
+		assert_equals(len(t), 2)
+		assert_equals(t.rejectedFull, 1)
+
+def test_invite_rejected_per_source():
+	"""Test that an INVITE over the per-source limit is answered with 486
+	without creating a session"""
+	sdp = "v=0\no=test 1 1 IN IP4 127.0.0.1\ns=-\nc=IN IP4 127.0.0.1\n" + \
+		"t=0 0\nm=audio 30123 RTP/AVP 0\n"
+
+	def invite(callId):
+		return ("INVITE sip:100@localhost SIP/2.0\nVia: SIP/2.0/UDP 127.0.0.1\n"
+			"From: test\nTo: 100\nCall-ID: {}\nCSeq: 1 INVITE\n"
+			"Contact: test\nAccept: application/sdp\n"
+			"Content-Type: application/sdp\nContent-Length: {}\n\n{}").format(
+			callId, len(sdp), sdp).encode()
+
+	table = SessionTable(maxSessions=10, maxPerSource=1)
+	s = Sip(sessions=table)
+	sent = []
+	s.send = sent.append
+
+	saved = g_sipconfig['use_authentication']
+	g_sipconfig['use_authentication'] = False
+	try:
+		s.handle_message(invite("first"), ('127.0.0.1', 5060))
+		s.handle_message(invite("second"), ('127.0.0.1', 5060))
+	finally:
+		g_sipconfig['use_authentication'] = saved
+
+	assert_equals(len(table), 1)
+	assert "second" not in table
+	assert sent[-1].startswith(b"SIP/2.0 486 Busy here")
+
+	table["first"].close()
+	assert_equals(len(table), 0)
+	s.close()
+
+def test_invite_invalid_rtp_port():
+	"""Test that an INVITE with an invalid RTP port is answered with 400
+	without taking a port of the RTP range"""
+	import media
+
+	sdp = "v=0\no=test 1 1 IN IP4 127.0.0.1\ns=-\nc=IN IP4 127.0.0.1\n" + \
+		"t=0 0\nm=audio abc RTP/AVP 0\n"
+	invite = ("INVITE sip:100@localhost SIP/2.0\nVia: SIP/2.0/UDP 127.0.0.1\n"
+		"From: test\nTo: 100\nCall-ID: invalid\nCSeq: 1 INVITE\n"
+		"Contact: test\nAccept: application/sdp\n"
+		"Content-Type: application/sdp\nContent-Length: {}\n\n{}").format(
+		len(sdp), sdp).encode()
+
+	table = SessionTable(maxSessions=10)
+	s = Sip(sessions=table)
+	sent = []
+	s.send = sent.append
+	free = media.getMediaManager().stats()['rtp_ports_free']
+
+	saved = g_sipconfig['use_authentication']
+	g_sipconfig['use_authentication'] = False
+	try:
+		for i in range(3):
+			s.handle_message(invite, ('127.0.0.1', 5060))
+	finally:
+		g_sipconfig['use_authentication'] = saved
+
+	assert_equals(len(table), 0)
+	assert_equals(len(sent), 3)
+	assert sent[-1].startswith(b"SIP/2.0 400 Bad request")
+	assert_equals(media.getMediaManager().stats()['rtp_ports_free'], free)
+
+	# A stream given an invalid port does not take a local port either
+	from sip import RtpUdpStream
+	try:
+		RtpUdpStream('127.0.0.1', "abc")
+	except ValueError:
+		pass
+	assert_equals(media.getMediaManager().stats()['rtp_ports_free'], free)
+	s.close()
@@ -27,7 +27,8 @@
 
 from nose.tools import assert_equals, raises
 
-from sip import parseSipMessage, SipParsingError
+from sip import parseSipMessage, SipParsingError, SipMessage, SipStreamFramer
+from sip import rejectHeaders, REJECT_SCAN_SIZE
 
 class TestSipMessageParser:
 	def test_correct_parsing(self):
@@ -134,41 +135,421 @@ class TestSipMessageParser:
 		assert_equals(headers["via"][1], "SIP/2.0/UDP proxyB.domain")
 		assert_equals(headers["content-length"], "0")
 
+	def test_parsing_bytes(self):
+		"""Test message parsing of raw bytes with CRLF line endings"""
+		msgType, firstLine, headers, body = parseSipMessage(
+			b"INVITE sip:foo SIP/2.0\r\nFrom: test\r\nCall-ID: 1234\r\n" + \
+			b"Content-Length: 4\r\n\r\n1234\r\n")
+
+		assert_equals(msgType, "INVITE")
+		assert_equals(firstLine, "sip:foo SIP/2.0")
+		assert_equals(headers["from"], "test")
+		assert_equals(headers["call-id"], "1234")
+		assert_equals(headers["content-length"], "4")
+		assert_equals(body, "1234")
+
+	def test_parsing_buffer_types(self):
+		"""Test message parsing of bytearray and memoryview input"""
+		msg = b"OPTIONS sip:foo SIP/2.0\nf: test\nt: foo"
+		for data in [bytearray(msg), memoryview(msg)]:
+			msgType, firstLine, headers, body = parseSipMessage(data)
+			assert_equals(msgType, "OPTIONS")
+			assert_equals(headers["from"], "test")
+			assert_equals(headers["to"], "foo")
+
+	def test_multiline_body(self):
+		"""Test that the body is returned unchanged after the first empty
+		line"""
+		body = parseSipMessage(
+			b"INVITE foo SIP/2.0\nl: 12\n\nv=0\n\no=foo\n")[3]
+		assert_equals(body, "v=0\n\no=foo")
+
+	@raises(SipParsingError)
+	def test_exception_on_unknown_header(self):
+		"""Test SIP message parsing with an unknown header"""
+		parseSipMessage(b"INVITE foo SIP/2.0\nX-Foo: bar\n")
+
+	@raises(SipParsingError)
+	def test_exception_on_invalid_utf8(self):
+		"""Test SIP message parsing with a message that is not valid UTF-8"""
+		parseSipMessage(b"INVITE foo SIP/2.0\nFrom: \xff\xfe\n")
+
+class TestSipMessage:
+	def test_lazy_header_access(self):
+		"""Test dictionary-like access to header values"""
+		msg = SipMessage(b"OPTIONS sip:foo SIP/2.0\r\nf: test\r\n" + \
+			b"Call-ID: 1234\r\nv: SIP/2.0/UDP a\r\nv: SIP/2.0/UDP b\r\n")
+
+		assert_equals(msg.type, "OPTIONS")
+		assert_equals(msg.firstLine, "sip:foo SIP/2.0")
+		assert_equals(msg["from"], "test")
+		assert_equals(msg["call-id"], "1234")
+		assert_equals(msg.via, ["SIP/2.0/UDP a", "SIP/2.0/UDP b"])
+		assert "from" in msg
+		assert "to" not in msg
+		assert_equals(msg.get("to"), None)
+		assert_equals(msg.body, "")
+
+	@raises(KeyError)
+	def test_missing_header(self):
+		"""Test that a missing header raises a KeyError like a dictionary"""
+		SipMessage(b"OPTIONS sip:foo SIP/2.0\nf: test\n")["to"]
+
+	def test_cseq(self):
+		"""Test parsing of the CSeq header into number and method"""
+		msg = SipMessage(b"CANCEL sip:foo SIP/2.0\nCSeq: 42 INVITE\n")
+		assert_equals(msg.cseq, (42, "INVITE"))
+
+	@raises(SipParsingError)
+	def test_malformed_cseq(self):
+		"""Test that a malformed CSeq header raises a SipParsingError"""
+		SipMessage(b"CANCEL sip:foo SIP/2.0\nCSeq: INVITE\n").cseq
+
+	def test_authorization(self):
+		"""Test parsing of the Authorization header parameters"""
+		msg = SipMessage(b"INVITE sip:foo SIP/2.0\n" + \
+			b'Authorization: Digest username="100", nonce="a=b", ' + \
+			b'response="1234"\n')
+		scheme, params = msg.authorization
+
+		assert_equals(scheme, "Digest")
+		assert_equals(params["username"], "100")
+		assert_equals(params["nonce"], "a=b")
+		assert_equals(params["response"], "1234")
+		assert_equals(SipMessage(b"INVITE foo SIP/2.0\n").authorization, None)
+
+class TestSipStreamFramer:
+	def test_partial_reads(self):
+		"""Test framing of a message that arrives in single bytes"""
+		f = SipStreamFramer()
+		msg = b"INVITE sip:foo SIP/2.0\r\nContent-Length: 4\r\n\r\n1234"
+
+		messages = []
+		for i in range(len(msg)):
+			messages += f.feed(msg[i:i+1])
+
+		assert_equals(messages, [msg])
+
+	def test_pipelined_messages(self):
+		"""Test framing of several messages received in one read"""
+		f = SipStreamFramer()
+		msg1 = b"INVITE sip:foo SIP/2.0\r\nl: 3\r\n\r\nabc"
+		msg2 = b"OPTIONS sip:foo SIP/2.0\r\nCall-ID: 1\r\n\r\n"
+		msg3 = b"BYE sip:foo SIP/2.0\nContent-Length: 10\n\n0123"
+
+		assert_equals(f.feed(msg1 + b"\r\n\r\n" + msg2 + msg3), [msg1, msg2])
+		assert_equals(f.feed(b"456789"), [msg3 + b"456789"])
+
+	@raises(SipParsingError)
+	def test_message_too_large(self):
+		"""Test that a Content-Length above the limit is rejected"""
+		SipStreamFramer(1024).feed(
+			b"INVITE sip:foo SIP/2.0\nContent-Length: 2048\n\n")
+
+	@raises(SipParsingError)
+	def test_headers_too_long(self):
+		"""Test that headers without an end are not buffered forever"""
+		f = SipStreamFramer(1024)
+		for i in range(100):
+			f.feed(b"Via: SIP/2.0/TCP 127.0.0.1\r\n")
+
+def test_reject_headers():
+	"""Test finding the response headers of a request without parsing it"""
+	def headers(data):
+		buf = bytearray(data + b"\0" * 16)
+		return rejectHeaders(buf, len(data))
+
+	assert_equals(headers(b"\r\nOPTIONS sip:foo SIP/2.0\r\nVia: x\r\n"
+		b"from : <sip:a@b>\r\nX-Unknown: 1\r\nCall-ID: 1@b\r\n"
+		b"CSeq: 2 OPTIONS \r\n\r\nCSeq: 3 body\r\n"),
+		{'from': "<sip:a@b>", 'call-id': "1@b", 'cseq': "2 OPTIONS"})
+	assert_equals(headers(b"INVITE sip:foo SIP/2.0\nf: a\ni: 1\nCSEQ: 1 I\n"),
+		{'from': "a", 'call-id': "1", 'cseq': "1 I"})
+
+	# Responses, ACKs, missing headers and headers beyond the scanned bytes
+	for data in [b"SIP/2.0 200 OK\nFrom: a\nCall-ID: 1\nCSeq: 1 I\n",
+			b"ACK sip:foo SIP/2.0\nFrom: a\nCall-ID: 1\nCSeq: 1 ACK\n",
+			b"OPTIONS sip:foo SIP/2.0\nFrom: a\nCSeq: 1 OPTIONS\n",
+			b"OPTIONS sip:foo SIP/2.0\nFrom: a\nCall-ID: 1\n\nCSeq: 1 O\n",
+			b"OPTIONS sip:foo SIP/2.0\nFrom: a\nCall-ID: 1\n" +
+				b"Subject: " + b"x" * REJECT_SCAN_SIZE + b"\nCSeq: 1 O\n",
+			b"OPTIONS sip:foo SIP/2.0\nFrom: \xff\nCall-ID: 1\nCSeq: 1 O\n"]:
+		assert_equals(headers(data), None)
+
+def test_tcp_connection():
+	"""Test handling of a SIP request received over a TCP connection"""
+	import socket
+	from sip import SipTcpConnection
+
+	local, remote = socket.socketpair()
+	c = SipTcpConnection(local, ('127.0.0.1', 5060))
+
+	remote.sendall(b"OPTIONS sip:foo SIP/2.0\r\nFrom: test\r\n" + \
+		b"Call-ID: 1234\r\nCSeq: 1 OPTIONS\r\n\r\n")
+	c.handle_read()
+	assert c.writable()
+	c.handle_write()
+
+	# Responses carry a Content-Length so that they can be framed
+	responses = SipStreamFramer().feed(remote.recv(4096))
+	assert_equals(len(responses), 1)
+	data = responses[0].decode('utf-8').split('\n')
+	assert_equals(data[0], "SIP/2.0 200 OK")
+	assert "Call-ID: 1234" in data
+
+	c.close()
+	remote.close()
+
+def test_tcp_idle_timeout():
+	"""Test that a TCP connection is closed after tcp_idle_timeout seconds
+	without data, and that data keeps it open"""
+	import time
+	import socket
+	import connection
+	from timerwheel import TimerWheel
+	from sip import SipTcpConnection, g_sipconfig
+
+	# Timer wheel driven by a fake clock instead of the event loop
+	now = [time.monotonic()]
+	saved = connection.g_timerWheel
+	connection.g_timerWheel = TimerWheel(clock=lambda: now[0])
+	local, remote = socket.socketpair()
+
+	def advance(seconds):
+		now[0] += seconds
+		connection.g_timerWheel.advance()
+
+	try:
+		idle = SipTcpConnection.idleCount
+		c = SipTcpConnection(local, ('127.0.0.1', 5060))
+		timeout = g_sipconfig['tcp_idle_timeout']
+
+		# Data shortly before the timeout
+		advance(timeout - 5)
+		remote.sendall(b"OPTIONS sip:foo SIP/2.0\r\nFrom: test\r\n" + \
+			b"Call-ID: 1234\r\nCSeq: 1 OPTIONS\r\n\r\n")
+		c.handle_read()
+		advance(10)
+		assert c.socket is not None
+
+		# The connection is idle from now on
+		c._SipTcpConnection__lastActivity = time.monotonic() - timeout
+		advance(timeout)
+		assert_equals(c.socket, None)
+		assert_equals(SipTcpConnection.idleCount, idle + 1)
+	finally:
+		connection.g_timerWheel = saved
+		remote.close()
+
+def test_tcp_max_connections():
+	"""Test that connections beyond tcp_max_connections are closed right
+	after being accepted"""
+	import socket
+	from sip import Sip, SipTcp, SipTcpConnection, g_sipconfig
+
+	saved = dict(g_sipconfig)
+	g_sipconfig.update(tcp_max_connections=SipTcpConnection.openCount + 1)
+	t = SipTcp()
+	t.bind(('127.0.0.1', 0))
+	t.listen(8)
+	clients = [socket.create_connection(t.socket.getsockname())
+		for i in range(2)]
+
+	try:
+		rejected = SipTcp.rejectedCount
+		t.handle_accept()
+		t.handle_accept()
+		assert_equals(SipTcp.rejectedCount, rejected + 1)
+
+		# The second connection has been closed
+		clients[1].settimeout(1)
+		assert_equals(clients[1].recv(4096), b"")
+		s = Sip()
+		assert_equals(s.stats()['tcp_rejected'], rejected + 1)
+		s.close()
+	finally:
+		g_sipconfig.update(saved)
+		for c in clients:
+			c.close()
+		t.close()
+
+def test_retransmission_replay():
+	"""Test that an exact retransmission is answered from the cache"""
+	import socket
+	from sip import Sip
+
+	s = Sip()
+	s.bind(('127.0.0.1', 0))
+	c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	c.settimeout(1)
+
+	msg = b"OPTIONS sip:foo SIP/2.0\r\nFrom: test\r\nCall-ID: 1234\r\n" + \
+		b"CSeq: 1 OPTIONS\r\n\r\n"
+	for i in range(2):
+		c.sendto(msg, s.socket.getsockname())
+		s.handle_read()
+
+	first, _ = c.recvfrom(4096)
+	second, _ = c.recvfrom(4096)
+	assert_equals(first, second)
+	assert_equals(s.stats()['retransmission_hits'], 1)
+	assert_equals(s.stats()['retransmission_misses'], 1)
+
+	c.close()
+	s.close()
+
+def test_batched_read():
+	"""Test that one read event drains and answers several datagrams"""
+	import socket
+	from sip import Sip
+
+	s = Sip()
+	s.bind(('127.0.0.1', 0))
+	c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	c.settimeout(1)
+
+	for i in range(5):
+		c.sendto("OPTIONS sip:foo SIP/2.0\r\nFrom: test\r\n"
+			"Call-ID: batch{}\r\nCSeq: 1 OPTIONS\r\n\r\n".format(i).encode(),
+			s.socket.getsockname())
+	s.handle_read()
+
+	for i in range(5):
+		data, _ = c.recvfrom(4096)
+		assert "Call-ID: batch{}".format(i).encode() in data
+	assert_equals(s.stats()['retransmission_misses'], 5)
+	assert_equals(s.writable(), False)
+
+	c.close()
+	s.close()
+
+def test_batch_survives_exception():
+	"""Test that an exception while handling one datagram does not drop
+	the rest of the batch"""
+	import socket
+	from sip import Sip
+
+	class FailingSip(Sip):
+		def sip_REGISTER(self, msg):
+			raise RuntimeError("handler failed")
+
+	s = FailingSip()
+	s.bind(('127.0.0.1', 0))
+	c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	c.settimeout(1)
+
+	c.sendto(b"REGISTER sip:foo SIP/2.0\r\nFrom: test\r\n"
+		b"Call-ID: failing\r\nCSeq: 1 REGISTER\r\n\r\n",
+		s.socket.getsockname())
+	c.sendto(b"OPTIONS sip:foo SIP/2.0\r\nFrom: test\r\n"
+		b"Call-ID: after\r\nCSeq: 1 OPTIONS\r\n\r\n",
+		s.socket.getsockname())
+	s.handle_read()
+
+	data, _ = c.recvfrom(4096)
+	assert b"Call-ID: after" in data
+
+	c.close()
+	s.close()
+
+def test_large_datagram():
+	"""Test that datagrams larger than 1024 bytes are received completely and
+	that messages above the maximum size are answered with 513"""
+	import socket
+	from sip import Sip
+
+	s = Sip()
+	s.bind(('127.0.0.1', 0))
+	c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	c.settimeout(1)
+
+	# Many Via hops push the Call-ID past the first kilobyte
+	vias = "".join("Via: SIP/2.0/UDP 10.0.0.{}:5060\r\n".format(i)
+		for i in range(100))
+	msg = "OPTIONS sip:foo SIP/2.0\r\nFrom: test\r\n" + vias + \
+		"Call-ID: large\r\nCSeq: 1 OPTIONS\r\n\r\n"
+	c.sendto(msg.encode(), s.socket.getsockname())
+	s.handle_read()
+	data, _ = c.recvfrom(4096)
+	assert data.startswith(b"SIP/2.0 200 OK")
+	assert b"Call-ID: large" in data
+
+	msg = "INVITE sip:foo SIP/2.0\r\nFrom: test\r\nCall-ID: huge\r\n" + \
+		"CSeq: 1 INVITE\r\nContent-Length: 30000\r\n\r\n" + "a" * 30000
+	c.sendto(msg.encode(), s.socket.getsockname())
+	s.handle_read()
+	data, _ = c.recvfrom(4096)
+	assert data.startswith(b"SIP/2.0 513 Message too large")
+	assert b"Call-ID: huge" in data
+
+	c.close()
+	s.close()
+
+def test_tcp_message_too_large():
+	"""Test that a TCP connection announcing a too large message is answered
+	with 513 and closed"""
+	import socket
+	from sip import SipTcpConnection
+
+	local, remote = socket.socketpair()
+	c = SipTcpConnection(local, ('127.0.0.1', 5060))
+
+	remote.sendall(b"INVITE sip:foo SIP/2.0\r\nFrom: test\r\n" + \
+		b"Call-ID: 1234\r\nCSeq: 1 INVITE\r\n" + \
+		b"Content-Length: 1000000\r\n\r\n")
+	c.handle_read()
+	assert not c.readable()
+	c.handle_write()
+
+	data = remote.recv(4096)
+	assert data.startswith(b"SIP/2.0 513 Message too large")
+	assert_equals(c.socket, None)
+
+	remote.close()
+
 def test_challenge_response():
 	"""Test the challenge response mechanism (SIP authentication)"""
-	from sip import Sip
+	from sip import Sip, g_sipconfig
 	import hashlib
+	import re
 
 	s = Sip()
 
 	def hash(s):
 		return hashlib.md5(s.encode('utf-8')).hexdigest()
 
-	def send(msg):
-		print(msg)
+	sent = []
+	s.send = sent.append
 
-	s.send = send
+	# The first INVITE is answered with a challenge
+	s.handle_message("""INVITE sip:100@localhost SIP/2.0
+		To: foo
+		From: bar
+		Via: foo
+		Call-ID: 123456
+		CSeq: 1 INVITE
+		Accept: application/sdp
+		Content-Type: application/sdp
+		""".encode(), ('127.0.0.1', 5060))
+	assert_equals(len(sent), 1)
+	assert sent[0].startswith(b"SIP/2.0 401 ")
+	nonce = re.search(rb'nonce="([0-9a-f]+)"', sent[0]).group(1).decode()
 
-	nonce = hash("deadbeef")
-	a1 = hash("{}:{}:{}".format(100, "100@localhost", 1234))
+	secret = g_sipconfig['secret']
+	a1 = hash("{}:{}:{}".format(100, "100@localhost", secret))
 	a2 = hash("INVITE:sip:100@localhost")
 	clientResponse = hash("{}:{}:{}".format(a1, nonce, a2))
 
-	headers = {
-		"to": "foo",
-		"from": "bar",
-		"via": "foo",
-		"call-id": "123456",
-		"cseq": "1 INVITE",
-		"authorization": """Digest username="100",
-			realm="100@localhost",
-			nonce="deadbeef",
-			uri="sip:100@localhost",
-			response="{response}"
-			""".format(response=clientResponse)
-	}
-
-	expected, response = s._Sip__challengeINVITE(headers)
+	msg = SipMessage("""INVITE sip:100@localhost SIP/2.0
+		To: foo
+		From: bar
+		Via: foo
+		Call-ID: 123456
+		CSeq: 2 INVITE
+		Authorization: Digest username="100", realm="100@localhost", nonce="{nonce}", uri="sip:100@localhost", response="{response}"
+		""".format(nonce=nonce, response=clientResponse))
+
+	expected, response = s._Sip__challengeINVITE(msg)
 
 	# Did the VoIP server receive the same response that we calculated?
 	assert_equals(response, clientResponse)
@@ -20,12 +20,15 @@
 #
 ################################################################################
 
+import time
 import socket
 import logging
 
 from nose.tools import assert_equals, raises, timed
 
-from sip import SipSession, RtpUdpStream, logger
+import connection
+from sip import SipSession, SipMessage, RtpUdpStream, logger, g_sipconfig
+from timerwheel import TimerWheel
 
 # Set logger to _not_ print debug and info messages
 logger.setLevel(logging.ERROR)
@@ -34,6 +37,9 @@ class SipMock(object):
 	def send(self, s):
 		pass
 
+INVITE = SipMessage(b"INVITE sip:100@localhost SIP/2.0\nFrom: foo\nCall-ID: 123\n" +
+	b"CSeq: 1 INVITE\n")
+
 class TestSipSession(object):
 	@classmethod
 	def setUpClass(self):
@@ -55,20 +61,104 @@ class TestSipSession(object):
 	def test_handle_empty_ACK(self):
 		"""Handling of SipSession and RtpUdpStream handling an empty ACK
 		packet (empty apart from Call-ID)"""
-		s = SipSession(('localhost', 1112), 123, 29999)
-		s.handle_ACK([], "")
+		s = SipSession(('localhost', 1112), 29999, INVITE)
+		s.handle_ACK(SipMessage(b"ACK sip:100@localhost SIP/2.0\nCall-ID: 123"))
 
 		# Close RTP stream so that the socket doesn't stay open after this test
 		s._SipSession__rtpStream.close()
 
+	def test_compact_session(self):
+		"""Test that a session keeps no per-instance dictionary and echoes the
+		CSeq of the requests"""
+		class SendMock(object):
+			def __init__(self):
+				self.sent = []
+			def send(self, s):
+				self.sent.append(s)
+
+		sipConnection = SendMock()
+		s = SipSession(('localhost', 1112), 29999, INVITE, sipConnection)
+		assert not hasattr(s, '__dict__')
+		assert_equals(s.callId, "123")
+		assert b"CSeq: 1 INVITE" in sipConnection.sent[0]
+
+		s.handle_BYE(SipMessage(
+			b"BYE sip:100@localhost SIP/2.0\nCall-ID: 123\nCSeq: 2 BYE"))
+		assert b"CSeq: 2 BYE" in sipConnection.sent[-1]
+		s.close()
+
 	def test_handle_BYE_without_session(self):
 		"""Handling of SipSession and RtpUdpStream handling on BYE message
 		without an established session"""
-		s = SipSession(('localhost', 1112), 123, 29999)
-		s.handle_BYE([], "")
+		s = SipSession(('localhost', 1112), 29999, INVITE)
+		s.handle_BYE(SipMessage(
+			b"BYE sip:100@localhost SIP/2.0\nCall-ID: 123\nCSeq: 2 BYE"))
 
 		"""
 		data, conInfo = self.__recvSocket.recvfrom(1024)
 		assert_equals(conInfo[1], 1111)
 		assert_equals(data.decode('utf-8'), "SIP/2.0 200 OK")
 		"""
+
+class TestSessionExpiry(object):
+	def setup_method(self, method):
+		# Timer wheel driven by a fake clock instead of the event loop
+		self.now = time.monotonic()
+		self.savedWheel = connection.g_timerWheel
+		connection.g_timerWheel = TimerWheel(clock=lambda: self.now)
+		SipSession.sipConnection = SipMock()
+		self.closed = []
+
+	def teardown_method(self, method):
+		connection.g_timerWheel = self.savedWheel
+
+	def advance(self, seconds):
+		self.now += seconds
+		connection.g_timerWheel.advance()
+
+	def test_setup_timeout(self):
+		"""Test that a session without ACK is closed after the setup timeout"""
+		expired = SipSession.expiredCount
+		s = SipSession(('localhost', 1112), 29999, INVITE,
+			onClose=self.closed.append)
+
+		self.advance(g_sipconfig['session_setup_timeout'] - 2)
+		assert_equals(self.closed, [])
+		self.advance(3)
+		assert_equals(self.closed, [s])
+		assert_equals(s.state, SipSession.NO_SESSION)
+		assert s._SipSession__rtpStream.closed
+		assert_equals(SipSession.expiredCount, expired + 1)
+
+	def test_rtp_inactivity(self):
+		"""Test that RTP traffic keeps an active session alive"""
+		s = SipSession(('localhost', 1112), 29999, INVITE,
+			onClose=self.closed.append)
+		s.handle_ACK(SipMessage(b"ACK sip:100@localhost SIP/2.0\nCall-ID: 123"))
+		timeout = g_sipconfig['session_rtp_timeout']
+
+		# Simulate an RTP packet shortly before the timeout
+		self.advance(timeout - 5)
+		s._SipSession__rtpStream.lastActivity = time.monotonic()
+		self.advance(10)
+		assert_equals(self.closed, [])
+
+		# The stream is idle from now on
+		s._SipSession__rtpStream.lastActivity = time.monotonic() - timeout
+		self.advance(timeout)
+		assert_equals(self.closed, [s])
+
+	def test_teardown(self):
+		"""Test that a session is removed after the teardown timeout following
+		a BYE"""
+		expired = SipSession.expiredCount
+		s = SipSession(('localhost', 1112), 29999, INVITE,
+			onClose=self.closed.append)
+		s.handle_BYE(SipMessage(
+			b"BYE sip:100@localhost SIP/2.0\nCall-ID: 123\nCSeq: 2 BYE"))
+		assert_equals(s.state, SipSession.SESSION_TEARDOWN)
+		assert s._SipSession__rtpStream.closed
+
+		self.advance(g_sipconfig['session_teardown_timeout'] + 1)
+		assert_equals(self.closed, [s])
+		assert_equals(SipSession.expiredCount, expired)
@@ -0,0 +1,88 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+from nose.tools import assert_equals
+
+from timerwheel import TimerWheel
+
+class Clock(object):
+	def __init__(self):
+		self.now = 0.0
+
+	def __call__(self):
+		return self.now
+
+class TestTimerWheel(object):
+	def setup_method(self, method):
+		self.clock = Clock()
+		self.wheel = TimerWheel(1.0, slots=4, levels=3, clock=self.clock)
+		self.fired = []
+
+	def advanceTo(self, now):
+		self.clock.now = now
+		return self.wheel.advance()
+
+	def test_fire(self):
+		"""Test that a timer fires in the tick of its expiry"""
+		self.wheel.schedule(2.5, self.fired.append, 'a')
+		assert_equals(len(self.wheel), 1)
+
+		self.advanceTo(2.9)
+		assert_equals(self.fired, [])
+		assert_equals(self.advanceTo(3.0), 1)
+		assert_equals(self.fired, ['a'])
+		assert_equals(len(self.wheel), 0)
+
+	def test_cascade(self):
+		"""Test timers in the upper levels and beyond the range of the wheel
+		(4**3 ticks)"""
+		for delay in (3, 5, 17, 40, 100, 200):
+			self.wheel.schedule(delay, self.fired.append, delay)
+
+		for now in range(1, 201):
+			self.advanceTo(now)
+			assert_equals(self.fired[-1:] == [now], now in (3, 5, 17, 40, 100,
+				200))
+		assert_equals(self.fired, [3, 5, 17, 40, 100, 200])
+
+	def test_cancel(self):
+		t = self.wheel.schedule(10, self.fired.append, 'a')
+		assert t.active
+		self.wheel.cancel(t)
+		assert not t.active
+		self.wheel.cancel(t)
+
+		assert_equals(len(self.wheel), 0)
+		self.advanceTo(20)
+		assert_equals(self.fired, [])
+
+	def test_reschedule_in_callback(self):
+		"""Test that a callback can schedule a new timer"""
+		def callback():
+			self.fired.append(self.clock.now)
+			if len(self.fired) < 3:
+				self.wheel.schedule(5, callback)
+
+		self.wheel.schedule(5, callback)
+		for now in range(1, 30):
+			self.advanceTo(now)
+		assert_equals(self.fired, [5, 10, 15])
@@ -0,0 +1,114 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import os
+import wave
+import shutil
+import tempfile
+
+import numpy as np
+from nose.tools import assert_equals
+
+import g711
+import wavexport
+from dumpwriter import DumpWriter
+from pcapdump import PcapStreamDump, INBOUND, OUTBOUND
+from rtpstats import RTP_HEADER
+
+def tone(n):
+	"""n samples of a 400 Hz tone"""
+	return (np.sin(np.arange(n) * 2 * np.pi * 400 / 8000) * 8000).astype(
+		np.int16)
+
+class TestWavExport(object):
+	def setup_method(self, method):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, "stream_1.pcap")
+		self.audio = tone(160 * 20)
+		codes = g711.encode(self.audio).tobytes()
+
+		# 20 PCMU packets, packet 3 is lost and 7 and 8 are swapped, and the
+		# timestamp wraps around. Two PCMA packets of different sizes, the
+		# first with padding and a CSRC.
+		w = DumpWriter(self.directory, flushInterval=0.01)
+		d = PcapStreamDump(w, "stream_1.pcap", ('127.0.0.1', 30000))
+		order = [i for i in range(20) if i != 3]
+		order[6], order[7] = order[7], order[6]
+		for n, i in enumerate(order):
+			packet = RTP_HEADER.pack(0x80, 0, i, (0xffffff00 + i * 160) &
+				0xffffffff, 0x1234) + codes[i * 160:(i + 1) * 160]
+			d.write(packet, INBOUND, ('10.0.0.1', 5004),
+				timestamp=1000 + n * 0.02)
+			d.write(packet, OUTBOUND, ('10.0.0.1', 5004),
+				timestamp=1000 + n * 0.02)
+
+		alaw = g711.encode(self.audio[:160], g711.PCMA).tobytes()
+		d.write(RTP_HEADER.pack(0xa1, 8, 0, 0, 0x5678) + b"csrc" + alaw +
+			b"\0\0\3", INBOUND, ('10.0.0.1', 5004), timestamp=1001)
+		d.write(RTP_HEADER.pack(0x80, 8, 1, 160, 0x5678) + alaw[:80], INBOUND,
+			('10.0.0.1', 5004), timestamp=1001.02)
+		d.close()
+		w.close()
+
+	def teardown_method(self, method):
+		shutil.rmtree(self.directory)
+
+	def test_stream_audio(self):
+		"""Test that payloads are decoded and placed by their timestamps"""
+		audio = wavexport.streamAudio(self.path)
+		assert_equals(sorted(audio), [0x1234, 0x5678])
+
+		expected = g711.decode(g711.encode(self.audio))
+		expected[3 * 160:4 * 160] = 0
+		assert (audio[0x1234] == expected).all()
+
+		expected = g711.decode(g711.encode(self.audio[:160], g711.PCMA),
+			g711.PCMA)
+		expected = np.concatenate((expected, expected[:80]))
+		assert (audio[0x5678] == expected).all()
+
+	def test_export(self):
+		"""Test writing WAV files for a directory of dumps"""
+		output = os.path.join(self.directory, "wav")
+		os.mkdir(output)
+		paths = wavexport.exportDirectory(self.directory, output, processes=2)
+		assert_equals([os.path.basename(p) for p in paths],
+			["stream_1_00001234.wav", "stream_1_00005678.wav"])
+
+		with wave.open(paths[0], "rb") as f:
+			assert_equals((f.getnchannels(), f.getsampwidth(),
+				f.getframerate(), f.getnframes()), (1, 2, 8000, 3200))
+
+	def test_truncated_dump(self):
+		"""Test that packets whose record is cut off are skipped, and that a
+		broken dump does not abort the export of the others"""
+		os.truncate(self.path, os.path.getsize(self.path) - 20)
+		audio = wavexport.streamAudio(self.path)
+		assert_equals(len(audio[0x5678]), 160)
+
+		broken = os.path.join(self.directory, "stream_2.pcap")
+		with open(broken, "wb") as f:
+			f.write(b"\0" * 64)
+		shutil.copy(self.path + ".idx", broken + ".idx")
+		paths = wavexport.exportDirectory(self.directory, processes=1)
+		assert_equals([os.path.basename(p) for p in paths],
+			["stream_1_00001234.wav", "stream_1_00005678.wav"])
@@ -0,0 +1,115 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import os
+import socket
+import tempfile
+
+from nose.tools import assert_equals
+
+import workers
+from sip import Sip
+from sessiontable import SessionTable
+
+def ownedCallId(index, count):
+	"""A Call-ID owned by the given worker"""
+	i = 0
+	while workers.callIdOwner("call{}".format(i).encode(), count) != index:
+		i += 1
+	return "call{}".format(i)
+
+def test_forward_encoding():
+	"""Test that a forwarded datagram keeps its remote address"""
+	packet = workers.encodeForwarded(b"BYE sip:foo SIP/2.0",
+		('10.0.0.1', 5062))
+	data, conInfo = workers.decodeForwarded(memoryview(packet))
+	assert_equals(bytes(data), b"BYE sip:foo SIP/2.0")
+	assert_equals(conInfo, ('10.0.0.1', 5062))
+
+def test_merge_stats():
+	assert_equals(workers.mergeStats([{'a': 1, 'b': 2}, {'a': 3}, {}]),
+		{'a': 4, 'b': 2})
+	assert_equals(workers.mergeStats([{'playback_max_lateness': 0.002},
+		{'playback_max_lateness': 0.001}]), {'playback_max_lateness': 0.002})
+
+def test_router_owner():
+	"""Test that only dialog messages are routed by their Call-ID"""
+	directory = tempfile.mkdtemp()
+	r = workers.CallIdRouter(0, 4, directory)
+
+	callId = ownedCallId(3, 4)
+	assert_equals(r.owner("BYE sip:foo SIP/2.0\r\nCall-ID: {}\r\n\r\n".format(
+		callId).encode()), 3)
+	assert_equals(r.owner("ACK sip:foo SIP/2.0\r\ni: {}\r\n\r\n".format(
+		callId).encode()), 3)
+	assert_equals(r.owner("OPTIONS sip:foo SIP/2.0\r\nCall-ID: {}\r\n"
+		"\r\n".format(callId).encode()), None)
+	assert_equals(r.owner(b"BYE sip:foo SIP/2.0\r\n\r\n"), None)
+
+	r.close()
+	os.rmdir(directory)
+
+def test_forward_to_owner():
+	"""Test that a BYE received by another worker reaches the worker owning
+	the session"""
+	class Session(object):
+		def __init__(self):
+			self.byes = 0
+			self.remoteAddress = '127.0.0.1'
+		def handle_BYE(self, msg):
+			self.byes += 1
+
+	directory = tempfile.mkdtemp()
+	callId = ownedCallId(1, 2)
+	session = Session()
+
+	sessions = SessionTable()
+	sessions[callId] = session
+	owner = Sip(sessions=sessions)
+	owner.bind(('127.0.0.1', 0))
+	owner.router = workers.CallIdRouter(1, 2, directory)
+	f = workers.ForwardedDatagrams(owner, workers.workerSocketPath(directory, 1))
+
+	other = Sip()
+	other.bind(('127.0.0.1', 0))
+	other.router = workers.CallIdRouter(0, 2, directory)
+
+	c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	c.bind(('127.0.0.1', 0))
+	c.sendto("BYE sip:100@localhost SIP/2.0\r\nTo: foo\r\nFrom: bar\r\n"
+		"Call-ID: {}\r\nCSeq: 2 BYE\r\nContact: bar\r\n\r\n".format(
+		callId).encode(), other.socket.getsockname())
+
+	other.handle_read()
+	f.handle_read()
+
+	assert_equals(other.router.forwarded, 1)
+	assert_equals(f.received, 1)
+	assert_equals(session.byes, 1)
+
+	for s in (f, owner, other):
+		s.close()
+	owner.router.close()
+	other.router.close()
+	c.close()
+	os.unlink(workers.workerSocketPath(directory, 1))
+	os.rmdir(directory)
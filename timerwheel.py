@@ -0,0 +1,157 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import time
+import logqueue
+
+# Logging
+logger = logqueue.getLogger("timerwheel")
+
+class Timer(object):
+	"""Timer scheduled with TimerWheel.schedule, can be cancelled with
+	TimerWheel.cancel"""
+	__slots__ = ("expires", "callback", "args", "slot")
+
+	def __init__(self, expires, callback, args):
+		# Tick at which the timer fires
+		self.expires = expires
+		self.callback = callback
+		self.args = args
+
+		# Slot (set) of the wheel the timer is currently stored in
+		self.slot = None
+
+	@property
+	def active(self):
+		return self.slot is not None
+
+class TimerWheel(object):
+	"""Hierarchical timer wheel (Varghese and Lauck): level 0 has one slot per
+	tick, each slot of level i spans slots**i ticks. A timer is stored in the
+	lowest level that covers its expiry and is moved down a level whenever the
+	wheel below wraps around (cascading). Scheduling and cancelling are O(1),
+	a timer is cascaded at most levels-1 times.
+
+	The wheel does not run by itself, advance() has to be called regularly
+	(see connection.getTimerWheel)."""
+	def __init__(self, interval=1.0, slots=64, levels=4, clock=time.monotonic):
+		self.interval = interval
+		self.__slots = slots
+		self.__levels = [[set() for i in range(slots)]
+			for j in range(levels)]
+
+		# Ticks covered by one slot of each level, and by the whole wheel
+		self.__spans = [slots ** i for i in range(levels + 1)]
+
+		self.__clock = clock
+		self.__start = clock()
+		self.__tick = 0
+		self.__count = 0
+
+	def __len__(self):
+		"""Number of scheduled timers"""
+		return self.__count
+
+	def __insert(self, timer):
+		# A timer cascaded down in its expiry tick goes to the level 0 slot
+		# that is processed right after cascading
+		delta = max(timer.expires - self.__tick, 0)
+		expires = self.__tick + delta
+
+		spans = self.__spans
+		level = 0
+		while level < len(self.__levels) - 1 and delta >= spans[level + 1]:
+			level += 1
+		if delta >= spans[level + 1]:
+			# Beyond the range of the wheel: park in the farthest slot of the
+			# top level, the timer is cascaded from there again
+			expires = self.__tick + spans[level + 1] - 1
+
+		slot = self.__levels[level][(expires // spans[level]) % self.__slots]
+		slot.add(timer)
+		timer.slot = slot
+
+	def schedule(self, delay, callback, *args):
+		"""Calls callback(*args) after delay seconds (rounded up to the next
+		tick), returns the Timer"""
+		ticks = -(-(self.__clock() - self.__start + delay) // self.interval)
+		timer = Timer(max(int(ticks), self.__tick + 1), callback, args)
+		self.__insert(timer)
+		self.__count += 1
+		return timer
+
+	def cancel(self, timer):
+		"""Cancels a timer, does nothing if it has fired or been cancelled"""
+		if timer.slot is None:
+			return
+
+		timer.slot.discard(timer)
+		timer.slot = None
+		self.__count -= 1
+
+	def advance(self, now=None):
+		"""Fires all timers that expired up to now, returns their number"""
+		if now is None:
+			now = self.__clock()
+		target = int((now - self.__start) // self.interval)
+
+		# Nothing to fire: skip the ticks in between
+		if self.__count == 0:
+			self.__tick = max(self.__tick, target)
+			return 0
+
+		fired = 0
+		slots = self.__slots
+		spans = self.__spans
+		levels = self.__levels
+		while self.__tick < target:
+			self.__tick += 1
+			tick = self.__tick
+
+			# Move the timers of the upper levels down when the level below
+			# wraps around, starting at the highest level that does
+			level = 1
+			while level < len(levels) and tick % spans[level] == 0:
+				level += 1
+			for level in range(level - 1, 0, -1):
+				index = (tick // spans[level]) % slots
+				timers = levels[level][index]
+				levels[level][index] = set()
+				for timer in timers:
+					self.__insert(timer)
+
+			index = tick % slots
+			timers = levels[0][index]
+			if not timers:
+				continue
+			levels[0][index] = set()
+
+			for timer in timers:
+				timer.slot = None
+				self.__count -= 1
+				fired += 1
+				try:
+					timer.callback(*timer.args)
+				except Exception:
+					logger.exception("Unhandled exception in timer callback")
+
+		return fired
@@ -0,0 +1,163 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+#
+# Export of the G.711 audio in stream dumps (see pcapdump) to 16 bit mono WAV
+# files, one per SSRC. Each payload is placed by its RTP timestamp, so lost
+# packets become silence and reordered packets end up in the right place.
+# exportDirectory() converts all dumps of a directory with a process pool.
+#
+################################################################################
+
+import os
+import sys
+import glob
+import wave
+import multiprocessing
+
+import numpy as np
+
+import g711
+import rtpanalysis
+from pcapdump import INBOUND
+from rtpstats import RTP_HEADER
+
+# Longest audio written per SSRC, the RTP timestamps are chosen by the sender
+# and could otherwise make up hours of silence
+MAX_DURATION = 3600
+MAX_SAMPLES = MAX_DURATION * g711.SAMPLE_RATE
+
+# μ-law decoding table followed by the A-law one
+DECODE_TABLE = np.concatenate((g711.ULAW_DECODE, g711.ALAW_DECODE))
+
+def streamAudio(path, direction=INBOUND):
+	"""Decoded audio (int16 array) of every SSRC with G.711 payloads in the
+	dump at path, as {ssrc: samples}"""
+	headers, _ = rtpanalysis.loadHeaders(path, direction)
+	headers = headers[(headers["payloadType"] == g711.PCMU) |
+		(headers["payloadType"] == g711.PCMA)]
+	if len(headers) == 0:
+		return {}
+	data = np.memmap(path, dtype=np.uint8, mode="r")
+
+	# Payload position after the CSRCs and the header extension, without
+	# padding
+	offset = headers["offset"].astype(np.int64)
+	end = offset + headers["length"]
+	start = offset + RTP_HEADER.size + 4 * (headers["vpxcc"] & 0x0f)
+	extension = (headers["vpxcc"] & 0x10) != 0
+	extension &= start + 4 <= end
+	words = data[start[extension] + 2].astype(np.int64) << 8 | \
+		data[start[extension] + 3]
+	start[extension] += 4 + 4 * words
+	padding = (headers["vpxcc"] & 0x20) != 0
+	end[padding] -= data[end[padding] - 1]
+	length = np.maximum(end - start, 0)
+
+	audio = {}
+	for ssrc in np.unique(headers["ssrc"]).tolist():
+		mine = headers["ssrc"] == ssrc
+
+		# Extended timestamps relative to the earliest one are the sample
+		# positions of the payloads
+		delta = np.zeros(np.count_nonzero(mine), dtype=np.int64)
+		delta[1:] = rtpanalysis.signed(np.diff(
+			headers["timestamp"][mine].astype(np.int64)), 32)
+		position = np.cumsum(delta)
+		position -= position.min()
+
+		n = length[mine]
+		keep = position + n <= MAX_SAMPLES
+		n, position = n[keep], position[keep]
+		first, types = start[mine][keep], headers["payloadType"][mine][keep]
+		total = int(n.sum())
+		if total == 0:
+			continue
+
+		# Codes of all payloads, offset by 256 for A-law so that one table
+		# decodes both. Payloads of equal size (the usual case) are gathered
+		# as rows of a 2d array.
+		alaw = (types == g711.PCMA) * 256
+		samples = np.zeros(int((position + n).max()), dtype=np.int16)
+		if (n == n[0]).all():
+			step = np.arange(n[0])
+			codes = data[first[:, None] + step] + alaw[:, None]
+			samples[position[:, None] + step] = DECODE_TABLE[codes]
+		else:
+			step = np.arange(total) - np.repeat(np.cumsum(n) - n, n)
+			codes = data[np.repeat(first, n) + step] + np.repeat(alaw, n)
+			samples[np.repeat(position, n) + step] = DECODE_TABLE[codes]
+		audio[ssrc] = samples
+	return audio
+
+def writeWav(path, samples):
+	"""Writes 16 bit mono samples at 8000 Hz to a WAV file"""
+	with wave.open(path, "wb") as f:
+		f.setnchannels(1)
+		f.setsampwidth(2)
+		f.setframerate(g711.SAMPLE_RATE)
+		f.writeframes(samples.astype("<i2").tobytes())
+
+def exportWav(path, directory=None, direction=INBOUND):
+	"""Writes the audio of every SSRC in the dump at path to
+	<dump>_<ssrc>.wav (next to the dump by default), returns the paths of the
+	WAV files"""
+	base = os.path.splitext(os.path.basename(path))[0]
+	if directory is None:
+		directory = os.path.dirname(path)
+
+	written = []
+	for ssrc, samples in sorted(streamAudio(path, direction).items()):
+		wavPath = os.path.join(directory, "{}_{:08x}.wav".format(base, ssrc))
+		writeWav(wavPath, samples)
+		written.append(wavPath)
+	return written
+
+def _export(job):
+	"""Pool worker: exports one dump, dumps that can't be read are skipped
+	so that one broken dump does not abort the whole directory"""
+	path, directory, direction = job
+	try:
+		return exportWav(path, directory, direction)
+	except Exception as e:
+		sys.stderr.write("Skipping {}: {}\n".format(path, e))
+		return []
+
+def exportDirectory(directory, outputDirectory=None, processes=None,
+		pattern="stream_*.pcap", direction=INBOUND):
+	"""Exports all dumps of directory that have an index with a pool of
+	processes (one per core by default), returns the paths of the WAV
+	files"""
+	jobs = [(path, outputDirectory, direction) for path in
+		sorted(glob.glob(os.path.join(directory, pattern)))
+		if os.path.exists(path + ".idx")]
+	if processes == 1:
+		results = map(_export, jobs)
+	else:
+		with multiprocessing.Pool(processes) as pool:
+			results = pool.map(_export, jobs, chunksize=1)
+	return [path for paths in results for path in paths]
+
+if __name__ == '__main__':
+	directory = sys.argv[1] if len(sys.argv) > 1 else "."
+	output = sys.argv[2] if len(sys.argv) > 2 else None
+	for path in exportDirectory(directory, output):
+		print(path)
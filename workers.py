@@ -0,0 +1,418 @@
+################################################################################
+#
+# Stand-alone VoIP honeypot client (preparation for Dionaea integration)
+# Copyright (c) 2010 Tobias Wulff (twu200 at gmail)
+#
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+# 
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+# 
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+################################################################################
+
+import os
+import re
+import json
+import time
+import zlib
+import select
+import signal
+import socket
+import struct
+import shutil
+import logqueue
+import tempfile
+
+import connection
+import dumpwriter
+import eventstore
+import media
+import metrics
+import playback
+import sip
+from config import g_config
+
+# Logging
+logger = logqueue.getLogger("workers")
+
+g_sipconfig = g_config['modules']['python']['sip']
+
+# Only messages that belong to a dialog are routed to the worker owning the
+# Call-ID, stateless requests (OPTIONS, REGISTER) are answered by any worker
+DIALOG_METHODS = (b"INVITE", b"ACK", b"BYE", b"CANCEL", b"SIP/2.0")
+
+# Call-ID header (long or compact form) at the start of a line
+CALL_ID = re.compile(rb"^(?:call-id|i)[ \t]*:[ \t]*([^\s]+)",
+	re.MULTILINE | re.IGNORECASE)
+
+# Header of a forwarded datagram: remote port, length of the remote address,
+# followed by the address (ASCII) and the datagram itself
+FORWARD_HEADER = struct.Struct("!HB")
+
+# Minimum time between two starts of the same worker
+RESTART_DELAY = 1.0
+
+# Stats that describe the current state of a worker instead of counting
+# events, they are dropped when the worker exits
+GAUGES = frozenset(('sessions', 'playback_streams', 'credentials_accounts',
+	'bruteforce_blocked_sources', 'rtp_ports_used', 'rtp_ports_free',
+	'tcp_connections'))
+
+# Stats that are merged by taking the largest value instead of the sum
+MAXIMA = frozenset(('playback_max_lateness', 'credentials_accounts'))
+
+def callIdOwner(callId, workers):
+	"""Index of the worker owning the dialog with the given Call-ID (bytes).
+	crc32 is used because hash() of bytes differs between processes."""
+	return zlib.crc32(callId) % workers
+
+def workerSocketPath(directory, index):
+	"""Path of the unix socket on which a worker receives forwarded
+	datagrams"""
+	return os.path.join(directory, "worker{}.sock".format(index))
+
+def workerMetricsAddress(address, index):
+	"""Scrape endpoint of a worker: the port of metrics_address plus the
+	worker index, or its Unix socket path with the index appended"""
+	if address.startswith("/"):
+		return "{}.{}".format(address, index)
+	host, _, port = address.rpartition(":")
+	return "{}:{}".format(host, int(port) + index)
+
+def encodeForwarded(data, conInfo):
+	address = conInfo[0].encode('ascii')
+	return FORWARD_HEADER.pack(conInfo[1], len(address)) + address + data
+
+def decodeForwarded(packet):
+	"""Returns (datagram, conInfo) of a packet built by encodeForwarded"""
+	port, length = FORWARD_HEADER.unpack_from(packet)
+	start = FORWARD_HEADER.size
+	address = bytes(packet[start:start+length]).decode('ascii')
+	return packet[start+length:], (address, port)
+
+def mergeStats(statsList):
+	"""Sums up the counters of several stats dictionaries"""
+	merged = {}
+	for stats in statsList:
+		for k, v in stats.items():
+			if k in MAXIMA:
+				merged[k] = max(merged.get(k, 0), v)
+			else:
+				merged[k] = merged.get(k, 0) + v
+	return merged
+
+class CallIdRouter(object):
+	"""Decides which worker owns the dialog of a datagram and forwards it
+	there if it is not the local one (used as Sip.router)"""
+	def __init__(self, index, workers, directory):
+		self.index = index
+		self.workers = workers
+		self.directory = directory
+
+		self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+		self.__socket.setblocking(False)
+		self.__paths = [workerSocketPath(directory, i)
+			for i in range(workers)]
+
+		self.forwarded = 0
+		self.dropped = 0
+
+	def owner(self, data):
+		"""Index of the worker owning the datagram, None if any worker can
+		handle it"""
+		if not bytes(data[:7]).startswith(DIALOG_METHODS):
+			return None
+
+		match = CALL_ID.search(data)
+		if match is None:
+			return None
+
+		return callIdOwner(match.group(1), self.workers)
+
+	def forward(self, data, conInfo):
+		"""Forwards the datagram to its owner, returns False if it has to be
+		handled locally"""
+		owner = self.owner(data)
+		if owner is None or owner == self.index:
+			return False
+
+		try:
+			self.__socket.sendto(encodeForwarded(data, conInfo),
+				self.__paths[owner])
+		except OSError as e:
+			# Owner is being restarted or its queue is full: the datagram is
+			# lost, as it could be on the network
+			logger.debug("Could not forward to worker %s: %s", owner, e)
+			self.dropped += 1
+		else:
+			self.forwarded += 1
+		return True
+
+	def stats(self):
+		return {'forwarded': self.forwarded, 'forward_dropped': self.dropped}
+
+	def close(self):
+		self.__socket.close()
+
+class ForwardedDatagrams(connection.connection):
+	"""Unix datagram socket on which a worker receives the datagrams other
+	workers have forwarded to it, they are handled by its Sip connection as if
+	they were received from the original remote host"""
+	def __init__(self, sipConnection, path):
+		if os.path.exists(path):
+			os.unlink(path)
+
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+		sock.bind(path)
+		connection.connection.__init__(self, sock=sock)
+
+		self.__sip = sipConnection
+		self.__buffer = bytearray(sip.MAX_DATAGRAM_SIZE +
+			FORWARD_HEADER.size + 255)
+		self.received = 0
+
+	def handle_read(self):
+		for i in range(g_sipconfig['recv_batch_size']):
+			try:
+				nbytes = self.socket.recv_into(self.__buffer)
+			except (BlockingIOError, InterruptedError):
+				break
+
+			self.received += 1
+			data, conInfo = decodeForwarded(memoryview(self.__buffer)[:nbytes])
+			self.__sip.handle_datagram(data, conInfo)
+
+def runWorker(index, workers, directory, address, statsSocket):
+	"""Main function of a worker process: binds the SIP port with
+	SO_REUSEPORT, receives forwarded datagrams of the dialogs it owns and
+	reports its stats to the supervisor"""
+	# Each worker binds its own part of the RTP port range
+	ports = g_sipconfig['rtp_port_count'] // workers
+	media.setMediaManager(media.MediaManager(g_sipconfig['rtp_ip'],
+		g_sipconfig['rtp_port_start'] + index * ports, ports))
+
+	sessions = sip.newSessionTable()
+	s = sip.Sip(sessions=sessions)
+	s.set_reuse_port()
+	s.bind(address)
+	s.router = CallIdRouter(index, workers, directory)
+
+	t = sip.SipTcp(sessions)
+	t.set_reuse_port()
+	t.bind(address)
+	t.listen(128)
+
+	f = ForwardedDatagrams(s, workerSocketPath(directory, index))
+	scheduler = playback.getPlaybackScheduler()
+
+	def workerStats():
+		stats = s.stats()
+		stats.update(s.router.stats())
+		stats['forward_received'] = f.received
+		return stats
+
+	# Every worker serves its own metrics (the supervisor has no event loop)
+	metrics.getRegistry().collect("stats", workerStats,
+		gauges=GAUGES | MAXIMA)
+	metricsServer = None
+	if g_sipconfig['metrics_address']:
+		metricsServer = metrics.serve(workerMetricsAddress(
+			g_sipconfig['metrics_address'], index))
+
+	loop = connection.getLoop()
+	interval = g_sipconfig['worker_stats_interval']
+
+	# Stop the loop on SIGTERM so that buffered dumps are written
+	loop.add_signal_handler(signal.SIGTERM, connection.stop)
+
+	def report():
+		try:
+			statsSocket.send(json.dumps(workerStats()).encode('utf-8'))
+		except OSError:
+			pass
+		loop.call_later(interval, report)
+
+	loop.call_later(interval, report)
+
+	logger.info("Worker %s (pid %s) listening on %s:%s", index,
+		os.getpid(), address[0], address[1])
+	try:
+		connection.loop()
+	finally:
+		if metricsServer is not None:
+			metricsServer.close()
+		s.router.close()
+		f.close()
+		t.close()
+		s.close()
+		if scheduler is not None:
+			scheduler.close()
+		media.getMediaManager().close()
+		dumpwriter.getDumpWriter().close()
+		if eventstore.g_eventStore is not None:
+			eventstore.g_eventStore.close()
+
+class Supervisor(object):
+	"""Forks the worker processes, restarts workers that exited and merges
+	the stats they report"""
+	def __init__(self, workers, address):
+		self.workers = workers
+		self.address = address
+		self.directory = None
+
+		# Per worker index: pid, socket for stats reports, start time
+		self.__pids = [None] * workers
+		self.__statsSockets = [None] * workers
+		self.__started = [0] * workers
+
+		# Last stats reported by each running worker, and the counters of
+		# workers that have exited
+		self.__stats = [{} for i in range(workers)]
+		self.__retiredStats = {}
+
+		self.restarts = 0
+		self.__stopping = False
+
+	def start(self):
+		self.directory = tempfile.mkdtemp(prefix="voip-hpc-")
+		for i in range(self.workers):
+			self.__spawn(i)
+
+	def __spawn(self, index):
+		parentSocket, childSocket = socket.socketpair(socket.AF_UNIX,
+			socket.SOCK_DGRAM)
+
+		pid = os.fork()
+		if pid == 0:
+			# Worker: the supervisor's sockets are of no use here
+			parentSocket.close()
+			for sock in self.__statsSockets:
+				if sock is not None:
+					sock.close()
+
+			signal.signal(signal.SIGTERM, signal.SIG_DFL)
+			code = 0
+			try:
+				runWorker(index, self.workers, self.directory, self.address,
+					childSocket)
+			except KeyboardInterrupt:
+				pass
+			except Exception:
+				logger.exception("Worker %s crashed", index)
+				code = 1
+			os._exit(code)
+
+		childSocket.close()
+		parentSocket.setblocking(False)
+		self.__pids[index] = pid
+		self.__statsSockets[index] = parentSocket
+		self.__started[index] = time.monotonic()
+		logger.info("Started worker %s (pid %s)", index, pid)
+
+	def stats(self):
+		"""Merged stats of all workers (including those that have exited)"""
+		return mergeStats([self.__retiredStats] + self.__stats)
+
+	def __readStats(self, index):
+		sock = self.__statsSockets[index]
+		while True:
+			try:
+				data = sock.recv(65536)
+			except (BlockingIOError, InterruptedError):
+				return
+			try:
+				self.__stats[index] = json.loads(data.decode('utf-8'))
+			except ValueError:
+				logger.error("Invalid stats from worker %s", index)
+
+	def __reap(self):
+		"""Collects exited workers, returns their indices"""
+		exited = []
+		while True:
+			try:
+				pid, status = os.waitpid(-1, os.WNOHANG)
+			except ChildProcessError:
+				break
+			if pid == 0:
+				break
+			if pid not in self.__pids:
+				continue
+
+			index = self.__pids.index(pid)
+			logger.error("Worker %s (pid %s) exited with status %s",
+				index, pid, status)
+
+			self.__readStats(index)
+			counters = dict((k, v) for k, v in self.__stats[index].items()
+				if k not in GAUGES)
+			self.__retiredStats = mergeStats([self.__retiredStats, counters])
+			self.__stats[index] = {}
+			self.__statsSockets[index].close()
+			self.__statsSockets[index] = None
+			self.__pids[index] = None
+			exited.append(index)
+		return exited
+
+	def run(self):
+		"""Supervises the workers until stop() is called or the process is
+		interrupted"""
+		pending = []
+		lastLog = time.monotonic()
+		while not self.__stopping:
+			sockets = dict((sock, index) for index, sock in
+				enumerate(self.__statsSockets) if sock is not None)
+			try:
+				readable, _, _ = select.select(list(sockets), [], [], 0.5)
+			except InterruptedError:
+				readable = []
+			for sock in readable:
+				self.__readStats(sockets[sock])
+
+			pending.extend(self.__reap())
+
+			# Restart exited workers, but not more than once per RESTART_DELAY
+			now = time.monotonic()
+			for index in list(pending):
+				if now - self.__started[index] >= RESTART_DELAY:
+					pending.remove(index)
+					self.restarts += 1
+					self.__spawn(index)
+
+			if now - lastLog >= g_sipconfig['worker_stats_interval']:
+				logger.info("Worker stats: %s", self.stats())
+				lastLog = now
+
+	def stop(self):
+		"""Terminates all workers and waits for them"""
+		self.__stopping = True
+		for pid in self.__pids:
+			if pid is not None:
+				try:
+					os.kill(pid, signal.SIGTERM)
+				except ProcessLookupError:
+					pass
+
+		for index, pid in enumerate(self.__pids):
+			if pid is None:
+				continue
+			try:
+				os.waitpid(pid, 0)
+			except ChildProcessError:
+				pass
+			self.__statsSockets[index].close()
+			self.__statsSockets[index] = None
+			self.__pids[index] = None
+
+		if self.directory is not None:
+			shutil.rmtree(self.directory, ignore_errors=True)
+			self.directory = None